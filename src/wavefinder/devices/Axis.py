@@ -1,4 +1,9 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import numpy as np
 
 
 class Axis(ABC):
@@ -41,6 +46,17 @@ class Axis(ABC):
         """
         pass
 
+    async def sweep(self, position: float, speed: float):
+        """Absolute position move at constant speed, to measure while moving
+
+        Axes which can't set the speed of a move just move normally.
+
+        Args:
+            position: in millimeters or degrees
+            speed: in millimeters or degrees per second
+        """
+        await self.move_absolute(position)
+
     @abstractmethod
     async def stop(self):
         """Stop!"""
@@ -75,3 +91,38 @@ class Axis(ABC):
         Returns: tuple (low, high) of limits as floats
         """
         pass
+
+
+@dataclass(slots=True)
+class MoveResult:
+    """Outcome of one axis move of move_many"""
+
+    target: float  # position, or distance of a relative move
+    duration: float = np.nan  # seconds from start of move_many to end of this move
+    error: bool = False  # True if the axis was in error after the move
+
+
+async def move_many(
+    moves: dict[Axis, float], relative: bool = False
+) -> dict[Axis, MoveResult]:
+    """Move several axes at the same time
+
+    Args:
+        moves: position to move each axis to, or distance if relative
+        relative: True for relative moves
+
+    Returns result of each move
+    """
+    start = time.perf_counter()
+    results = {axis: MoveResult(target) for axis, target in moves.items()}
+
+    async def move(axis: Axis, target: float):
+        if relative:
+            await axis.move_relative(target)
+        else:
+            await axis.move_absolute(target)
+        results[axis].duration = time.perf_counter() - start
+        results[axis].error = axis.status == Axis.ERROR
+
+    await asyncio.gather(*(move(axis, target) for axis, target in moves.items()))
+    return results
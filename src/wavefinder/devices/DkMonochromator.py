@@ -16,16 +16,7 @@ class DkMonochromator(Cyclic):
     STATES = [READY, BUSY, ERROR]
 
     def __init__(self, port: str) -> None:
-        self.port = Serial(
-            baudrate=9600,
-            bytesize=8,
-            parity="N",
-            stopbits=1,
-            timeout=0,  # non-blocking mode
-            rtscts=True,
-            write_timeout=1.0,
-            dsrdtr=True,
-        )
+        self.port = self.make_port()
 
         self.q = SimpleQueue()  # command queue
         self.port.port = port
@@ -47,6 +38,19 @@ class DkMonochromator(Cyclic):
             self.port.close()
             print(e)
 
+    def make_port(self) -> Serial:
+        """Make serial port, not yet opened"""
+        return Serial(
+            baudrate=9600,
+            bytesize=8,
+            parity="N",
+            stopbits=1,
+            timeout=0,  # non-blocking mode
+            rtscts=True,
+            write_timeout=1.0,
+            dsrdtr=True,
+        )
+
     async def read_bytes(self, n: int = 1, timeout: float | None = 5) -> bytes:
         """Read n bytes, async
 
@@ -1,7 +1,12 @@
 import array
+import asyncio
 import os
 import platform
+import queue
 import site
+import struct
+import threading
+from collections.abc import Callable
 
 import numpy as np
 import usb.core
@@ -11,60 +16,285 @@ from ..gui.utils import Cyclic
 
 
 class Frame:
-    def __init__(self, frame: array.array, time: Time) -> None:
+    """Image frame object for Mightex camera
+
+    Wraps the frame data read from the camera without copying it.
+    In 12 bit mode, the image is only unpacked when img_array is first used.
+    """
+
+    # frame properties are the first 32 of the last 512 bytes (little endian),
+    # 14 unsigned shorts and an unsigned int; the rest are reserved, not used
+    PROPERTIES = struct.Struct("<14HI")
+    # attributes which don't refer to the frame data, so a copy can share them
+    SHARED = (
+        "rows",
+        "cols",
+        "bin",
+        "xStart",
+        "yStart",
+        "rGain",
+        "gGain",
+        "bGain",
+        "timestamp",
+        "triggered",
+        "nTriggers",
+        "frameTime",
+        "freq",
+        "expTime",
+        "time",
+        "bits",
+    )
+
+    __slots__ = (
+        "rows",
+        "cols",
+        "bin",
+        "xStart",
+        "yStart",
+        "rGain",
+        "gGain",
+        "bGain",
+        "timestamp",
+        "triggered",
+        "nTriggers",
+        "frameTime",
+        "freq",
+        "expTime",
+        "time",
+        "bits",
+        "display_array",
+        "raw",
+        "img_buffer",
+        "serial",
+        "slot",
+        "_img_array",
+        "__weakref__",
+    )
+
+    def __init__(
+        self,
+        frame: array.array | np.ndarray,
+        time: Time,
+        img_buffer: np.ndarray | None = None,
+    ) -> None:
         """Image frame object for Mightex camera
-        
+
         Args
             frame: frame data
             time: time frame was captured
+            img_buffer: optional (cols, rows) uint16 array to unpack a 12 bit image into,
+                        so that its memory can be reused
         """
-        # store properties (little endian format)
-        frame_prop = frame[-512:] # last 512 bytes
-        self.rows       = frame_prop[0]  + (frame_prop[1]  << 0x8) # number of rows
-        self.cols       = frame_prop[2]  + (frame_prop[3]  << 0x8) # number of columns
-        self.bin        = frame_prop[4]  + (frame_prop[5]  << 0x8) # bin mode
-        self.xStart     = frame_prop[6]  + (frame_prop[7]  << 0x8) # always 0
-        self.yStart     = frame_prop[8]  + (frame_prop[9]  << 0x8) # ROI column start
-        self.rGain      = frame_prop[10] + (frame_prop[11] << 0x8) # red gain
-        self.gGain      = frame_prop[12] + (frame_prop[13] << 0x8) # green/monochrome gain
-        self.bGain      = frame_prop[14] + (frame_prop[15] << 0x8) # blue gain
-        self.timestamp  = frame_prop[16] + (frame_prop[17] << 0x8) # timestamp in ms
-        self.triggered  = frame_prop[18] + (frame_prop[19] << 0x8) # true if triggered
-        self.nTriggers  = frame_prop[20] + (frame_prop[21] << 0x8) # number of trigger events \
-                                                                   # since trigger mode was set
-        # reserved property "UserMark" in this space
-        self.frameTime  = frame_prop[24] + (frame_prop[25] << 0x8) # frame time relates \
-                                                                   # to frames per second
-        self.freq       = frame_prop[26] + (frame_prop[27] << 0x8) # CCD frequency mode
-        self.expTime    = 0.05 * ((frame_prop[28] << 0x00) +       # exposure time in ms
-                                  (frame_prop[29] << 0x08) +
-                                  (frame_prop[30] << 0x16) +
-                                  (frame_prop[31] << 0x24))
-        # last 480 bytes are reserved, not used
+        (
+            self.rows,       # number of rows
+            self.cols,       # number of columns
+            self.bin,        # bin mode
+            self.xStart,     # always 0
+            self.yStart,     # ROI column start
+            self.rGain,      # red gain
+            self.gGain,      # green/monochrome gain
+            self.bGain,      # blue gain
+            self.timestamp,  # timestamp in ms
+            self.triggered,  # true if triggered
+            self.nTriggers,  # number of trigger events since trigger mode was set
+            _,               # reserved property "UserMark"
+            self.frameTime,  # frame time relates to frames per second
+            self.freq,       # CCD frequency mode
+            exp_units,       # exposure time in units of 0.05ms
+        ) = Frame.PROPERTIES.unpack_from(frame, len(frame) - 512)
+        self.expTime = 0.05 * exp_units  # exposure time in ms
 
         self.time = time
-
-        # get image frame data
-        if len(frame) == self.rows*self.cols + 512:
+        self.img_buffer = img_buffer
+        self.serial = -1  # set by FrameBuffer
+        self.slot = -1  # set by FrameBuffer
+        self._img_array: np.ndarray | None = None
+
+        # get image frame data, as a view of the frame buffer
+        nPixels = self.rows * self.cols
+        if len(frame) == nPixels + 512:
             # 8 bit mode
             self.bits = 8
-            unshaped = np.frombuffer(frame[0 : self.rows*self.cols], dtype=np.uint8)
-            self.img_array = np.reshape(unshaped, (self.cols, self.rows))
-            self.display_array = self.img_array
-        elif len(frame) == 2*self.rows*self.cols + 512:
+            self.raw = np.frombuffer(frame, dtype=np.uint8, count=nPixels)
+            self._img_array = self.raw.reshape((self.cols, self.rows))
+            self.display_array = self._img_array
+        elif len(frame) == 2 * nPixels + 512:
             # 12 bit mode
             # PixelData[][][0] contains the 8bit MSB of 12bit pixel data,
             # while the 4 LSB of PixelData[][][1] has the 4bit LSB of the 12bit pixel data.
             self.bits = 12
-            msb = np.frombuffer(frame[0 : 2*self.rows*self.cols : 2], dtype=np.uint8)
-            lsb = np.frombuffer(frame[1 : 2*self.rows*self.cols : 2], dtype=np.uint8)
-            combined = np.array((msb.astype(np.uint16) << 4) + lsb, dtype=np.uint16)
-            self.img_array = np.reshape(combined, (self.cols, self.rows))
-            self.display_array = np.reshape(msb, (self.cols, self.rows))
+            self.raw = np.frombuffer(frame, dtype=np.uint8, count=2 * nPixels)
+            self.display_array = self.raw.reshape((self.cols, self.rows, 2))[:, :, 0]
         else:
             self.bits = 0
             raise BufferError("got bad frame from camera")
 
+    def copy(self) -> "Frame":
+        """Copy of the frame with its own pixel data, which isn't in the frame
+        buffer, so it's never overwritten"""
+        frame = Frame.__new__(Frame)
+        for name in Frame.SHARED:
+            setattr(frame, name, getattr(self, name))
+        frame.raw = self.raw.copy()
+        frame._img_array = self.img_array.copy()
+        if self.bits == 8:
+            frame.display_array = frame._img_array
+        else:
+            frame.display_array = frame.raw.reshape((self.cols, self.rows, 2))[:, :, 0]
+        frame.img_buffer = None
+        frame.serial = -1  # not in a frame buffer
+        frame.slot = -1
+        return frame
+
+    @property
+    def img_array(self) -> np.ndarray:
+        """Image pixels, shape (cols, rows); 12 bit images are unpacked on first use"""
+        if self._img_array is None:
+            self._img_array = Frame.unpack(
+                self.raw, (self.cols, self.rows), self.bits, self.img_buffer
+            )
+        return self._img_array
+
+    @staticmethod
+    def unpack(
+        raw: np.ndarray,
+        shape: tuple[int, int],
+        bits: int,
+        buffer: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Image pixels from raw frame data
+
+        Args:
+            raw: raw frame data, as Frame.raw
+            shape: (cols, rows) shape of image
+            bits: 8 or 12 bit mode
+            buffer: uint16 array to unpack 12 bit images into, if it has this shape
+
+        Returns:
+            view of raw for 8 bit images, or unpacked 12 bit image
+        """
+        if bits == 8:
+            return raw.reshape(shape)
+        pairs = raw.reshape((*shape, 2))
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint16)
+        np.left_shift(pairs[:, :, 0], 4, out=buffer, dtype=np.uint16)
+        np.add(buffer, pairs[:, :, 1], out=buffer)
+        return buffer
+
+
+class FrameBuffer:
+    """Fixed-capacity ring buffer of camera frames
+
+    Frame data is kept in one preallocated array, which is only reallocated
+    when the frame size, resolution, or bit depth changes. Frames handed out
+    are views into this array, valid until the buffer wraps around
+    and the slot is overwritten by a newer frame.
+    """
+
+    def __init__(self, capacity: int = 100) -> None:
+        """Ring buffer of camera frames
+
+        Args:
+            capacity: maximum number of frames kept
+        """
+        self.capacity = max(capacity, 1)
+        self.frame_size = 0
+        self.shape: tuple[int, int] = (0, 0)  # shape of img_array, (cols, rows)
+        self.bits = 0
+        # raw frame data, one row per slot
+        self.data = np.empty((self.capacity, 0), dtype=np.uint8)
+        # unpacked 12 bit images, one per slot
+        self.images = np.empty((self.capacity, 0, 0), dtype=np.uint16)
+        # frame metadata, one per slot
+        self.frames: list[Frame | None] = [None] * self.capacity
+        # serial of the frame whose data is in each slot, or -1 if none
+        self.slot_serials = np.full(self.capacity, -1, dtype=np.int64)
+        self.head = 0  # next slot to write
+        self.count = 0  # number of frames stored
+        self.serial = 0  # number of frames ever pushed
+        self.first_serial = 0  # serial of first frame in current storage
+
+    def __len__(self) -> int:
+        return self.count
+
+    def allocate(self, frame_size: int, resolution: tuple[int, int], bits: int):
+        """Make room for frames of this size, dropping stored frames if it changed
+
+        Args:
+            frame_size: bytes per frame, including properties
+            resolution: tuple[rows, columns]
+            bits: 8 or 12
+        """
+        shape = (resolution[1], resolution[0])
+        if (frame_size, shape, bits) == (self.frame_size, self.shape, self.bits):
+            return
+        self.frame_size = frame_size
+        self.shape = shape
+        self.bits = bits
+        self.data = np.empty((self.capacity, frame_size), dtype=np.uint8)
+        if bits == 12:
+            self.images = np.empty((self.capacity, *shape), dtype=np.uint16)
+        else:
+            self.images = np.empty((self.capacity, 0, 0), dtype=np.uint16)
+        self.slot_serials[:] = -1
+        self.first_serial = self.serial
+        self.clear()
+
+    def push(self, data: array.array | np.ndarray, time: Time) -> Frame:
+        """Copy a frame into the buffer, overwriting the oldest if full
+
+        Args:
+            data: frame data read from camera, no longer than frame_size
+            time: time frame was captured
+
+        Returns the new frame; raises BufferError if data isn't a good frame
+        """
+        slot = self.data[self.head, : len(data)]
+        slot[:] = np.frombuffer(data, dtype=np.uint8)
+        img_buffer = self.images[self.head] if self.bits == 12 else None
+        try:
+            frame = Frame(slot, time, img_buffer)
+        except BufferError:
+            # the frame in this slot was overwritten
+            self.slot_serials[self.head] = -1
+            if self.frames[self.head]:
+                self.frames[self.head] = None
+                self.count -= 1
+            raise
+        frame.serial = self.serial
+        frame.slot = self.head
+        self.slot_serials[self.head] = frame.serial
+        self.serial += 1
+        self.frames[self.head] = frame
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        return frame
+
+    def newest(self, nFrames: int = 1) -> list[Frame]:
+        """Get most recent nFrames frames, from newest to oldest"""
+        nFrames = min(max(nFrames, 1), self.count)
+        return [
+            self.frames[(self.head - 1 - i) % self.capacity]  # type: ignore
+            for i in range(nFrames)
+        ]
+
+    def holds(self, frame: Frame) -> bool:
+        """True unless the frame's data has been overwritten by a newer frame"""
+        if frame.serial < self.first_serial:
+            # storage has been reallocated since, so the old data is intact
+            return True
+        return self.slot_serials[frame.slot] == frame.serial
+
+    def clear(self):
+        """Drop all frames
+
+        The head isn't rewound, so frames already handed out keep their data
+        until the buffer wraps around, as if they were still stored.
+        """
+        self.frames = [None] * self.capacity
+        self.count = 0
+
 
 class Camera(Cyclic):
     """Interface for Mightex Buffer USB CMOS Camera
@@ -98,6 +328,7 @@ class Camera(Cyclic):
         exposure_time: float = 50,
         fps: float = 10,
         gain: int = 15,
+        acquisition_thread: bool = True,
     ) -> None:
         """Mightex Buffer USB CMOS Camera
 
@@ -111,6 +342,8 @@ class Camera(Cyclic):
             exposure_time: exposure time in milliseconds, in increments of 0.05ms
             fps: NORMAL mode target frames per second
             gain: 6 to 41 dB, inclusive, see function set_gain
+            acquisition_thread: if True, a background thread owns the USB device,
+                                otherwise USB reads and writes block the event loop
         """
 
         # flag to run extra initialization on first async loop
@@ -132,10 +365,33 @@ class Camera(Cyclic):
         self.serialno: str = ""
 
         # data structures
-        self.frame_buffer: list[Frame] = []
         self.buffer_max = 100  # max 100 frames
+        self.frame_buffer = FrameBuffer(self.buffer_max)
+        self.usb_buffer = array.array("B")  # reused for reading frames
+        self.frame_timeout = 1000  # USB timeout for reading one frame, in ms
+        self.buffer_lock = threading.Lock()  # guards frame_buffer
+        self.frame_count = 0  # number of frames acquired, counted on the event loop
+        self.frame_event = asyncio.Event()  # set and cleared when frames arrive
         self.last_trigger_time: Time = Time.now()
 
+        # acquisition thread
+        self.use_thread = acquisition_thread
+        self.thread: threading.Thread | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.commands: queue.Queue[tuple[Callable, tuple, asyncio.Future]] = queue.Queue()
+        self.acquiring = threading.Event()  # set once camera is configured
+        self.stop_event = threading.Event()
+        self.poll_interval = 0.005  # seconds to wait for commands when camera is empty
+
+        self.dev = self.find_device()
+        self.establish_connection()
+        print("connected.")
+
+    def find_device(self) -> usb.core.Device:
+        """Find USB camera and set USB configuration
+
+        Raises ValueError if not found.
+        """
         print("Connecting to Mightex camera... ", end="", flush=True)
 
         # For Windows, load libusb-1.0.dll by adding it to the PATH,
@@ -147,16 +403,13 @@ class Camera(Cyclic):
                 + "\\libusb\\_platform\\_windows\\x64"
             )
 
-        # find USB camera and set USB configuration
-        self.dev: usb.core.Device = usb.core.find(
+        dev: usb.core.Device = usb.core.find(
             idVendor=0x04B4, idProduct=0x0528
         )  # type: ignore
-        if self.dev is None:
+        if dev is None:
             raise ValueError("not found.")
-        self.dev.set_configuration()  # type: ignore
-
-        self.establish_connection()
-        print("connected.")
+        dev.set_configuration()  # type: ignore
+        return dev
 
     def establish_connection(self):
         """Write to and read from the camera until connection is established
@@ -171,17 +424,103 @@ class Camera(Cyclic):
             except usb.core.USBTimeoutError:
                 continue
 
+    def start_thread(self) -> None:
+        """Start the acquisition thread, if it isn't running
+
+        Must be called from within the running event loop.
+        """
+        if self.thread is None:
+            self.loop = asyncio.get_running_loop()
+            self.thread = threading.Thread(
+                target=self.acquisition_loop, name="camera", daemon=True
+            )
+            self.thread.start()
+
+    def acquisition_loop(self) -> None:
+        """Acquisition thread: owns the USB device
+
+        Runs queued commands first, and otherwise drains the camera buffer,
+        requesting all of its frames in one command.
+        """
+        nFrames = 0  # frames left in camera buffer
+        while not self.stop_event.is_set():
+            try:
+                # only wait for a command while the camera has no frames
+                command = self.commands.get(
+                    block=nFrames == 0, timeout=self.poll_interval
+                )
+            except queue.Empty:
+                pass
+            else:
+                self.run_command(*command)
+                continue
+            if self.acquiring.is_set():
+                try:
+                    nFrames = self.download_frames()
+                except (usb.core.USBError, RuntimeError) as e:
+                    print(f"Camera acquisition error: {e}")
+                    nFrames = 0
+
+    def run_command(self, func: Callable, args: tuple, future: asyncio.Future):
+        """Run a queued command on the acquisition thread, and resolve its future"""
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.call_on_loop(set_future, future, None, e)
+        else:
+            self.call_on_loop(set_future, future, result, None)
+
+    def call_on_loop(self, func: Callable, *args):
+        """Call func(*args) on the event loop, from any thread"""
+        if self.thread is None or self.loop is None:
+            func(*args)
+            return
+        try:
+            self.loop.call_soon_threadsafe(func, *args)
+        except RuntimeError:
+            pass  # loop is closed
+
+    async def usb_call(self, func: Callable, *args):
+        """Run a blocking USB function, on the acquisition thread if there is one
+
+        Args:
+            func: function which uses the USB device
+            args: arguments to func
+
+        Returns the result of func
+        """
+        if not self.use_thread:
+            return func(*args)
+        self.start_thread()
+        future = asyncio.get_running_loop().create_future()
+        self.commands.put((func, args, future))
+        return await future
+
+    async def write(self, data: list[int]) -> None:
+        """Write a command to the camera"""
+        await self.usb_call(self.dev.write, 0x01, data)
+
+    def request(self, data: list[int]) -> array.array:
+        """Write a command to the camera and read its reply
+
+        Not async, will block; use with usb_call.
+        """
+        self.dev.write(0x01, data)
+        return self.read_reply()
+
     async def reset(self) -> None:
         """Reset the camera; not recommended for normal use."""
-        self.dev.write(0x01, [0x50, 1, 0x01])
+        await self.write([0x50, 1, 0x01])
 
-    async def read_reply(self) -> array.array:
+    def read_reply(self) -> array.array:
         """Read reply from camera, check that it's good,
         and return data as an array.
 
         The first byte is supposed to return 0x01 for "ok,"
         but the 0x33 command returns 0x08 for "ok,"
         so we're just checking for non-zero replies.
+
+        Not async, will block.
         """
         reply = self.dev.read(0x81, 0xFF)
         if not (reply[0] > 0x00 and len(reply[2:]) == reply[1]):
@@ -193,16 +532,14 @@ class Camera(Cyclic):
         """Get camera firmware version as
         [Major, Minor, Revision].
         """
-        self.dev.write(0x01, [0x01, 1, 0x01])
-        return list(await self.read_reply())
+        return list(await self.usb_call(self.request, [0x01, 1, 0x01]))
 
     async def get_camera_info(self) -> dict[str, str]:
         """Get camera information.
 
         returns a dict with keys "ConfigRev", "ModuleNo", "SerialNo", "MftrDate"
         """
-        self.dev.write(0x01, [0x21, 1, 0x00])
-        reply = await self.read_reply()
+        reply = await self.usb_call(self.request, [0x21, 1, 0x00])
         info: dict[str, str] = {}
         info["ConfigRv"] = str(int(reply[0]))                               # configuration version
         info["ModuleNo"] = reply[1:15].tobytes().decode().strip('\0 \t')    # camera model
@@ -233,7 +570,7 @@ class Camera(Cyclic):
         self.run_mode = run_mode if run_mode in Camera.RUN_MODES else self.run_mode
         self.bits = bits if bits in [8, 12] else self.bits
         if write_now:
-            self.dev.write(0x01, [0x30, 2, self.run_mode, self.bits])
+            await self.write([0x30, 2, self.run_mode, self.bits])
 
     async def set_frequency(self, freq_mode: int = 0, write_now: bool = False) -> None:
         """Set CCD frequency divider.
@@ -245,7 +582,7 @@ class Camera(Cyclic):
         """
         self.freq_mode = freq_mode if freq_mode in range(0, 5) else 0
         if write_now:
-            self.dev.write(0x01, [0x32, 1, self.freq_mode])
+            await self.write([0x32, 1, self.freq_mode])
 
     async def set_resolution(
         self,
@@ -273,7 +610,7 @@ class Camera(Cyclic):
         self.nBuffer    = min(max(nBuffer, 1), 24)
         if write_now:
             # last parameter "buffer option" should always be zero
-            self.dev.write(0x01, [0x60, 7,
+            await self.write([0x60, 7,
                                   self.resolution[0] >> 8, self.resolution[0] & 0xff,
                                   self.resolution[1] >> 8, self.resolution[1] & 0xff,
                                   self.bin_mode, self.nBuffer, 0])
@@ -291,7 +628,7 @@ class Camera(Cyclic):
         self.exposure_time = min(max(exposure_time, 0.05), 200000)
         if write_now:
             set_val = int(self.exposure_time / 0.05)
-            self.dev.write(0x01, [0x63, 4,
+            await self.write([0x63, 4,
                                   (set_val >> 24),
                                   (set_val >> 16) & 0xff,
                                   (set_val >>  8) & 0xff,
@@ -311,7 +648,7 @@ class Camera(Cyclic):
         if write_now:
             frame_time = 1 / self.fps
             set_val = int(frame_time * 10000)
-            self.dev.write(0x01, [0x64, 2, set_val >> 8, set_val & 0xFF])
+            await self.write([0x64, 2, set_val >> 8, set_val & 0xFF])
 
     async def set_gain(self, gain: int = 15, write_now: bool = False) -> None:
         """Set camera gain.
@@ -329,7 +666,7 @@ class Camera(Cyclic):
         """
         self.gain = min(max(gain, 6), 41)
         if write_now:
-            self.dev.write(0x01, [0x62, 3, self.gain, self.gain, self.gain])
+            await self.write([0x62, 3, self.gain, self.gain, self.gain])
 
     async def write_configuration(self) -> None:
         """Write all configuration settings to camera."""
@@ -347,8 +684,17 @@ class Camera(Cyclic):
 
         Only works in TRIGGER mode.
         """
+        self.last_trigger_time = await self.usb_call(self.send_trigger)
+
+    def send_trigger(self) -> Time:
+        """Simulate a trigger, see trigger
+
+        Not async, will block.
+
+        Returns time of trigger
+        """
         self.dev.write(0x01, [0x36, 1, 0x00])
-        self.last_trigger_time = Time.now()
+        return Time.now()
 
     async def query_buffer(self) -> dict[str, int | tuple[int, int]]:
         """Query camera's buffer for number of available frames
@@ -356,8 +702,14 @@ class Camera(Cyclic):
 
         returns dict with keys "nFrames", "resolution", "bin_mode"
         """
-        self.dev.write(0x01, [0x33, 1, 0x00])
-        reply = await self.read_reply()
+        return await self.usb_call(self.read_buffer_info)
+
+    def read_buffer_info(self) -> dict[str, int | tuple[int, int]]:
+        """Query camera's buffer, see query_buffer
+
+        Not async, will block.
+        """
+        reply = self.request([0x33, 1, 0x00])
         buffer_info: dict[str, int | tuple[int, int]] = {}
         buffer_info["nFrames"] = reply[0]
         buffer_info["resolution"] = (
@@ -369,9 +721,17 @@ class Camera(Cyclic):
 
     async def clear_buffer(self, fut=None) -> None:
         """Clear camera and application buffer."""
-        nFrames = (await self.query_buffer())["nFrames"]
+        await self.usb_call(self.clear_frames)
+
+    def clear_frames(self) -> None:
+        """Clear camera and application buffer, see clear_buffer
+
+        Not async, will block.
+        """
+        nFrames = self.read_buffer_info()["nFrames"]
         self.dev.write(0x01, [0x35, 1, nFrames])
-        self.frame_buffer.clear()
+        with self.buffer_lock:
+            self.frame_buffer.clear()
 
     async def acquire_frames(self) -> None:
         """Aquire camera image frames.
@@ -379,53 +739,133 @@ class Camera(Cyclic):
         Downloads all available frames from the camera buffer and puts them
         in the application buffer.
         """
+        await self.usb_call(self.download_frames)
+
+    def download_frames(self, max_frames: int | None = None) -> int:
+        """Download frames from the camera buffer into the application buffer
+
+        Not async, will block.
+
+        Args:
+            max_frames: maximum number of frames to download, or None for all
+
+        Returns number of frames left in camera buffer
+        """
         # get frame buffer information
-        buffer_info = await self.query_buffer()
+        buffer_info = self.read_buffer_info()
         nFrames: int = buffer_info["nFrames"]  # type: ignore
         resolution: tuple[int, int] = buffer_info["resolution"]  # type: ignore
 
         if nFrames == self.nBuffer:
             print("camera buffer full")
 
-        while nFrames > 0:
-            # tell camera to send one frame
-            self.dev.write(0x01, [0x34, 1, 1])
-
-            # determine frame data size, padded to 512 byte alignment
-            nPixels = resolution[0] * resolution[1]
-            bytes_per_px = 1 if self.bits == 8 else 2
-            padding = (bytes_per_px * nPixels) % 512
-            # the last 512 bytes are the frame properties
-            frame_size = nPixels * bytes_per_px + padding + 512
-
-            # read one frame and insert into app buffer
+        # determine frame data size, padded to 512 byte alignment
+        nPixels = resolution[0] * resolution[1]
+        bytes_per_px = 1 if self.bits == 8 else 2
+        padding = (bytes_per_px * nPixels) % 512
+        # the last 512 bytes are the frame properties
+        frame_size = nPixels * bytes_per_px + padding + 512
+        with self.buffer_lock:
+            self.frame_buffer.allocate(frame_size, resolution, self.bits)
+        if len(self.usb_buffer) != frame_size:
+            self.usb_buffer = array.array("B", bytes(frame_size))
+
+        nDownload = nFrames if max_frames is None else min(nFrames, max_frames)
+        if nDownload == 0:
+            return nFrames
+
+        # tell camera to send all frames at once, in one command,
+        # then read each into the app buffer with one frame-sized transfer;
+        # every requested frame must be read, to keep the transfers aligned
+        self.dev.write(0x01, [0x34, 1, nDownload])
+        for i in range(nDownload):
             try:
-                data = self.dev.read(0x82, frame_size)
+                nBytes = self.dev.read(
+                    0x82, self.usb_buffer, timeout=self.frame_timeout
+                )
                 nFrames -= 1
             except usb.core.USBTimeoutError:
+                # the rest may still come, and would be taken for later frames
+                nFrames -= self.drain_frames(nDownload - i)
                 break
             try:
                 # TODO: use recorded time from trigger in trigger mode
-                frame = Frame(data, Time.now())
+                with self.buffer_lock:
+                    self.frame_buffer.push(
+                        memoryview(self.usb_buffer)[:nBytes], Time.now()
+                    )
             except BufferError:
-                break
-            self.frame_buffer.insert(0, frame)
+                continue
+            # let waiters have each frame as soon as it's in
+            self.call_on_loop(self.frames_arrived, 1)
+
+        return nFrames
+
+    def drain_frames(self, nFrames: int) -> int:
+        """Read and discard frames which were requested but not read
+
+        If one doesn't come, the endpoint is reset, so the rest aren't sent.
+        Not async, will block.
+
+        Args:
+            nFrames: number of frames requested but not read
 
-        # trim buffer
-        while len(self.frame_buffer) > self.buffer_max:
-            self.frame_buffer.pop()
+        Returns number of frames read
+        """
+        for i in range(nFrames):
+            try:
+                self.dev.read(0x82, self.usb_buffer, timeout=self.frame_timeout)
+            except usb.core.USBTimeoutError:
+                self.dev.clear_halt(0x82)
+                return i
+        return nFrames
+
+    def frames_arrived(self, nFrames: int) -> None:
+        """Called on the event loop when new frames are in the app buffer"""
+        self.frame_count += nFrames
+        # wake up everything waiting for a frame
+        self.frame_event.set()
+        self.frame_event.clear()
+
+    async def wait_for_frame(
+        self, after: Time | None = None, timeout: float | None = None
+    ) -> Frame:
+        """Wait for a frame captured after the given time
+
+        Args:
+            after: time the frame must be captured after, e.g. last_trigger_time;
+                   if None, wait for the next new frame
+            timeout: seconds to wait, or None to wait forever
+
+        Returns newest frame; raises TimeoutError if no frame arrives in time
+        """
+        if after is None:
+            after = Time.now()
+        async with asyncio.timeout(timeout):
+            while True:
+                try:
+                    frame = self.get_newest_frame()
+                    if frame.time > after:
+                        return frame
+                except IndexError:
+                    pass
+                await self.frame_event.wait()
 
     def get_frames(self, nFrames: int = 1) -> list[Frame]:
-        """Get most recent nFrames frames, from newest to oldest"""
-        nFrames = min(max(nFrames, 1), len(self.frame_buffer))
-        return self.frame_buffer[0:nFrames]
+        """Get most recent nFrames frames, from newest to oldest
+
+        Frames are views into the app buffer, overwritten after buffer_max newer frames.
+        """
+        with self.buffer_lock:
+            return self.frame_buffer.newest(nFrames)
 
     def get_newest_frame(self) -> Frame:
         """Get most recent frame."""
-        if len(self.frame_buffer) > 0:
-            return self.frame_buffer[0]
-        else:
-            raise IndexError("no frames in app buffer")
+        with self.buffer_lock:
+            if len(self.frame_buffer) > 0:
+                return self.frame_buffer.newest()[0]
+            else:
+                raise IndexError("no frames in app buffer")
 
     async def update(self):
         """Update application with new data from camera"""
@@ -434,11 +874,26 @@ class Camera(Cyclic):
             await self.write_configuration()
             print("OK.")
             self.extra_init = False
-        await self.acquire_frames()
+            if self.use_thread:
+                self.start_thread()
+                self.acquiring.set()
+        if not self.use_thread:
+            await self.acquire_frames()
 
     def close(self):
         """Close connection to camera
 
-        Don't need to do anything.
+        Stops the acquisition thread, if there is one.
         """
-        pass
+        if self.thread:
+            self.stop_event.set()
+            self.thread.join(timeout=1.0)
+
+
+def set_future(future: asyncio.Future, result, exception: Exception | None):
+    """Resolve future with result or exception, unless it's already done"""
+    if not future.done():
+        if exception:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
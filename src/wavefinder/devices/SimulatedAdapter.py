@@ -0,0 +1,35 @@
+from ..gui.utils import Cyclic
+from .SimulatedAxis import SimulatedAxis
+
+
+class SimulatedAdapter(Cyclic):
+    """Adapter for simulated axes, standing in for the Zaber or Galil adapter"""
+
+    def __init__(self, label: str, axis_names: dict[str, dict], **axis_args) -> None:
+        """Set up adapter with one simulated axis per name
+
+        Args:
+            label: name of the hardware being simulated, e.g. "Zaber"
+            axis_names: mapping of name to axis information, which must include keyword
+                e.g. {"detector x": {"sn": 33938, "keyword": "detxpos"}}
+            axis_args: SimulatedAxis arguments, e.g. units, speed, accel
+        """
+        self.label = label
+        self.axis_names = axis_names
+        self.axes: dict[str, SimulatedAxis] = {}
+
+        print(f"Simulating {label} devices... ", end="", flush=True)
+        for name in self.axis_names.keys():
+            kw = str(self.axis_names[name]["keyword"])
+            self.axes[name] = SimulatedAxis(name, kw, **axis_args)
+        print(f"{len(self.axes)} axes.")
+
+    async def update(self):
+        """Update all devices on this adapter"""
+        for a in self.axes.values():
+            await a.update_position()
+            await a.update_status()
+
+    def close(self):
+        """Close adapter"""
+        pass
@@ -0,0 +1,242 @@
+import asyncio
+import time
+
+import numpy as np
+
+from .Axis import Axis
+
+
+class SimulatedAxis(Axis):
+    # Simulated implementation of Axis superclass
+    # See Axis for abstract function descriptions.
+
+    def __init__(
+        self,
+        name: str,
+        keyword: str,
+        units: tuple[str, str] = ("mm", "millimeters"),
+        speed: float = 10.0,
+        accel: float = 100.0,
+        decel: float = 100.0,
+        homing_speed: float = 1.0,
+        settle_time: float = 0.05,
+        limits: tuple[float, float] = (-25.0, 25.0),
+        position_error: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        """Simulated motion control axis
+
+        Moves follow a trapezoidal velocity profile and take as long as they would
+        on the stage, followed by a settle time. Moves outside the limits are
+        rejected with an error, as the controllers do.
+
+        Args:
+            name: human-readable name of axis
+            keyword: FITS keyword
+            units: (short, long) name of units
+            speed: move speed in units per second
+            accel: acceleration in units per second squared
+            decel: deceleration in units per second squared
+            homing_speed: speed of final approach to home, in units per second
+            settle_time: time to wait after motion stops, in seconds
+            limits: (low, high) movement limits
+            position_error: standard deviation of open-loop position error after
+                            a move, as with the Galil steppers; absolute moves correct
+                            it the same way GalilAxis does
+            seed: random seed for position error
+        """
+        super().__init__(name, keyword)
+        self.units = units
+        self.speed = speed
+        self.accel = accel
+        self.decel = decel
+        self.hspeed = homing_speed
+        self.settle_time = settle_time
+        self.limits = limits
+        self.position_error = position_error
+        self.rng = np.random.default_rng(seed)
+        self.status = Axis.READY
+
+        # current move: start time, start and end position, duration
+        self.move_start = 0.0
+        self.move_from = 0.0
+        self.move_to = 0.0
+        self.move_speed = speed
+        self.move_duration = 0.0
+        self.stop_event = asyncio.Event()
+
+        # totals, for benchmarking
+        self.n_moves = 0
+        self.n_corrections = 0
+        self.move_time = 0.0
+
+    def move_time_for(self, distance: float, speed: float | None = None) -> float:
+        """Duration of a move with a trapezoidal velocity profile
+
+        Args:
+            distance: move distance
+            speed: move speed, or None for normal speed
+
+        Returns time in seconds, not including settle time
+        """
+        speed = speed or self.speed
+        d = abs(distance)
+        v_peak = self.peak_speed(d, speed)
+        if v_peak == 0:
+            return 0.0
+        d_ramps = v_peak**2 / (2 * self.accel) + v_peak**2 / (2 * self.decel)
+        return v_peak / self.accel + v_peak / self.decel + (d - d_ramps) / v_peak
+
+    def peak_speed(self, distance: float, speed: float) -> float:
+        """Top speed reached in a move, lower than speed for a triangular profile"""
+        v_triangle = np.sqrt(
+            2 * distance * self.accel * self.decel / (self.accel + self.decel)
+        )
+        return float(min(speed, v_triangle))
+
+    def actual_position(self, at: float | None = None) -> float:
+        """Where the stage is now, part way through the current move
+
+        Args:
+            at: time.monotonic() time to give the position at, instead of now;
+                times before the current move give its start position
+        """
+        t = (time.monotonic() if at is None else at) - self.move_start
+        if t <= 0:
+            return self.move_from
+        if t >= self.move_duration:
+            return self.move_to
+        d = abs(self.move_to - self.move_from)
+        direction = np.sign(self.move_to - self.move_from)
+        v_peak = self.peak_speed(d, self.move_speed)
+        t_accel = v_peak / self.accel
+        if t < t_accel:
+            s = 0.5 * self.accel * t**2
+        elif t < self.move_duration - v_peak / self.decel:
+            s = 0.5 * self.accel * t_accel**2 + v_peak * (t - t_accel)
+        else:
+            s = d - 0.5 * self.decel * (self.move_duration - t) ** 2
+        return float(self.move_from + direction * s)
+
+    async def run_move(self, target: float, speed: float | None = None) -> bool:
+        """Move to target and wait for the move to finish and settle
+
+        Args:
+            target: position to move to
+            speed: move speed, or None for normal speed
+
+        Returns True if move completed, False if stopped or rejected
+        """
+        if not self.limits[0] <= target <= self.limits[1]:
+            print(f"Error on axis {self.name}: {target} is outside limits {self.limits}")
+            self.status = Axis.ERROR
+            return False
+        self.move_from = self.actual_position()
+        self.move_to = target
+        self.move_speed = speed or self.speed
+        self.move_duration = self.move_time_for(target - self.move_from, speed)
+        self.move_start = time.monotonic()
+        self.stop_event.clear()
+        self.n_moves += 1
+        self.move_time += self.move_duration
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), self.move_duration)
+        except TimeoutError:
+            pass
+        else:
+            return False
+        # stabilize
+        await asyncio.sleep(self.settle_time)
+        return True
+
+    def add_position_error(self, scale: float = 1.0):
+        """Leave the stage short of or past where it was told to go"""
+        if self.position_error > 0:
+            self.move_to += float(self.rng.normal(0, self.position_error * scale))
+
+    async def home(self):
+        self.status = Axis.MOVING
+        # fast move near home, then slow approach
+        home = min(max(0.0, self.limits[0]), self.limits[1])
+        approach = min(1.0, home - self.limits[0])
+        if await self.run_move(home - approach) and await self.run_move(
+            home, self.hspeed
+        ):
+            self.move_to = home
+            self.is_homed = True
+        await self.update_position()
+        if self.status != Axis.ERROR:
+            self.status = Axis.BUSY
+        await self.update_status()
+
+    async def move_relative(self, distance: float):
+        self.status = Axis.MOVING
+        if await self.run_move(self.actual_position() + distance):
+            self.add_position_error()
+        await self.update_position()
+        if self.status != Axis.ERROR:
+            self.status = Axis.BUSY
+        await self.update_status()
+
+    async def move_absolute(self, position: float):
+        self.status = Axis.MOVING
+        if await self.run_move(position):
+            self.add_position_error()
+            await self.update_position()
+            # correct open-loop error at homing speed, like GalilAxis
+            while round(self.position, 3) != round(position, 3):
+                self.n_corrections += 1
+                error = self.position - position
+                if not await self.run_move(position, self.hspeed):
+                    break
+                # each correction leaves a smaller error, until it's negligible
+                if abs(error) > 1e-3:
+                    self.add_position_error(0.1)
+                await self.update_position()
+        await self.update_position()
+        if self.status != Axis.ERROR:
+            self.status = Axis.BUSY
+        await self.update_status()
+
+    async def sweep(self, position: float, speed: float):
+        self.status = Axis.MOVING
+        await self.run_move(position, speed)
+        await self.update_position()
+        if self.status != Axis.ERROR:
+            self.status = Axis.BUSY
+        await self.update_status()
+
+    async def stop(self):
+        self.move_to = self.actual_position()
+        self.move_duration = 0.0
+        self.stop_event.set()
+        await self.update_position()
+        await self.update_status()
+
+    async def update_position(self) -> float:
+        self.position = self.actual_position()
+        return self.position
+
+    async def update_status(self) -> int:
+        if self.status == Axis.ERROR:
+            # latch errors until cleared by a good move
+            self.status = Axis.ERROR
+        elif self.status == Axis.MOVING:
+            # leave MOVING until the move is done
+            self.status = Axis.MOVING
+        elif time.monotonic() - self.move_start < self.move_duration:
+            self.status = Axis.BUSY
+        else:
+            self.status = Axis.READY
+        return self.status
+
+    async def set_limits(
+        self, low_limit: float | None = None, high_limit: float | None = None
+    ):
+        self.limits = (
+            low_limit if low_limit is not None else self.limits[0],
+            high_limit if high_limit is not None else self.limits[1],
+        )
+
+    async def get_limits(self) -> tuple[float, float]:
+        return self.limits
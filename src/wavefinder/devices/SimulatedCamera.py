@@ -0,0 +1,388 @@
+import array
+import struct
+import time
+from collections import deque
+from functools import lru_cache
+
+import numpy as np
+import usb.core
+
+from .Axis import Axis
+from .DkMonochromator import DkMonochromator
+from .MightexBufCmos import Camera
+from .SimulatedAxis import SimulatedAxis
+
+
+class PsfModel:
+    """Point spread function seen by the simulated camera
+
+    The spot is centered on the detector when the x and y axes are at the spot position.
+    Its width grows linearly with distance from best focus, and best focus moves with
+    wavelength. The peak height is kept constant, so defocused spots stay above
+    the image threshold.
+    """
+
+    def __init__(
+        self,
+        axes: dict[str, Axis],
+        monochromator: DkMonochromator | None,
+        axis_names: tuple[str, str, str] = ("detector x", "detector y", "detector z"),
+        pixel_size: tuple[float, float] = (3.75, 3.75),
+        spot: tuple[float, float] = (0.0, 0.0),
+        focus_z: float = 9.0,
+        wavelength: float = 500.0,
+        focus_slope: float = 0.0,
+        sigma: float = 1.5,
+        defocus: float = 10.0,
+        peak: float = 0.8,
+        background: float = 0.02,
+        noise: float = 0.01,
+        seed: int | None = None,
+    ) -> None:
+        """Point spread function seen by the simulated camera
+
+        Args:
+            axes: dict of motion axes, which may be filled in later
+            monochromator: monochromator giving the wavelength, or None
+            axis_names: names of (x, y, z) axes
+            pixel_size: (x, y) size of camera pixels in microns
+            spot: (x, y) axis position in mm which centers the spot
+            focus_z: z axis position in mm of best focus, at the reference wavelength
+            wavelength: reference wavelength in nm, used if monochromator has none
+            focus_slope: change of best focus with wavelength, in mm / nm
+            sigma: spot sigma in pixels at best focus, at the reference wavelength
+            defocus: increase of spot sigma in pixels per mm from best focus
+            peak: spot peak above background, as a fraction of full scale
+            background: background level, as a fraction of full scale
+            noise: standard deviation of gaussian noise, as a fraction of full scale
+            seed: random seed for noise
+        """
+        self.axes = axes
+        self.monochromator = monochromator
+        self.axis_names = axis_names
+        self.pixel_size = pixel_size
+        self.spot = spot
+        self.focus_z = focus_z
+        self.wavelength = wavelength
+        self.focus_slope = focus_slope
+        self.sigma = sigma
+        self.defocus = defocus
+        self.peak = peak
+        self.background = background
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        # a few noise fields, made once per image shape and reused
+        self.noise_bank = np.empty((0, 0, 0), dtype=np.float32)
+
+    def state(self, at: float | None = None) -> tuple[float, float, float, float]:
+        """Snapshot of (x, y, z, wavelength) which determine the image
+
+        Missing axes are treated as being at the spot or focus position.
+
+        Args:
+            at: time.monotonic() time of the exposure, so simulated axes give
+                where they were then, even while moving; None for now
+        """
+        x_axis, y_axis, z_axis = (self.axes.get(n) for n in self.axis_names)
+        wavelength = self.wavelength
+        if self.monochromator and self.monochromator.current_wavelength > 0:
+            wavelength = self.monochromator.current_wavelength
+        return (
+            self.position(x_axis, self.spot[0], at),
+            self.position(y_axis, self.spot[1], at),
+            self.position(z_axis, self.best_focus(wavelength), at),
+            wavelength,
+        )
+
+    def position(self, axis: Axis | None, default: float, at: float | None) -> float:
+        """Position of an axis at a time, or default if there's no axis"""
+        if axis is None:
+            return default
+        if at is not None and isinstance(axis, SimulatedAxis):
+            return axis.actual_position(at)
+        return axis.position
+
+    def best_focus(self, wavelength: float) -> float:
+        """z axis position of best focus at wavelength, in mm"""
+        return self.focus_z + self.focus_slope * (wavelength - self.wavelength)
+
+    def spot_geometry(
+        self, shape: tuple[int, int], state: tuple[float, float, float, float]
+    ) -> tuple[float, float, float]:
+        """Spot center and width on the detector
+
+        Args:
+            shape: image shape (height, width)
+            state: (x, y, z, wavelength) from state()
+
+        Returns (x, y, sigma) in pixels
+        """
+        x, y, z, wavelength = state
+        # moving the x axis up moves the spot left; y is mirrored
+        cx = shape[1] / 2 - (x - self.spot[0]) * 1000 / self.pixel_size[0]
+        cy = shape[0] / 2 + (y - self.spot[1]) * 1000 / self.pixel_size[1]
+        sigma0 = self.sigma * wavelength / self.wavelength
+        sigma = float(np.hypot(sigma0, self.defocus * (z - self.best_focus(wavelength))))
+        return cx, cy, sigma
+
+    def render(
+        self, shape: tuple[int, int], state: tuple[float, float, float, float], bits: int
+    ) -> np.ndarray:
+        """Render a noisy image of the spot
+
+        Args:
+            shape: image shape (height, width)
+            state: (x, y, z, wavelength) from state()
+            bits: 8 or 12, sets full scale
+
+        Returns uint16 image, 12 bit full scale; 8 bit images are scaled by the camera
+        """
+        full_scale = 4095
+        cx, cy, sigma = self.spot_geometry(shape, state)
+        img = render_spot(
+            shape,
+            round(cx, 2),
+            round(cy, 2),
+            round(sigma, 2),
+            self.peak * full_scale,
+            self.background * full_scale,
+        )
+        if self.noise > 0:
+            if self.noise_bank.shape[1:] != shape:
+                self.noise_bank = (
+                    self.rng.standard_normal((4, *shape), dtype=np.float32)
+                    * self.noise
+                    * full_scale
+                )
+            img = img + self.noise_bank[self.rng.integers(len(self.noise_bank))]
+        return np.clip(img, 0, full_scale).astype(np.uint16)
+
+
+@lru_cache(maxsize=16)
+def render_spot(
+    shape: tuple[int, int],
+    cx: float,
+    cy: float,
+    sigma: float,
+    peak: float,
+    background: float,
+) -> np.ndarray:
+    """Noiseless gaussian spot on a flat background, cached
+
+    Built as the outer product of 1-D gaussians, since the spot is separable.
+
+    Args:
+        shape: image shape (height, width)
+        cx, cy: spot center in pixels
+        sigma: spot sigma in pixels
+        peak: spot peak above background
+        background: background level
+
+    Returns read-only float32 image
+    """
+    sigma = max(sigma, 1e-3)
+    gx = np.exp(-0.5 * ((np.arange(shape[1]) - cx) / sigma) ** 2).astype(np.float32)
+    gy = np.exp(-0.5 * ((np.arange(shape[0]) - cy) / sigma) ** 2).astype(np.float32)
+    img = np.outer(gy * peak, gx)
+    img += background
+    img.flags.writeable = False
+    return img
+
+
+class SimulatedDevice:
+    """Stands in for the Mightex USB device
+
+    Answers the commands Camera uses, from "Mightex Buffer USB Camera USB Protocol",
+    with frames rendered by a PsfModel. In NORMAL mode frames are captured at the
+    frame rate; in TRIGGER mode, one frame is captured per trigger, after the exposure.
+    Frame reads take as long as the transfer would over USB.
+    """
+
+    def __init__(self, psf: PsfModel, usb_rate: float = 40e6) -> None:
+        """Simulated Mightex USB device
+
+        Args:
+            psf: model of the image on the detector
+            usb_rate: frame transfer rate in bytes per second
+        """
+        self.psf = psf
+        self.usb_rate = usb_rate
+        self.reset()
+
+    def reset(self) -> None:
+        """Power-on state"""
+        self.run_mode = Camera.NORMAL
+        self.bits = 8
+        self.freq_mode = 0
+        self.resolution = (1280, 960)
+        self.bin_mode = Camera.NO_BIN
+        self.nBuffer = 24
+        self.exposure_time = 50.0  # ms
+        self.frame_time = 0.1  # s
+        self.gain = 15
+        self.start_time = time.monotonic()
+        self.last_capture = self.start_time
+        self.nTriggers = 0
+        # captured frames, oldest first: (time ready, psf state, triggered)
+        self.buffer: deque[tuple[float, tuple, bool]] = deque()
+        self.nSend = 0  # frames requested by GetImageData
+        self.reply = array.array("B")
+
+    def set_configuration(self) -> None:
+        pass
+
+    def capture(self) -> None:
+        """Capture frames which have been exposed since the last call"""
+        now = time.monotonic()
+        if self.run_mode == Camera.NORMAL:
+            period = max(self.frame_time, self.exposure_time / 1000)
+            # only the last nBuffer frames can be kept
+            self.last_capture = max(self.last_capture, now - self.nBuffer * period)
+            while self.last_capture + period <= now:
+                self.last_capture += period
+                # as the stage was half way through the exposure
+                mid = self.last_capture - self.exposure_time / 2000
+                self.buffer.append((self.last_capture, self.psf.state(mid), False))
+        while len(self.buffer) > self.nBuffer:
+            self.buffer.popleft()
+
+    def ready_frames(self) -> int:
+        """Number of frames exposed and waiting in the camera buffer"""
+        self.capture()
+        now = time.monotonic()
+        return sum(1 for f in self.buffer if f[0] <= now)
+
+    def write(self, endpoint: int, data, timeout: int | None = None) -> int:
+        """Handle a command from the host"""
+        cmd = data[0]
+        if cmd == 0x01:  # firmware version
+            self.reply = array.array("B", [0x01, 3, 1, 0, 0])
+        elif cmd == 0x21:  # camera information
+            info = bytes([1]) + b"SIM-B013-U".ljust(14, b"\0")
+            info += b"SIMULATED".ljust(14, b"\0") + bytes(14)
+            self.reply = array.array("B", bytes([0x01, len(info)]) + info)
+        elif cmd == 0x30:  # work mode
+            self.run_mode, self.bits = data[2], data[3]
+            self.buffer.clear()
+            self.last_capture = time.monotonic()
+        elif cmd == 0x32:  # frequency
+            self.freq_mode = data[2]
+        elif cmd == 0x33:  # query buffer
+            n = min(self.ready_frames(), 0xFF)
+            res = self.resolution
+            self.reply = array.array(
+                "B",
+                [0x08, 6, n, res[0] >> 8, res[0] & 0xFF, res[1] >> 8, res[1] & 0xFF,
+                 self.bin_mode],
+            )
+        elif cmd == 0x34:  # get image data
+            self.nSend += data[2]
+        elif cmd == 0x35:  # clear buffer
+            for _ in range(min(data[2], len(self.buffer))):
+                self.buffer.popleft()
+        elif cmd == 0x36:  # trigger
+            if self.run_mode == Camera.TRIGGER:
+                self.nTriggers += 1
+                ready = time.monotonic() + self.exposure_time / 1000
+                mid = ready - self.exposure_time / 2000
+                self.buffer.append((ready, self.psf.state(mid), True))
+        elif cmd == 0x50:  # reset
+            self.reset()
+        elif cmd == 0x60:  # resolution
+            self.resolution = ((data[2] << 8) + data[3], (data[4] << 8) + data[5])
+            self.bin_mode, self.nBuffer = data[6], data[7]
+            self.buffer.clear()
+        elif cmd == 0x62:  # gain
+            self.gain = data[2]
+        elif cmd == 0x63:  # exposure time
+            units = (data[2] << 24) + (data[3] << 16) + (data[4] << 8) + data[5]
+            self.exposure_time = units * 0.05
+        elif cmd == 0x64:  # frame time
+            self.frame_time = max(((data[2] << 8) + data[3]) / 10000, 1e-4)
+        return len(data)
+
+    def clear_halt(self, endpoint: int) -> None:
+        """Reset an endpoint; frames requested but not yet sent are dropped"""
+        if endpoint == 0x82:
+            self.nSend = 0
+
+    def read(self, endpoint: int, size_or_buffer, timeout: int | None = None):
+        """Read a command reply (endpoint 0x81) or frame (endpoint 0x82)"""
+        if endpoint == 0x81:
+            return self.reply
+        timeout_s = (timeout if timeout is not None else 1000) / 1000
+        if self.nSend == 0 or self.ready_frames() == 0:
+            time.sleep(timeout_s)
+            raise usb.core.USBTimeoutError("Operation timed out")
+        self.nSend -= 1
+        ready, state, triggered = self.buffer.popleft()
+
+        # pack the image as the camera does, with properties at the end
+        cols, rows = self.resolution[1], self.resolution[0]
+        nPixels = rows * cols
+        bytes_per_px = 1 if self.bits == 8 else 2
+        padding = (bytes_per_px * nPixels) % 512
+        frame_size = nPixels * bytes_per_px + padding + 512
+        if isinstance(size_or_buffer, array.array):
+            buffer = size_or_buffer
+        else:
+            buffer = array.array("B", bytes(size_or_buffer))
+        img = self.psf.render((cols, rows), state, 12)
+        data = np.frombuffer(buffer, dtype=np.uint8, count=nPixels * bytes_per_px)
+        if self.bits == 8:
+            np.right_shift(img, 4, out=data.reshape(cols, rows), casting="unsafe")
+        else:
+            pairs = data.reshape(cols, rows, 2)
+            np.right_shift(img, 4, out=pairs[:, :, 0], casting="unsafe")
+            np.bitwise_and(img, 0x0F, out=pairs[:, :, 1], casting="unsafe")
+        struct.pack_into(
+            "<14HI",
+            buffer,
+            frame_size - 512,
+            rows,
+            cols,
+            self.bin_mode,
+            0,
+            0,
+            self.gain,
+            self.gain,
+            self.gain,
+            int((ready - self.start_time) * 1000) & 0xFFFF,
+            triggered,
+            self.nTriggers & 0xFFFF,
+            0,
+            min(int(self.frame_time * 10000), 0xFFFF),
+            self.freq_mode,
+            int(round(self.exposure_time / 0.05)),
+        )
+
+        # transfer time
+        time.sleep(frame_size / self.usb_rate)
+        if isinstance(size_or_buffer, array.array):
+            return frame_size
+        return buffer[:frame_size]
+
+
+class SimulatedCamera(Camera):
+    """Mightex camera simulator
+
+    This is the real Camera, talking to a SimulatedDevice instead of USB,
+    so modes, triggers, buffers and Frames all behave as with the hardware.
+    """
+
+    def __init__(self, psf: PsfModel, usb_rate: float = 40e6, **kwargs) -> None:
+        """Mightex camera simulator
+
+        Args:
+            psf: model of the image on the detector
+            usb_rate: frame transfer rate in bytes per second
+            kwargs: Camera arguments
+        """
+        self.psf = psf
+        self.usb_rate = usb_rate
+        super().__init__(**kwargs)
+
+    def find_device(self) -> SimulatedDevice:  # type: ignore
+        """Make simulated device"""
+        print("Connecting to simulated camera... ", end="", flush=True)
+        return SimulatedDevice(self.psf, self.usb_rate)
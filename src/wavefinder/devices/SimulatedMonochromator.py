@@ -0,0 +1,126 @@
+import time
+from collections import deque
+
+from .DkMonochromator import DkMonochromator
+
+END = 24  # end byte of every reply
+
+
+class SimulatedPort:
+    """Stands in for the serial port of a DK series monochromator
+
+    Answers the commands DkMonochromator uses, from the DK240/480 command set.
+    Wavelength and slit moves reply when they would finish on the instrument.
+    """
+
+    def __init__(
+        self, slew_rate: float = 100.0, slit_rate: float = 500.0, overhead: float = 0.2
+    ) -> None:
+        """Simulated monochromator serial port
+
+        Args:
+            slew_rate: grating slew rate in nm per second
+            slit_rate: slit motor rate in microns per second
+            overhead: time added to every wavelength or slit move, in seconds
+        """
+        self.port = ""
+        self.is_open = False
+        self.slew_rate = slew_rate
+        self.slit_rate = slit_rate
+        self.overhead = overhead
+        self.wavelength = 500.0  # nm
+        self.slits = [100, 100]  # microns
+        self.step = 0.01  # nm per grating step
+        # reply bytes, with the time they're sent
+        self.replies: deque[tuple[float, bytes]] = deque()
+        # command waiting for its argument bytes: (command, number of bytes)
+        self.pending: tuple[int, int] | None = None
+
+    def open(self) -> None:
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+        self.replies.clear()
+
+    def reply(self, data: bytes, delay: float = 0.0) -> None:
+        """Queue reply bytes, sent after delay seconds"""
+        self.replies.append((time.monotonic() + delay, data))
+
+    def write(self, data: bytes) -> int:
+        """Handle a command, or the argument of the last command"""
+        if self.pending:
+            cmd, _ = self.pending
+            self.pending = None
+            value = int.from_bytes(data)
+            if cmd == 16:  # go to wavelength
+                target = value / 100
+                delay = self.overhead + abs(target - self.wavelength) / self.slew_rate
+                self.wavelength = target
+            else:  # slit 1 or 2
+                i = cmd - 31
+                delay = self.overhead + abs(value - self.slits[i]) / self.slit_rate
+                self.slits[i] = value
+            self.reply(bytes([0, END]), delay)
+            return len(data)
+
+        cmd = data[0]
+        self.reply(bytes([cmd]))
+        if cmd == 16:  # go to wavelength, 3 byte argument
+            self.pending = (cmd, 3)
+        elif cmd in (31, 32):  # set slit, 2 byte argument
+            self.pending = (cmd, 2)
+        elif cmd == 29:  # query wavelength
+            self.reply(int(round(self.wavelength * 100)).to_bytes(3) + bytes([0, END]))
+        elif cmd == 30:  # query slits
+            self.reply(
+                self.slits[0].to_bytes(2) + self.slits[1].to_bytes(2) + bytes([0, END])
+            )
+        elif cmd == 33:  # serial number
+            self.reply(b"12345" + bytes([0, END]))
+        elif cmd in (1, 7):  # step down or up
+            self.wavelength += self.step if cmd == 7 else -self.step
+            self.reply(bytes([0, END]))
+        return len(data)
+
+    def read(self, n: int = 1) -> bytes:
+        """Read up to n bytes which have been sent, without waiting"""
+        result = bytes()
+        now = time.monotonic()
+        while self.replies and len(result) < n and self.replies[0][0] <= now:
+            ready, data = self.replies.popleft()
+            take = n - len(result)
+            result += data[:take]
+            if len(data) > take:
+                self.replies.appendleft((ready, data[take:]))
+        return result
+
+
+class SimulatedMonochromator(DkMonochromator):
+    """DK series monochromator simulator
+
+    This is the real DkMonochromator, talking to a SimulatedPort instead of a
+    serial port, so the command queue and status behave as with the hardware.
+    """
+
+    def __init__(
+        self,
+        port: str,
+        slew_rate: float = 100.0,
+        slit_rate: float = 500.0,
+        overhead: float = 0.2,
+    ) -> None:
+        """DK series monochromator simulator
+
+        Args:
+            port: name of port, for messages
+            slew_rate: grating slew rate in nm per second
+            slit_rate: slit motor rate in microns per second
+            overhead: time added to every wavelength or slit move, in seconds
+        """
+        self.sim_args = dict(slew_rate=slew_rate, slit_rate=slit_rate, overhead=overhead)
+        super().__init__(port)
+
+    def make_port(self) -> SimulatedPort:  # type: ignore
+        """Make simulated port"""
+        return SimulatedPort(**self.sim_args)
@@ -58,6 +58,20 @@ class ZaberAxis(Axis):
         except MotionLibException:
             self.status = Axis.ERROR
 
+    async def sweep(self, position: float, speed: float):
+        try:
+            self.status = Axis.MOVING
+            await self.axis.move_absolute_async(
+                position,
+                Units.LENGTH_MILLIMETRES,
+                velocity=speed,
+                velocity_unit=Units.VELOCITY_MILLIMETRES_PER_SECOND,
+            )
+            await self.update_position()
+            await self.update_status()
+        except MotionLibException:
+            self.status = Axis.ERROR
+
     async def stop(self):
         try:
             await self.axis.stop_async()
@@ -0,0 +1,307 @@
+"""Image analysis worker pool"""
+
+import asyncio
+import weakref
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from ..devices.MightexBufCmos import Frame
+from .image import image_math, roi_copy
+
+
+class AnalysisPool:
+    """Run image math on worker threads or processes, off the event loop"""
+
+    THREAD = "thread"
+    PROCESS = "process"
+    MODES = [THREAD, PROCESS]
+
+    def __init__(self, mode: str = THREAD, workers: int = 1) -> None:
+        """Image analysis worker pool
+
+        Args:
+            mode: "thread" to give frames to worker threads directly, or
+                  "process" to give frames to worker processes in shared memory
+            workers: number of workers
+        """
+        self.mode = mode if mode in AnalysisPool.MODES else AnalysisPool.THREAD
+        self.workers = max(workers, 1)
+        if self.mode == AnalysisPool.PROCESS:
+            self.executor: Executor = ProcessPoolExecutor(self.workers)
+        else:
+            self.executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="analysis"
+            )
+
+        self.busy = 0  # number of jobs given to the executor and not yet done
+        # newest droppable job waiting for a free worker
+        self.newest: (
+            tuple[asyncio.Future, Callable, np.ndarray | Frame, tuple] | None
+        ) = None
+        self.n_dropped = 0  # number of droppable jobs replaced by newer ones
+
+        # statistics of recent frames, shared by everything using this pool
+        self.stats = StatsCache(self)
+
+    def submit(
+        self,
+        func: Callable,
+        image_array: np.ndarray | Frame,
+        *args,
+        drop_old: bool = False,
+    ) -> asyncio.Future:
+        """Run func(image_array, *args) on a worker
+
+        Must be called from within the running event loop.
+
+        Args:
+            func: module-level function to run, e.g. image_math
+            image_array: numpy array of image pixels, first argument to func;
+                         in thread mode, this may be a frame to unpack on the worker
+            args: other arguments to func
+            drop_old: if all workers are busy, wait for the next free worker
+                      in place of any older job which was submitted with drop_old;
+                      use this for streaming frames where only the newest matters
+
+        Returns:
+            future with the result of func; the future of a dropped job is cancelled
+        """
+        future = asyncio.get_running_loop().create_future()
+        if drop_old and self.busy >= self.workers:
+            if self.newest:
+                self.newest[0].cancel()
+                self.n_dropped += 1
+            self.newest = (future, func, image_array, args)
+        else:
+            self.start(future, func, image_array, args)
+        return future
+
+    def start(
+        self,
+        future: asyncio.Future,
+        func: Callable,
+        image_array: np.ndarray | Frame,
+        args: tuple,
+    ):
+        """Give a job to the executor and resolve future when it's done"""
+        loop = asyncio.get_running_loop()
+        shm = None
+        if self.mode == AnalysisPool.PROCESS:
+            # frames are only given to worker threads, so this is an array;
+            # copy the frame once into shared memory instead of pickling it
+            shm = SharedMemory(create=True, size=max(image_array.nbytes, 1))
+            np.ndarray(image_array.shape, image_array.dtype, buffer=shm.buf)[...] = (
+                image_array
+            )
+            job = loop.run_in_executor(
+                self.executor,
+                run_on_shared_image,
+                func,
+                shm.name,
+                image_array.shape,
+                image_array.dtype.str,
+                args,
+            )
+        else:
+            job = loop.run_in_executor(self.executor, func, image_array, *args)
+        self.busy += 1
+        job.add_done_callback(lambda j: self.finish(j, future, shm))
+
+    def finish(
+        self, job: asyncio.Future, future: asyncio.Future, shm: SharedMemory | None
+    ):
+        """Pass the job's result to its future, and start the newest waiting job"""
+        self.busy -= 1
+        if shm:
+            shm.close()
+            shm.unlink()
+        if not future.cancelled():
+            if job.cancelled():
+                future.cancel()
+            elif job.exception():
+                future.set_exception(job.exception())  # type: ignore
+            else:
+                future.set_result(job.result())
+
+        if self.newest and self.busy < self.workers:
+            newest, self.newest = self.newest, None
+            if not newest[0].cancelled():
+                self.start(*newest)
+
+    def close(self):
+        """Stop workers, dropping any jobs which haven't started"""
+        if self.newest:
+            self.newest[0].cancel()
+            self.newest = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class StatsCache:
+    """Image statistics of recent frames, so that each frame is analysed
+    at most once for each set of parameters
+
+    Entries are kept only as long as their frames. Use from the event loop.
+    """
+
+    def __init__(self, analysis: AnalysisPool) -> None:
+        """Image statistics cache
+
+        Args:
+            analysis: worker pool to compute statistics on
+        """
+        self.analysis = analysis
+        # frame -> {(threshold, roi_size, fwhm_method): (future, droppable)}
+        self.entries: weakref.WeakKeyDictionary[
+            Frame, dict[tuple, tuple[asyncio.Future, bool]]
+        ] = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        frame: Frame,
+        threshold: float,
+        roi_size: tuple[int, int] | None,
+        fwhm_method: str,
+        drop_old: bool = False,
+    ) -> asyncio.Future:
+        """Statistics of a frame, from the cache or computed on the analysis pool
+
+        Args:
+            frame: camera frame
+            threshold: drop pixels with values below [threshold]% of max pixel value
+            roi_size: (x_size, y_size) of region of interest, or None for full frame
+            fwhm_method: full-width half-maximum calculation method
+            drop_old: computation may be dropped for a newer frame, see
+                      AnalysisPool.submit; it's only shared with other droppable
+                      requests until it's done
+
+        Returns:
+            future with centroid, fwhm, max_value, n_saturated as from image_math;
+            centroid is in pixel coordinates of the region of interest, if used
+        """
+        key = (threshold, roi_size, fwhm_method)
+        stats = self.entries.setdefault(frame, {})
+        entry = stats.get(key)
+        # a droppable computation may yet be cancelled, so until it's done,
+        # don't share it with a caller which can't be dropped
+        if (
+            entry
+            and self.usable(entry[0])
+            and (drop_old or entry[0].done() or not entry[1])
+        ):
+            self.hits += 1
+            # shielded, so a cancelled caller doesn't cancel it for everyone
+            return asyncio.shield(entry[0])
+
+        self.misses += 1
+        # unpack and crop on the worker; a worker process gets only the raw data
+        if self.analysis.mode == AnalysisPool.THREAD:
+            frame_data: np.ndarray | Frame = frame
+        else:
+            frame_data = frame.raw
+        future = self.analysis.submit(
+            frame_stats,
+            frame_data,
+            (frame.cols, frame.rows),
+            frame.bits,
+            roi_size,
+            threshold,
+            fwhm_method,
+            drop_old=drop_old,
+        )
+        stats[key] = (future, drop_old)
+        future.add_done_callback(lambda f: self.discard(stats, key, f))
+        return asyncio.shield(future)
+
+    def put(
+        self,
+        frame: Frame,
+        threshold: float,
+        roi_size: tuple[int, int] | None,
+        fwhm_method: str,
+        result: tuple[tuple[float, float], float, int, int],
+    ):
+        """Store statistics computed elsewhere, e.g. with image_math_stack
+
+        Args:
+            frame, threshold, roi_size, fwhm_method: as for get
+            result: centroid, fwhm, max_value, n_saturated
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        self.entries.setdefault(frame, {})[(threshold, roi_size, fwhm_method)] = (
+            future,
+            False,
+        )
+
+    @staticmethod
+    def usable(future: asyncio.Future) -> bool:
+        """True unless the computation was dropped or failed"""
+        return not future.cancelled() and not (future.done() and future.exception())
+
+    def discard(self, stats: dict, key: tuple, future: asyncio.Future):
+        """Forget a dropped or failed computation, so it's done again next time"""
+        if not self.usable(future) and stats.get(key, (None,))[0] is future:
+            del stats[key]
+
+    def summary(self) -> str:
+        """Summary of cache use"""
+        return f"image statistics cache: {self.hits} hits, {self.misses} misses"
+
+
+def frame_stats(
+    frame_data: np.ndarray | Frame,
+    shape: tuple[int, int],
+    bits: int,
+    roi_size: tuple[int, int] | None,
+    threshold: float,
+    fwhm_method: str,
+) -> tuple[tuple[float, float], float, int, int]:
+    """Worker side of StatsCache: unpack a frame and run image_math on it
+
+    Args:
+        frame_data: the frame, or its raw data, as Frame.raw
+        shape: (cols, rows) shape of image
+        bits: 8 or 12 bit mode
+        roi_size: (x_size, y_size) of region of interest, or None for full frame
+        threshold, fwhm_method: as for image_math
+    """
+    if isinstance(frame_data, Frame):
+        image = frame_data.img_array
+    else:
+        image = Frame.unpack(frame_data, shape, bits)
+    if roi_size:
+        image = roi_copy(image, roi_size)
+    return image_math(image, bits, threshold, fwhm_method)
+
+
+def run_on_shared_image(
+    func: Callable,
+    shm_name: str,
+    shape: tuple[int, ...],
+    dtype: str,
+    args: tuple,
+):
+    """Worker side of process mode: run func on an image in shared memory
+
+    Args:
+        func: function to run
+        shm_name: name of shared memory block holding the image
+        shape: shape of image array
+        dtype: numpy dtype string of image array
+        args: other arguments to func
+
+    Returns result of func, which must not refer to the shared memory
+    """
+    shm = SharedMemory(name=shm_name)
+    image_array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    try:
+        return func(image_array, *args)
+    finally:
+        # views of the buffer must be gone before closing
+        del image_array
+        shm.close()
@@ -0,0 +1,212 @@
+"""Estimate of how long a sequence takes, from the durations of past steps"""
+
+import csv
+import os
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+
+import numpy as np
+from astropy.time import Time
+
+# columns of the timing log; size and size2 are what the duration depends on,
+# e.g. the distance of a move
+COLUMNS = ["time", "kind", "name", "size", "size2", "duration"]
+
+
+class TimingLog:
+    """Durations of past sequence steps, for estimating how long a sequence takes
+
+    Kinds of step, with their name and sizes:
+        "move": axis name, distance in mm or degrees
+        "monochromator": "", wavelength change in nm, total slit change in microns
+        "center": "", none
+        "focus": strategy, 1 if searched near a prediction else 0
+        "frame": "", exposure time in ms
+        "write": "", none
+
+    Durations are appended to a CSV file, so they're kept between runs; only the
+    most recent are used, and the file is trimmed to them when loaded.
+    """
+
+    def __init__(self, path: str, keep: int = 200) -> None:
+        """Load past durations, if there are any
+
+        Args:
+            path: filename of CSV file of durations
+            keep: number of recent durations to use of each kind and name
+        """
+        self.path = path
+        self.keep = keep
+        # (size, size2, duration), by (kind, name)
+        self.samples: dict[tuple[str, str], deque[tuple[float, float, float]]] = (
+            defaultdict(lambda: deque(maxlen=self.keep))
+        )
+
+        if os.path.exists(path):
+            n_rows = 0
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    n_rows += 1
+                    try:
+                        key = (row["kind"], row["name"])
+                        size, size2, duration = (float(row[c]) for c in COLUMNS[3:])
+                        self.samples[key].append((size, size2, duration))
+                    except (KeyError, TypeError, ValueError):
+                        continue
+            if n_rows > sum(len(s) for s in self.samples.values()):
+                self.rewrite()
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self.samples.values())
+
+    def add(
+        self,
+        kind: str,
+        name: str,
+        duration: float,
+        size: float = 0.0,
+        size2: float = 0.0,
+    ) -> None:
+        """Add a duration
+
+        Args:
+            kind: kind of step, see class
+            name: name of step, e.g. axis name, see class
+            duration: in seconds
+            size: what the duration depends on, e.g. move distance, see class
+            size2: what else the duration depends on, see class
+        """
+        sample = (size, size2, duration)
+        if not np.isfinite(sample).all():
+            return
+        self.samples[(kind, name)].append(sample)
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(COLUMNS)
+            writer.writerow([Time.now().isot, kind, name, *sample])
+
+    def rewrite(self) -> None:
+        """Rewrite the file with only the durations in use, without their times"""
+        with open(self.path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for (kind, name), samples in self.samples.items():
+                for sample in samples:
+                    writer.writerow(["", kind, name, *sample])
+
+    def mean(
+        self, kind: str, name: str = "", size: float | None = None
+    ) -> float | None:
+        """Mean duration, or None if there are too few
+
+        Args:
+            kind: kind of step
+            name: name of step
+            size: only use durations of this size, if given
+        """
+        data = np.array(self.samples.get((kind, name), ()), ndmin=2)
+        if size is not None and data.size:
+            data = data[data[:, 0] == size]
+        if len(data) < 3:
+            return None
+        return float(np.mean(data[:, 2]))
+
+    def fit(self, kind: str, name: str = "", terms: int = 2) -> np.ndarray | None:
+        """Fit duration = c0 + c1 size (+ c2 size2 for 3 terms) by least squares
+
+        Zero-size steps, e.g. moves of no distance, aren't fitted.
+
+        Args:
+            kind: kind of step
+            name: name of step
+            terms: 2 for size only, 3 for size and size2
+
+        Returns coefficients, or None if there are too few durations, with too
+        little spread in size, for a fit
+        """
+        data = np.array(self.samples.get((kind, name), ()), ndmin=2)
+        if data.size:
+            data = data[data[:, : terms - 1].any(axis=1)]
+        if len(data) < 3 * terms:
+            return None
+        x = np.column_stack([np.ones(len(data)), data[:, : terms - 1]])
+        if np.linalg.matrix_rank(x) < terms:
+            return None
+        coef, *_ = np.linalg.lstsq(x, data[:, 2], rcond=None)
+        # durations can't shrink with size, or be negative
+        return np.maximum(coef, 0.0)
+
+
+@dataclass(slots=True)
+class SequenceEstimate:
+    """Estimated duration of a sequence"""
+
+    n_rows: int = 0
+    total: float = 0.0  # seconds, until the last file is written
+    # seconds spent in each substate; monochromator and axis moves overlap
+    substates: dict[str, float] = field(default_factory=dict)
+    # seconds of each substate on the critical path, which adds up to the total
+    critical: dict[str, float] = field(default_factory=dict)
+    # number of rows whose move to them is limited by each device
+    limiting: dict[str, int] = field(default_factory=dict)
+    # timings with no past durations, which use defaults
+    defaults: list[str] = field(default_factory=list)
+    compute_time: float = 0.0  # seconds taken to estimate
+
+    def short(self) -> str:
+        """Total, and the largest parts of the critical path"""
+        if self.total <= 0:
+            return ""
+        parts = sorted(self.critical.items(), key=lambda kv: -kv[1])[:3]
+        text = ", ".join(f"{k} {t / self.total:.0%}" for k, t in parts if t > 0)
+        return f"Estimated time {format_duration(self.total)}\n{text}"
+
+    def __str__(self) -> str:
+        lines = [
+            f"Sequence estimate: {self.n_rows} rows, {format_duration(self.total)}"
+            f" ({self.compute_time * 1000:.1f} ms to estimate)"
+        ]
+        for name, t in self.substates.items():
+            on_path = self.critical.get(name, 0.0)
+            lines.append(
+                f"  {name}: {format_duration(t)},"
+                f" {format_duration(on_path)} on critical path"
+            )
+        for name, t in self.critical.items():
+            if name not in self.substates:
+                lines.append(f"  {name}: {format_duration(t)} on critical path")
+        if self.limiting:
+            text = ", ".join(f"{k} {n}" for k, n in self.limiting.items())
+            lines.append(f"  moves to rows limited by: {text}")
+        if self.defaults:
+            lines.append(f"  no past durations of: {', '.join(self.defaults)}")
+        return "\n".join(lines)
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as h:mm:ss"""
+    s = int(round(seconds))
+    return f"{s // 3600}:{s // 60 % 60:02}:{s % 60:02}"
+
+
+def writer_finish(submitted: np.ndarray, write_time: float) -> float:
+    """Time the last of a queue of files is written, one at a time
+
+    Args:
+        submitted: times files are submitted, in order
+        write_time: time to write each file
+
+    Returns time the last is written, or 0 for no files
+    """
+    if len(submitted) == 0:
+        return 0.0
+    # file k finishes at max over m <= k of (submitted[m] + (k - m + 1) write_time)
+    k = np.arange(len(submitted))
+    finish = np.maximum.accumulate(submitted - k * write_time) + (k + 1) * write_time
+    return float(finish[-1])
@@ -0,0 +1,141 @@
+"""Model of best focus position, fitted to past focus results"""
+
+import csv
+import os
+
+import numpy as np
+from astropy.time import Time
+
+# columns of the results file; the model is fitted to z
+COLUMNS = ["time", "wavelength", "order", "x", "y", "z", "fwhm"]
+# polynomial terms in the scaled variables, in the order they're added to the fit
+TERMS = [
+    lambda w, o, x, y: np.ones_like(w),
+    lambda w, o, x, y: w,
+    lambda w, o, x, y: o,
+    lambda w, o, x, y: x,
+    lambda w, o, x, y: y,
+    lambda w, o, x, y: w * w,
+    lambda w, o, x, y: x * x,
+    lambda w, o, x, y: y * y,
+    lambda w, o, x, y: w * x,
+    lambda w, o, x, y: w * y,
+    lambda w, o, x, y: x * y,
+    lambda w, o, x, y: w * o,
+]
+
+
+class FocusModel:
+    """Best focus z as a smooth function of wavelength, diffraction order and
+    x, y position, fitted to past focus results
+
+    Results are appended to a CSV file, so the model is kept between runs; delete
+    the file to start again, e.g. after changing the optics. The model is a
+    polynomial, with more terms as results come in: a constant, then linear,
+    then quadratic.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Load past results, if there are any
+
+        Args:
+            path: filename of CSV file of results
+        """
+        self.path = path
+        self.results: list[list[float]] = []
+        # fit, updated when results are added
+        self.coef = np.empty(0)
+        self.center = np.zeros(4)
+        self.scale = np.ones(4)
+        self.pinv = np.empty((0, 0))
+        self.sigma = np.nan
+
+        if os.path.exists(path):
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    try:
+                        self.results.append([float(row[c]) for c in COLUMNS[1:]])
+                    except (KeyError, TypeError, ValueError):
+                        continue
+            self.fit()
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def add(
+        self, wavelength: float, order: int, x: float, y: float, z: float, fwhm: float
+    ) -> None:
+        """Add a focus result and refit
+
+        Args:
+            wavelength: wavelength in nm
+            order: diffraction order
+            x: x axis position in mm
+            y: y axis position in mm
+            z: best focus z axis position in mm
+            fwhm: FWHM at best focus, in pixels
+        """
+        result = [wavelength, order, x, y, z, fwhm]
+        if not np.isfinite(result).all():
+            return
+        self.results.append(result)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(COLUMNS)
+            writer.writerow([Time.now().isot] + result)
+        self.fit()
+
+    def design(self, points: np.ndarray) -> np.ndarray:
+        """Design matrix of the polynomial terms in use, one row per point
+
+        Args:
+            points: array of (wavelength, order, x, y), one row per point
+        """
+        u = (points - self.center) / self.scale
+        return np.stack([t(*u.T) for t in TERMS[: len(self.coef)]], axis=-1)
+
+    def fit(self) -> None:
+        """Fit the model to the results, with about three results per term"""
+        n = len(self.results)
+        if n < 3:
+            self.coef = np.empty(0)
+            return
+        data = np.array(self.results)
+        points, z = data[:, :4], data[:, 4]
+        self.center = points.mean(axis=0)
+        # variables which haven't changed, like order, drop out of the fit
+        scale = points.std(axis=0)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        self.coef = np.zeros(min(len(TERMS), max(1, n // 3)))
+        x = self.design(points)
+        self.pinv = np.linalg.pinv(x)
+        self.coef = self.pinv @ z
+        # leave-one-out residuals, so the uncertainty isn't flattered by overfitting
+        leverage = np.sum(x * self.pinv.T, axis=1)
+        loo = (z - x @ self.coef) / np.maximum(1 - leverage, 1e-6)
+        self.sigma = float(np.sqrt(np.mean(loo**2)))
+
+    def predict(
+        self, wavelength: float, order: int, x: float, y: float
+    ) -> tuple[float, float] | None:
+        """Predict best focus
+
+        Args:
+            wavelength: wavelength in nm
+            order: diffraction order
+            x: x axis position in mm
+            y: y axis position in mm
+
+        Returns (z, uncertainty) in mm, where uncertainty grows away from the
+        results; or None if there are too few results
+        """
+        if len(self.coef) == 0:
+            return None
+        row = self.design(np.array([[wavelength, order, x, y]]))[0]
+        # variance of a new measurement at this point, from the fit's leverage there
+        leverage = float(np.sum((self.pinv.T @ row) ** 2))
+        return float(row @ self.coef), self.sigma * np.sqrt(1 + leverage)
@@ -1,7 +1,12 @@
 """Image Math"""
 
+import threading
+
 import numpy as np
 
+# per-thread scratch buffers for image_moments, reused between calls
+_scratch = threading.local()
+
 
 def image_math(
     image_array: np.ndarray, bits: int, threshold: float, fwhm_method: str
@@ -19,12 +24,259 @@ def image_math(
     Returns:
         centroid, fwhm, max_value, n_saturated
     """
-    image_copy = threshold_copy(image_array, bits, threshold)
-    centroid = find_centroid(image_copy)
-    fwhm = find_full_width_half_max(image_copy, centroid, fwhm_method)
-    max_value = int(np.max(image_array))
-    n_saturated = np.count_nonzero(image_array == (1 << bits) - 1)
-    return centroid, fwhm, max_value, n_saturated
+    moments = image_moments(image_array, bits, threshold)
+    centroid = moments.centroid()
+    match fwhm_method:
+        case "encircled_pixels" | "encircled_energy" | "weighted_encircled_energy":
+            image_copy = threshold_copy(image_array, bits, threshold)
+            fwhm = find_full_width_half_max(image_copy, centroid, fwhm_method)
+        case _:
+            # variance method comes straight from the moments
+            if moments.total == 0 or np.isnan(centroid).any():
+                fwhm = np.nan
+            else:
+                fwhm = fwhm_from_variance(*moments.variance(centroid)[:2])
+    return centroid, fwhm, moments.max_value, moments.n_saturated
+
+
+class ImageMoments:
+    """Zeroth, first, and second moments of an image
+
+    Moments are kept as the row and column marginal sums of the image,
+    plus the x-weighted row sums for the xy cross moment, so that the
+    statistics about any center can be found from 1-D vectors.
+    """
+
+    __slots__ = ("col_sum", "row_sum", "row_x_sum", "total", "max_value", "n_saturated")
+
+    def __init__(
+        self,
+        col_sum: np.ndarray,
+        row_sum: np.ndarray,
+        row_x_sum: np.ndarray,
+        max_value: int = 0,
+        n_saturated: int = 0,
+    ) -> None:
+        """Image moments
+
+        Args:
+            col_sum: sum of pixel values in each column (along x)
+            row_sum: sum of pixel values in each row (along y)
+            row_x_sum: sum of pixel values times x coordinate in each row
+            max_value: maximum pixel value of the image
+            n_saturated: number of saturated pixels in the image
+        """
+        self.col_sum = col_sum
+        self.row_sum = row_sum
+        self.row_x_sum = row_x_sum
+        self.total = float(np.sum(col_sum))
+        self.max_value = max_value
+        self.n_saturated = n_saturated
+
+    def centroid(self) -> tuple[float, float]:
+        """Weighted mean pixel position
+
+        Returns:
+            (u_x, u_y) in pixels or (NaN, NaN) if does not exist
+        """
+        if self.total == 0:
+            return (np.nan, np.nan)
+        u_x = float(np.dot(self.col_sum, np.arange(len(self.col_sum)))) / self.total
+        u_y = float(np.dot(self.row_sum, np.arange(len(self.row_sum)))) / self.total
+        return (u_x, u_y)
+
+    def variance(
+        self, centroid: tuple[float, float] | None = None
+    ) -> tuple[float, float, float]:
+        """Weighted variance and covariance about the centroid
+
+        Args:
+            centroid: (u_x, u_y) to take the moments about; if None, use own centroid
+
+        Returns:
+            (x_var, y_var, xy_cov) in pixels^2, or zeros if the image is dark
+        """
+        if self.total == 0:
+            return (0.0, 0.0, 0.0)
+        if centroid is None:
+            centroid = self.centroid()
+        dx = np.arange(len(self.col_sum)) - centroid[0]
+        dy = np.arange(len(self.row_sum)) - centroid[1]
+        x_var = float(np.dot(self.col_sum, dx * dx)) / self.total
+        y_var = float(np.dot(self.row_sum, dy * dy)) / self.total
+        # sum(w * (x - u_x) * (y - u_y)) = sum(dy * (row_x_sum - u_x * row_sum))
+        xy_cov = (
+            float(np.dot(dy, self.row_x_sum - centroid[0] * self.row_sum)) / self.total
+        )
+        return (x_var, y_var, xy_cov)
+
+
+def image_moments(
+    img_array: np.ndarray, bits: int | None = None, threshold: float = 0.0
+) -> ImageMoments:
+    """Compute image moments, max value, and saturated pixel count in one pass
+
+    Pixels below the threshold are dropped, like threshold_copy, but into
+    a per-thread scratch buffer which is reused between calls.
+
+    Args:
+        img_array: numpy array of image pixels
+        bits: bits per pixel, or None to skip thresholding and saturation count
+        threshold: drop pixels with values below [threshold]% of max pixel value
+
+    Returns:
+        ImageMoments of the thresholded image
+    """
+    max_value = int(np.max(img_array)) if img_array.size > 0 else 0
+    col_sum, row_sum, row_x_sum, n_saturated = _moment_sums(img_array, bits, threshold)
+    return ImageMoments(col_sum, row_sum, row_x_sum, max_value, int(n_saturated))
+
+
+def image_math_stack(
+    image_stack: np.ndarray,
+    bits: int,
+    threshold: float,
+    fwhm_method: str,
+    coadd: bool = False,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Calculate all image statistics for a stack of frames at once
+
+    Args:
+        image_stack: numpy array of frames, shape (n_frames, rows, columns)
+        bits: bits per pixel
+        threshold: drop pixels with values below [threshold]% of max pixel value
+        fwhm_method: full-width half-maximum calculation method, see image_math
+        coadd: average the frames together and compute statistics of the result
+
+    Returns:
+        centroids, fwhms, max_values, n_saturated, as arrays with one entry per
+        frame (or one entry if coadd); centroids has shape (n, 2) of (u_x, u_y)
+    """
+    if coadd:
+        # average rather than add, so the threshold is on the same scale;
+        # float32 sums of 12 bit pixels are exact for up to 4096 frames
+        image_stack = np.mean(image_stack, axis=0, keepdims=True, dtype=np.float32)
+
+    max_values = np.max(image_stack, axis=(1, 2)).astype(int)
+    col_sum, row_sum, row_x_sum, n_saturated = _moment_sums(image_stack, bits, threshold)
+    total = np.sum(col_sum, axis=1)
+    x = np.arange(col_sum.shape[1])
+    y = np.arange(row_sum.shape[1])
+    # dark frames have no centroid or fwhm, so let them be NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        u_x = (col_sum @ x) / total
+        u_y = (row_sum @ y) / total
+        centroids = np.column_stack((u_x, u_y))
+
+        match fwhm_method:
+            case "encircled_pixels" | "encircled_energy" | "weighted_encircled_energy":
+                fwhms = encircled_fwhm_stack(
+                    threshold_copy(image_stack, bits, threshold), u_x, u_y, fwhm_method
+                )
+            case _:
+                dx = x - u_x[:, np.newaxis]
+                dy = y - u_y[:, np.newaxis]
+                x_var = np.sum(col_sum * dx * dx, axis=1) / total
+                y_var = np.sum(row_sum * dy * dy, axis=1) / total
+                fwhms = fwhm_from_variance(x_var, y_var)
+    return centroids, fwhms, max_values, n_saturated
+
+
+def encircled_fwhm_stack(
+    image_stack: np.ndarray, u_x: np.ndarray, u_y: np.ndarray, method: str
+) -> np.ndarray:
+    """Encircled full-width half-max of each frame of a stack,
+    as find_full_width_half_max gives for each frame
+
+    The totals and search targets are found for all frames at once;
+    only the radius search is done frame by frame.
+
+    Args:
+        image_stack: numpy array of thresholded frames, shape (n_frames, rows, columns)
+        u_x: centroid x of each frame, in pixels
+        u_y: centroid y of each frame, in pixels
+        method: "encircled_pixels", "encircled_energy" or "weighted_encircled_energy"
+
+    Returns:
+        fwhm of each frame, NaN for dark frames
+    """
+    total_e = np.sum(image_stack, axis=(1, 2), dtype=np.float64)
+    if method == "encircled_pixels":
+        # find all pixels greater than half max of their frame
+        half_max = np.max(image_stack, axis=(1, 2)) / 2
+        search = image_stack >= half_max[:, np.newaxis, np.newaxis]
+        targets = np.count_nonzero(search, axis=(1, 2)).astype(np.float64)
+    else:
+        search = image_stack
+        targets = total_e / 2
+
+    radii = np.zeros(len(image_stack))
+    enclosed = np.zeros(len(image_stack))
+    # dark frames, or frames without a centroid, have no fwhm
+    found = (total_e > 0) & ~np.isnan(u_x) & ~np.isnan(u_y)
+    for i in np.flatnonzero(found):
+        # NOTE: numpy array x and y are flipped from how they are displayed
+        center_pixel = (int(u_y[i] // 1), int(u_x[i] // 1))
+        radii[i], enclosed[i] = find_enclosing_radius(
+            search[i], center_pixel, targets[i]
+        )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # as for a single frame, see fwhm_by_encircled_energy
+        fwhms = 1 + 2 * (radii + np.maximum(u_y % 1, u_x % 1))
+        if method == "weighted_encircled_energy":
+            fwhms = fwhms / (enclosed / total_e)
+    return np.where(found, fwhms, np.nan)
+
+
+def _moment_sums(
+    img_array: np.ndarray, bits: int | None, threshold: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Threshold image(s) and sum along the last two axes
+
+    Returns:
+        column sums, row sums, x-weighted row sums, and number of saturated pixels,
+        each with one entry per image for a stack of images
+    """
+    n_saturated = np.zeros(img_array.shape[:-2], dtype=int)
+    image = img_array
+    if bits is not None:
+        work, mask = _scratch_buffers(img_array.shape, img_array.dtype)
+        if threshold > 0:
+            t_val = ((1 << bits) - 1) * threshold / 100
+            np.greater_equal(img_array, t_val, out=mask)
+            np.multiply(img_array, mask, out=work, casting="unsafe")
+            image = work
+        np.equal(img_array, (1 << bits) - 1, out=mask)
+        n_saturated = np.count_nonzero(mask, axis=(-2, -1))
+
+    # sum in float64, which is exact for any realistic image size and bit depth;
+    # einsum buffers the cast so no full-size temporary is made
+    x = np.arange(image.shape[-1], dtype=np.float64)
+    col_sum = np.sum(image, axis=-2, dtype=np.float64)
+    row_sum = np.sum(image, axis=-1, dtype=np.float64)
+    row_x_sum = np.einsum("...ij,j->...i", image, x)
+    return col_sum, row_sum, row_x_sum, n_saturated
+
+
+def _scratch_buffers(
+    shape: tuple[int, ...], dtype: np.dtype
+) -> tuple[np.ndarray, np.ndarray]:
+    """Return this thread's (work, mask) scratch buffers, with this shape
+
+    The buffers are kept flat, one work buffer per dtype, and only grow, so
+    single frames and stacks of frames of the same size share them.
+    """
+    size = int(np.prod(shape))
+    if not hasattr(_scratch, "work"):
+        _scratch.work = {}
+        _scratch.mask = np.empty(0, dtype=bool)
+    work: np.ndarray | None = _scratch.work.get(dtype)
+    if work is None or work.size < size:
+        work = _scratch.work[dtype] = np.empty(size, dtype=dtype)
+    if _scratch.mask.size < size:
+        _scratch.mask = np.empty(size, dtype=bool)
+    return work[:size].reshape(shape), _scratch.mask[:size].reshape(shape)
 
 
 def roi_copy(image_array: np.ndarray, roi_size: tuple[int, int]) -> np.ndarray:
@@ -87,23 +339,9 @@ def find_centroid(img_array: np.ndarray) -> tuple[float, float]:
         (u_x, u_y) in pixels or (NaN, NaN) if does not exist
     """
 
-    # if image is all dark, fwhm does not exist
-    if np.sum(img_array) == 0:
-        return (np.nan, np.nan)
-
-    # make a grid of pixel coordinates in the x and y dimensions, e.g.:
-    #   xx, yy = np.meshgrid(np.arange(2), np.arange(3))
-    #   xx = array([[0, 1],     yy = array([[0, 0],
-    #               [0, 1],                 [1, 1],
-    #               [0, 1]])                [2, 2]])
-    xx, yy = np.meshgrid(np.arange(img_array.shape[1]), np.arange(img_array.shape[0]))
-    try:
-        # take the weighted average of the pixel coordinates, using the pixel values as weights
-        u_x = float(np.average(xx, weights=img_array))
-        u_y = float(np.average(yy, weights=img_array))
-        return (u_x, u_y)
-    except ZeroDivisionError:
-        return (np.nan, np.nan)
+    # take the weighted average of the pixel coordinates, using the pixel values as weights;
+    # if image is all dark, centroid does not exist
+    return image_moments(img_array).centroid()
 
 
 def find_full_width_half_max(
@@ -153,25 +391,18 @@ def find_full_width_half_max(
 
 def fwhm_by_variance(img_array: np.ndarray, centroid: tuple[float, float]) -> float:
     """Calculate the variance and then use that to get full-width half-max."""
-    # make a grid of pixel coordinates in the x and y dimensions, e.g.:
-    #   xx, yy = np.meshgrid(np.arange(2), np.arange(3))
-    #   xx = array([[0, 1],     yy = array([[0, 0],
-    #               [0, 1],                 [1, 1],
-    #               [0, 1]])                [2, 2]])
-    # NOTE: numpy array x and y are flipped from how they are displayed
-    xx, yy = np.meshgrid(np.arange(img_array.shape[1]), np.arange(img_array.shape[0]))
-    x_var, y_var = 0, 0
-    try:
-        # calculate the weighted variance and covariance
-        x_var = float(np.average(np.power(xx - centroid[0], 2), weights=img_array))
-        y_var = float(np.average(np.power(yy - centroid[1], 2), weights=img_array))
-    except ZeroDivisionError:
-        pass
+    # calculate the weighted variance from the row and column sums
+    x_var, y_var, _ = image_moments(img_array).variance(centroid)
+    return fwhm_from_variance(x_var, y_var)
+
+
+def fwhm_from_variance(x_var, y_var):
+    """Full-width half-max from the x and y variances of a spot (floats or arrays)"""
     # return the maximum fwhm (either in x or y direction)
     # fwhm for a gaussian is 2 * sqrt(2 * ln(2)) * [std. dev.]
     # 2 * sqrt(2 * ln(2)) ~= 2.3548200450309493
     # add one for center pixel
-    return 1 + np.sqrt(max(x_var, y_var)) * 2.3548200450309493
+    return 1 + np.sqrt(np.maximum(x_var, y_var)) * 2.3548200450309493
 
 
 def fwhm_by_encircled_pixels(
@@ -181,33 +412,18 @@ def fwhm_by_encircled_pixels(
     all pixels with values greater than half of the maximum value of all pixels
     in the image.
     """
-    half_max = np.max(img_array) / 2
-
-    # find number of pixels greater than half max
-    v_t = np.count_nonzero(img_array >= half_max)
+    # find pixels greater than half max, and how many there are
+    fwhm_pixels = img_array >= np.max(img_array) / 2
+    v_t = np.count_nonzero(fwhm_pixels)
 
     # find center of pixel which contains centroid and save the remainder
     # NOTE: numpy array x and y are flipped from how they are displayed
     center_pixel = (int(centroid[1] // 1), int(centroid[0] // 1))
     remainder = (centroid[1] % 1, centroid[0] % 1)
 
-    # starting from center pixel, grow a circle one pixel at a time until
-    # it contains all fwhm pixels or we hit the edge of the array
-    radius = 0
-    while (
-        center_pixel[0] - radius >= 0
-        and center_pixel[1] - radius >= 0
-        and center_pixel[0] + radius + 1 < img_array.shape[0]
-        and center_pixel[1] + radius + 1 < img_array.shape[1]
-    ):
-        # get sub-array and check how many fwhm pixels are in it
-        subarray = img_array[
-            center_pixel[0] - radius : center_pixel[0] + radius + 1,
-            center_pixel[1] - radius : center_pixel[1] + radius + 1,
-        ]
-        if np.count_nonzero(subarray >= half_max) >= v_t:
-            break
-        radius += 1
+    # find the smallest circle around the center pixel which contains
+    # all fwhm pixels, or the largest one which fits in the array
+    radius, _ = find_enclosing_radius(fwhm_pixels, center_pixel, v_t)
 
     # [center pixel]
     # + 2 * ([additional pixels to capture all half-max pixels]
@@ -232,23 +448,9 @@ def fwhm_by_encircled_energy(
     center_pixel = (int(centroid[1] // 1), int(centroid[0] // 1))
     remainder = (centroid[1] % 1, centroid[0] % 1)
 
-    # starting from center pixel, grow a circle one pixel at a time until
-    # it contains all fwhm pixels or we hit the edge of the array
-    radius = 0
-    while (
-        center_pixel[0] - radius >= 0
-        and center_pixel[1] - radius >= 0
-        and center_pixel[0] + radius + 1 < img_array.shape[0]
-        and center_pixel[1] + radius + 1 < img_array.shape[1]
-    ):
-        # get sub-array and check how much energy it contains
-        subarray = img_array[
-            center_pixel[0] - radius : center_pixel[0] + radius + 1,
-            center_pixel[1] - radius : center_pixel[1] + radius + 1,
-        ]
-        if np.sum(subarray) >= total_e / 2:
-            break
-        radius += 1
+    # find the smallest circle around the center pixel which contains
+    # half the energy, or the largest one which fits in the array
+    radius, _ = find_enclosing_radius(img_array, center_pixel, total_e / 2)
 
     # [center pixel]
     # + 2 * ([additional pixels to capture enough energy]
@@ -275,25 +477,9 @@ def fwhm_by_weighted_encircled_energy(
     center_pixel = (int(centroid[1] // 1), int(centroid[0] // 1))
     remainder = (centroid[1] % 1, centroid[0] % 1)
 
-    # starting from center pixel, grow a circle one pixel at a time until
-    # it contains all fwhm pixels or we hit the edge of the array
-    radius = 0
-    subarray_e = 0
-    while (
-        center_pixel[0] - radius >= 0
-        and center_pixel[1] - radius >= 0
-        and center_pixel[0] + radius + 1 < img_array.shape[0]
-        and center_pixel[1] + radius + 1 < img_array.shape[1]
-    ):
-        # get sub-array and check how much energy it contains
-        subarray = img_array[
-            center_pixel[0] - radius : center_pixel[0] + radius + 1,
-            center_pixel[1] - radius : center_pixel[1] + radius + 1,
-        ]
-        subarray_e = np.sum(subarray)
-        if subarray_e >= total_e / 2:
-            break
-        radius += 1
+    # find the smallest circle around the center pixel which contains
+    # half the energy, or the largest one which fits in the array
+    radius, subarray_e = find_enclosing_radius(img_array, center_pixel, total_e / 2)
 
     # [center pixel]
     # + 2 * ([additional pixels to capture enough energy]
@@ -303,3 +489,55 @@ def fwhm_by_weighted_encircled_energy(
     # weight by the proportion of energy enclosed
     # if all energy is enclosed, then we divide by 1; if half, divide by 0.5, etc.
     return fwhm / (subarray_e / total_e)
+
+
+def find_enclosing_radius(
+    img_array: np.ndarray, center_pixel: tuple[int, int], target: float
+) -> tuple[int, float]:
+    """Find the smallest square around a pixel whose sum reaches the target.
+
+    Gives the same answer as growing the square one pixel at a time, but the
+    radius is bracketed by doubling and then found by binary search, so only
+    O(log(radius)) squares are summed instead of every one.
+
+    Args:
+        img_array: numpy array of pixel values (or a boolean mask), all non-negative
+        center_pixel: (row, column) of center pixel
+        target: sum which the square must reach
+
+    Returns:
+        (radius, sum) of the smallest square with sum >= target; if no square
+        which fits in the array is big enough, returns one more than the largest
+        radius which fits, and the sum of that largest square
+    """
+    row, col = center_pixel
+    # largest square which fits, leaving one pixel at the high edges like the
+    # original one-pixel-at-a-time loop did
+    r_max = min(row, col, img_array.shape[0] - row - 2, img_array.shape[1] - col - 2)
+    if r_max < 0:
+        return 0, 0.0
+
+    def square_sum(r: int):
+        """sum of the square with radius r around the center pixel"""
+        return np.sum(img_array[row - r : row + r + 1, col - r : col + r + 1])
+
+    # double the radius until the square is big enough;
+    # r_low is known to be too small (-1 is the empty square)
+    r_low, r_high = -1, 0
+    while r_high < r_max and square_sum(r_high) < target:
+        r_low, r_high = r_high, min(2 * r_high + 1, r_max)
+
+    # binary search for the smallest radius in (r_low, r_high] which reaches the target;
+    # this works because the sum can only grow with the radius
+    lo, hi = r_low + 1, r_high
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if square_sum(mid) >= target:
+            hi = mid
+        else:
+            lo = mid + 1
+    enclosed = square_sum(lo)
+    if enclosed >= target:
+        return lo, enclosed
+    # lo == r_max here, and it still isn't big enough
+    return r_max + 1, enclosed
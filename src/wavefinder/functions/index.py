@@ -0,0 +1,263 @@
+"""Index of the observations in written FITS files"""
+
+import datetime
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from astropy.io import fits
+
+# columns of the observations table, and the header keyword each comes from;
+# an image is identified by its file and extension, since obs_id is only partly
+# random, so two images can share one
+COLUMNS = {
+    "filename": ("TEXT NOT NULL", None),
+    "extname": ("TEXT NOT NULL", "extname"),
+    "extver": ("INTEGER NOT NULL", "extver"),
+    "obs_id": ("TEXT", "obs_id"),
+    "letter": ("TEXT", None),
+    "date_obs": ("TEXT", "date-obs"),
+    "obstype": ("TEXT", "obstype"),
+    "object": ("TEXT", "object"),
+    "wavelength": ("REAL", "wavelen"),
+    "diffraction_order": ("INTEGER", "order"),
+    "slit1": ("REAL", "slit1"),
+    "slit2": ("REAL", "slit2"),
+    "focus_z": ("REAL", "focusz"),
+    "dfocus_z": ("REAL", "dfocusz"),
+    "exposure": ("REAL", "xposure"),
+    "cen_x": ("REAL", "cenx"),
+    "cen_y": ("REAL", "ceny"),
+    "fwhm": ("REAL", "fwhm"),
+    "max_value": ("INTEGER", "pixmax"),
+    "n_saturated": ("INTEGER", "nsat"),
+}
+KEYWORDS = {k for _, k in COLUMNS.values() if k}
+KEY = ["filename", "extname", "extver"]
+SCHEMA_VERSION = 2  # version 1 was keyed on obs_id
+
+
+class ObservationIndex:
+    """SQLite index of observations, one row per image, added as files are written
+
+    Rows are only added, never changed; an image already in the index, by file
+    name, extension name and extension version, is skipped. Safe to use from
+    several threads.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open or create the index
+
+        Args:
+            path: filename of SQLite database
+        """
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            # write-ahead log, so each file costs an append rather than a rewrite
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            version = self.db.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                # the index only holds what's in the files, so it can be rebuilt
+                tables = self.db.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                ).fetchall()
+                if tables:
+                    print(f"Index {path} is out of date; rebuild it from its files")
+                self.db.execute("DROP TABLE IF EXISTS observations")
+                self.db.execute("DROP TABLE IF EXISTS positions")
+                self.db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            columns = ", ".join(f"{c} {t}" for c, (t, _) in COLUMNS.items())
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS observations"
+                f" ({columns}, PRIMARY KEY ({', '.join(KEY)}))"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS positions"
+                " (filename TEXT NOT NULL, extname TEXT NOT NULL,"
+                " extver INTEGER NOT NULL, keyword TEXT NOT NULL, name TEXT,"
+                f" position REAL, PRIMARY KEY ({', '.join(KEY)}, keyword))"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS obs_wavelength"
+                " ON observations (wavelength, diffraction_order)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS obs_order"
+                " ON observations (diffraction_order, wavelength)"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS obs_date ON observations (date_obs)"
+            )
+
+    def add(
+        self,
+        filename: str,
+        header: fits.Header,
+        primary: fits.Header | None = None,
+        data: np.ndarray | None = None,
+    ) -> bool:
+        """Add the observation described by an image header
+
+        Args:
+            filename: name of the file holding the image
+            header: header of the image
+            primary: primary header of a multi-extension file, for headers
+                     common to all of its images
+            data: image, to find max_value and n_saturated if not in header
+
+        Returns True if added, False if already indexed or not an observation
+        """
+        if primary is not None:
+            merged = primary.copy()
+            merged.update(header)
+            header = merged
+        if "obs_id" not in header:
+            return False
+
+        row = {c: header.get(k) for c, (_, k) in COLUMNS.items() if k}
+        row["filename"] = os.path.abspath(filename)
+        # single-image files have no extension name, and are version 1
+        row["extname"] = str(row["extname"] or "")
+        row["extver"] = int(row["extver"] or 1)
+        # "f" in-focus, "i" intra-focus, "e" extra-focus, from extension or file name
+        letter = str(header.get("extname", ""))
+        if len(letter) != 1:
+            basename = os.path.splitext(os.path.basename(filename))[0]
+            letter = basename.rsplit("_", 1)[-1]
+        row["letter"] = letter.lower() if len(letter) == 1 else None
+        if row["max_value"] is None and data is not None and "datamax" in header:
+            # files written before these headers existed
+            row["max_value"] = int(np.max(data))
+            row["n_saturated"] = int(np.count_nonzero(data >= header["datamax"]))
+        key = [row[c] for c in KEY]
+        # axis headers are like "detxpos = 1.0 / [mm] detector x position"
+        positions = [
+            (*key, card.keyword.lower(), card.comment, card.value)
+            for card in header.cards
+            if card.comment.startswith("[")
+            and card.comment.endswith(" position")
+            and card.keyword.lower() not in KEYWORDS
+        ]
+
+        where = " AND ".join(f"{c} = ?" for c in KEY)
+        with self.lock, self.db:
+            if self.db.execute(
+                f"SELECT 1 FROM observations WHERE {where}", key
+            ).fetchone():
+                return False
+            self.db.execute(
+                f"INSERT INTO observations ({', '.join(row)})"
+                f" VALUES ({', '.join('?' * len(row))})",
+                list(row.values()),
+            )
+            self.db.executemany(
+                "INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?)", positions
+            )
+        return True
+
+    def add_file(self, filename: str) -> int:
+        """Add all observations in a FITS file
+
+        Args:
+            filename: name of FITS file
+
+        Returns number of observations added
+        """
+        added = 0
+        with fits.open(filename) as hdul:
+            primary = hdul[0].header
+            for hdu in hdul:
+                if not hdu.is_image or hdu.header.get("naxis", 0) == 0:
+                    continue
+                # extensions share the headers in the primary header
+                merge = primary if hdu is not hdul[0] else None
+                data = hdu.data if "pixmax" not in hdu.header else None
+                added += self.add(filename, hdu.header, merge, data)
+        return added
+
+    def rebuild(self, directory: str) -> tuple[int, int]:
+        """Add all observations in FITS files in a directory and its subdirectories
+
+        Args:
+            directory: path to directory
+
+        Returns number of files read, number of observations added
+        """
+        n_files = 0
+        n_added = 0
+        for root, _, files in os.walk(directory):
+            for f in sorted(files):
+                if f.lower().endswith((".fits", ".fts", ".fit")):
+                    try:
+                        n_added += self.add_file(os.path.join(root, f))
+                        n_files += 1
+                    except OSError as e:
+                        print(f"Skipping {f}: {e}")
+        return n_files, n_added
+
+    def query(
+        self,
+        wavelength: float | None = None,
+        order: int | None = None,
+        date: str | None = None,
+        letter: str | None = None,
+        tolerance: float = 0.5,
+    ) -> list[sqlite3.Row]:
+        """Find observations, using the indexes
+
+        Args:
+            wavelength: wavelength in nm, within tolerance
+            order: diffraction order
+            date: UTC date of observation, e.g. "2024-01-31"
+            letter: "f" for in-focus, "i" intra-focus, "e" extra-focus
+            tolerance: wavelength tolerance in nm
+
+        Returns rows of the observations table, ordered by date
+        """
+        where = []
+        params: list = []
+        if wavelength is not None:
+            where.append("wavelength BETWEEN ? AND ?")
+            params += [wavelength - tolerance, wavelength + tolerance]
+        if order is not None:
+            where.append("diffraction_order = ?")
+            params.append(order)
+        if date is not None:
+            day = datetime.date.fromisoformat(date)
+            where.append("date_obs >= ? AND date_obs < ?")
+            params += [day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()]
+        if letter is not None:
+            where.append("letter = ?")
+            params.append(letter)
+        sql = "SELECT * FROM observations"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date_obs"
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def positions(self, observation: sqlite3.Row) -> dict[str, float]:
+        """Axis positions of an observation, by FITS keyword
+
+        Args:
+            observation: row of the observations table, as from query
+        """
+        where = " AND ".join(f"{c} = ?" for c in KEY)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT keyword, position FROM positions WHERE {where}",
+                [observation[c] for c in KEY],
+            ).fetchall()
+        return {r["keyword"]: r["position"] for r in rows}
+
+    def close(self):
+        """Close the database"""
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,142 @@
+"""Journal of a sequence run's progress, so an interrupted run can be resumed"""
+
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+from astropy.time import Time
+
+FITS_BLOCK = 2880  # bytes; FITS files are a whole number of blocks
+
+
+@dataclass(slots=True)
+class RowProgress:
+    """Progress of one sequence row"""
+
+    focus: float | None = None  # best focus position, once found
+    files: list[str] = field(default_factory=list)  # names of files written
+    finished: bool = False  # True once all images are taken and written
+
+
+class SequenceJournal:
+    """Progress of a sequence run, kept in a JSON file in its output directory
+
+    Holds the sequence and the order its rows are run in, the number of each
+    row's first image, and each row's focus position and files. Saved after each
+    row is focused, and after the writer has written its files, so after an abort
+    or a crash the run can carry on from the rows which aren't complete, without
+    focusing again.
+    """
+
+    FILENAME = "sequence_journal.json"
+
+    def __init__(
+        self,
+        output_dir: str,
+        sequence: list[dict[str, list[float]]],
+        plan: list[int],
+        first_numbers: list[int],
+        sequence_file: str = "",
+    ) -> None:
+        """Journal of a new sequence run
+
+        Args:
+            output_dir: path to output directory
+            sequence: sequence rows
+            plan: order to run the rows in, as indices of sequence
+            first_numbers: sequence number of each row's first image
+            sequence_file: name of the input sequence file, for reference
+        """
+        self.output_dir = output_dir
+        # copies, since the sequencer clears its own on abort
+        self.sequence = list(sequence)
+        self.plan = list(plan)
+        self.first_numbers = list(first_numbers)
+        self.sequence_file = sequence_file
+        self.started = Time.now().isot
+        self.rows = [RowProgress() for _ in sequence]
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.output_dir, SequenceJournal.FILENAME)
+
+    @classmethod
+    def load(cls, output_dir: str) -> "SequenceJournal | None":
+        """Load the journal of an output directory
+
+        Args:
+            output_dir: path to output directory
+
+        Returns journal, or None if there isn't one or it can't be read
+        """
+        try:
+            with open(os.path.join(output_dir, cls.FILENAME)) as f:
+                data = json.load(f)
+            journal = cls(
+                output_dir,
+                data["sequence"],
+                data["plan"],
+                data["first_numbers"],
+                data.get("sequence_file", ""),
+            )
+            journal.started = data.get("started", journal.started)
+            journal.rows = [RowProgress(**row) for row in data["rows"]]
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            print(f"Error reading sequence journal in {output_dir}: {e}")
+            return None
+        if len(journal.rows) != len(journal.sequence):
+            print(f"Sequence journal in {output_dir} doesn't match its sequence")
+            return None
+        return journal
+
+    def save(self) -> None:
+        """Write the journal, replacing the last one whole"""
+        data = {
+            "sequence_file": self.sequence_file,
+            "started": self.started,
+            "sequence": self.sequence,
+            "plan": self.plan,
+            "first_numbers": self.first_numbers,
+            "rows": [asdict(row) for row in self.rows],
+        }
+        temp = self.path + ".tmp"
+        try:
+            with open(temp, "w") as f:
+                json.dump(data, f)
+            os.replace(temp, self.path)
+        except OSError as e:
+            print(f"Error writing sequence journal: {e}")
+
+    def set_focus(self, r: int, position: float) -> None:
+        """Record the focus position of row r, and save"""
+        self.rows[r].focus = position
+        self.save()
+
+    def finish_row(self, r: int, files: list[str]) -> None:
+        """Record that row r's files are written, and save"""
+        self.rows[r].files = [os.path.basename(f) for f in files]
+        self.rows[r].finished = True
+        self.save()
+
+    def is_complete(self, r: int) -> bool:
+        """True if row r is captured and all its files are written
+
+        A file counts as written if it's a whole number of FITS blocks long, so
+        files cut short by a crash don't count.
+        """
+        row = self.rows[r]
+        if not row.finished:
+            return False
+        for name in row.files:
+            filename = os.path.join(self.output_dir, name)
+            try:
+                size = os.path.getsize(filename)
+            except OSError:
+                return False
+            if size == 0 or size % FITS_BLOCK:
+                return False
+        return True
+
+    def remaining(self) -> list[int]:
+        """Rows which aren't complete, in the order they're run in"""
+        return [r for r in self.plan if not self.is_complete(r)]
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(slots=True)
+class Step:
+    """One step of a pipeline"""
+
+    name: str
+    action: Callable[[], Awaitable[bool | None]]
+    after: tuple[str, ...] = ()  # steps whose results this step needs
+    uses: tuple[str, ...] = ()  # devices this step uses, or needs to stay still
+    start: float = np.nan  # perf_counter time
+    end: float = np.nan
+
+    @property
+    def kind(self) -> str:
+        """Name without the row, e.g. "focus" for "focus[3]" """
+        return self.name.split("[")[0]
+
+
+class Pipeline:
+    """Runs steps concurrently, as far as their dependencies and devices allow
+
+    Each step declares the earlier steps it needs the results of, and the devices
+    it uses or needs to stay still. A step starts when those steps are done and
+    no earlier step still waiting or running uses any of its devices; so steps
+    on a device run one at a time in the order they were added, and steps on
+    different devices overlap.
+    """
+
+    def __init__(self) -> None:
+        self.steps: dict[str, Step] = {}
+        self.wall_time = 0.0
+
+    def add(
+        self,
+        name: str,
+        action: Callable[[], Awaitable[bool | None]],
+        after: tuple[str, ...] = (),
+        uses: tuple[str, ...] = (),
+    ) -> None:
+        """Add a step
+
+        Args:
+            name: unique name of step
+            action: coroutine function to run; returning False stops the pipeline
+            after: names of steps which must finish first, added before this one
+            uses: names of devices the step uses or needs to stay still
+        """
+        if name in self.steps:
+            raise ValueError(f"step {name} already added")
+        for a in after:
+            if a not in self.steps:
+                raise ValueError(f"step {name} is after unknown step {a}")
+        self.steps[name] = Step(name, action, after, uses)
+
+    async def run(self) -> bool:
+        """Run all steps
+
+        After a step returns False or raises, no more steps are started, and the
+        running ones are left to finish.
+
+        Returns True if all steps ran, False if stopped; re-raises a step's exception
+        """
+        pending = list(self.steps.values())
+        running: dict[asyncio.Task, Step] = {}
+        done: set[str] = set()
+        busy: set[str] = set()
+        stopped = False
+        error: BaseException | None = None
+        start = time.perf_counter()
+
+        while pending or running:
+            if not stopped:
+                # devices of earlier steps, so later steps can't jump the queue
+                claimed: set[str] = set()
+                for step in list(pending):
+                    if all(a in done for a in step.after) and not (
+                        busy.intersection(step.uses) or claimed.intersection(step.uses)
+                    ):
+                        pending.remove(step)
+                        busy.update(step.uses)
+                        step.start = time.perf_counter()
+                        running[asyncio.ensure_future(step.action())] = step
+                    claimed.update(step.uses)
+            if not running:
+                break
+            finished, _ = await asyncio.wait(
+                running, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in finished:
+                step = running.pop(task)
+                step.end = time.perf_counter()
+                busy.difference_update(step.uses)
+                done.add(step.name)
+                if task.exception():
+                    error = error or task.exception()
+                    stopped = True
+                elif task.result() is False:
+                    stopped = True
+
+        self.wall_time = time.perf_counter() - start
+        if error:
+            raise error
+        return not stopped
+
+    def summary(self) -> str:
+        """Time spent in each kind of step, and overall"""
+        totals: dict[str, float] = defaultdict(float)
+        for step in self.steps.values():
+            if not np.isnan(step.end):
+                totals[step.kind] += step.end - step.start
+        text = ", ".join(f"{k} {t:.1f} s" for k, t in totals.items())
+        return (
+            f"Pipeline: {self.wall_time:.1f} s wall clock for"
+            f" {sum(totals.values()):.1f} s of steps ({text})"
+        )
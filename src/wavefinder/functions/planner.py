@@ -0,0 +1,94 @@
+"""Planning of the order sequence rows are run in"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+# monochromator settings, which are set one after the other
+MONOCHROMATOR = ("wavelength", "slit1", "slit2")
+
+
+@dataclass(frozen=True, slots=True)
+class MotionModel:
+    """Time a device takes to move, with a trapezoidal velocity profile"""
+
+    speed: float  # units per second
+    accel: float = np.inf  # units per second squared, for acceleration and deceleration
+    overhead: float = 0.0  # seconds added to each move, e.g. settle time
+
+    def time(self, distance: np.ndarray) -> np.ndarray:
+        """Time in seconds to move each distance, zero for no move"""
+        d = np.abs(distance)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # top speed, lower for a triangular profile
+            v_peak = np.minimum(self.speed, np.sqrt(d * self.accel))
+            t = d / v_peak + v_peak / self.accel + self.overhead
+        return np.where(d > 0, t, 0.0)
+
+
+def transition_times(
+    rows: list[dict[str, list[float]]], models: dict[str, MotionModel]
+) -> np.ndarray:
+    """Time to go from each row to each other row
+
+    The monochromator's wavelength and slits are set one after the other, while
+    the axes move at the same time as each other and the monochromator.
+
+    Args:
+        rows: sequence rows, with a value for each device they set
+        models: motion model of each device, by column name
+
+    Returns matrix of times in seconds, [from, to]
+    """
+    n = len(rows)
+    monochromator = np.zeros((n, n))
+    times = np.zeros((n, n))
+    for name, model in models.items():
+        if not all(name in row for row in rows):
+            continue
+        values = np.array([row[name][0] for row in rows])
+        t = model.time(values[None, :] - values[:, None])
+        if name in MONOCHROMATOR:
+            monochromator += t
+        else:
+            times = np.maximum(times, t)
+    return np.maximum(times, monochromator)
+
+
+def path_time(times: np.ndarray, path: list[int]) -> float:
+    """Total transition time along a path of rows"""
+    return float(sum(times[a, b] for a, b in zip(path[:-1], path[1:])))
+
+
+def plan_order(times: np.ndarray) -> list[int]:
+    """Order of rows with a short total transition time, starting from row 0
+
+    Nearest neighbour, then 2-opt: reverse any run of rows which shortens the path,
+    until none does. The path is open, so there's no return to the start.
+
+    Args:
+        times: transition time matrix from transition_times, symmetric
+
+    Returns row indices in order, beginning with 0
+    """
+    n = len(times)
+    path = [0]
+    left = set(range(1, n))
+    while left:
+        nearest = min(left, key=lambda r: times[path[-1], r])
+        path.append(nearest)
+        left.remove(nearest)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                # reverse path[i..j]; the last row has no next row
+                change = times[path[i - 1], path[j]] - times[path[i - 1], path[i]]
+                if j + 1 < n:
+                    change += times[path[i], path[j + 1]] - times[path[j], path[j + 1]]
+                if change < -1e-9:
+                    path[i : j + 1] = path[i : j + 1][::-1]
+                    improved = True
+    return path
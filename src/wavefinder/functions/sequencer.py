@@ -1,15 +1,31 @@
 import asyncio
+import itertools
 import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
 from enum import StrEnum
 
 import numpy as np
 from astropy.time import Time
 
-from ..devices.Axis import Axis
+from ..devices.Axis import Axis, move_many
 from ..devices.DkMonochromator import DkMonochromator
 from ..devices.MightexBufCmos import Camera, Frame
 from ..gui.config import Configuration
-from .image import get_roi_box, image_math, roi_copy
+from .analysis import AnalysisPool
+from .estimator import SequenceEstimate, TimingLog, writer_finish
+from .focus_model import FocusModel
+from .journal import SequenceJournal
+from .pipeline import Pipeline
+from .planner import (
+    MONOCHROMATOR,
+    MotionModel,
+    path_time,
+    plan_order,
+    transition_times,
+)
+from .image import get_roi_box, image_math_stack
 from .writer import DataWriter
 
 
@@ -33,6 +49,62 @@ class SequenceSubstate(StrEnum):
     FINISHED = "Finished"
 
 
+@dataclass(slots=True)
+class FocusRun:
+    """Result and cost of one run of the focus routine"""
+
+    strategy: str
+    position: float = np.nan  # best focus position
+    fwhm: float = np.nan  # measured FWHM nearest the best focus position
+    n_moves: int = 0  # z axis moves
+    n_frames: int = 0  # frames taken
+    duration: float = 0.0  # in seconds
+    predicted: float = np.nan  # focus model's prediction, if it had one
+    fallback: bool = False  # True if focus wasn't near the prediction
+    # True if focus is the best frame, with no fit to the focus curve, or at an
+    # end of the data, so it may be past the range searched
+    uncertain: bool = False
+
+    def __str__(self) -> str:
+        text = (
+            f"Focus ({self.strategy}): z = {self.position:.4f} mm,"
+            f" FWHM {self.fwhm:.2f} px, {self.n_moves} moves, {self.n_frames} frames, {self.duration:.1f} s"
+        )
+        if not np.isnan(self.predicted):
+            text += f", predicted z = {self.predicted:.4f} mm"
+            if self.fallback:
+                text += ", searched full range"
+        if self.uncertain:
+            text += ", uncertain"
+        return text
+
+
+def fit_focus_curve(z: np.ndarray, fwhm: np.ndarray) -> tuple[float, float] | None:
+    """Fit FWHM^2 = a (z - z0)^2 + c to the points near focus
+
+    Near focus, FWHM vs z is a hyperbola, so FWHM^2 is a parabola in z.
+
+    Args:
+        z: z positions
+        fwhm: FWHM measured at each z, without NaNs
+
+    Returns (z0, depth) where depth is the distance from z0 at which the FWHM
+    doubles; or None if there aren't enough points near focus, or z0 isn't among them
+    """
+    near = fwhm <= 3 * np.min(fwhm)
+    if np.count_nonzero(near) < 4:
+        return None
+    a2, a1, a0 = np.polyfit(z[near], fwhm[near] ** 2, 2)
+    if a2 <= 0:
+        return None
+    z0 = -a1 / (2 * a2)
+    # use the fit only within the points it's fitted to
+    if not np.min(z[near]) <= z0 <= np.max(z[near]):
+        return None
+    c = max(a0 - a2 * z0**2, 0.0)
+    return float(z0), float(np.sqrt(3 * c / a2))
+
+
 class Sequencer:
     def __init__(
         self,
@@ -41,6 +113,7 @@ class Sequencer:
         axes: dict[str, Axis],
         monochromator: DkMonochromator,
         data_writer: DataWriter,
+        analysis: AnalysisPool,
     ) -> None:
         """Multi-function sequencer class has methods to:
 
@@ -58,6 +131,7 @@ class Sequencer:
             camera: MightexBufCmos Camera device
             axes: dict of all motion axes
             data_writer: DataWriter object
+            analysis: worker pool for image statistics
         """
         self.config = config
         self.camera = camera
@@ -65,11 +139,34 @@ class Sequencer:
         self.axes = axes
         self.monochromator = monochromator
         self.data_writer = data_writer
+        self.analysis = analysis
         self.sequence: list[dict[str, list[float]]] = list()
+        self.sequence_file = ""
+        # order to run the rows of the sequence in
+        self.plan: list[int] = list()
+        # progress of the run, in its output directory, so it can be resumed
+        self.journal: SequenceJournal | None = None
         self.sequence_iteration = 0
         self.sequence_state: SequenceState = SequenceState.INPUT
         self.sequence_substate: SequenceSubstate = SequenceSubstate.START
         self.abort = False
+        # why the last sequence was aborted, other than by the user
+        self.sequence_error = ""
+        # failed writes before the sequence started
+        self.n_failed_writes = 0
+        # focus routine runs, to compare strategies
+        self.focus_run = FocusRun(self.config.focus_strategy)
+        self.focus_runs: list[FocusRun] = []
+        # measured NORMAL mode frame rates, by (fps, exposure time, resolution)
+        self.frame_rates: dict[tuple, float] = {}
+        # past focus results, to predict where focus is
+        self.focus_model = (
+            FocusModel(self.config.focus_model_file)
+            if self.config.focus_model_file
+            else None
+        )
+        # durations of past steps, to estimate how long a sequence takes
+        self.timing_log = TimingLog(self.config.sequencer_timing_log)
 
         # check for axes
         if not self.config.sequencer_x_axis in self.axes:
@@ -113,21 +210,35 @@ class Sequencer:
             move_x_px = centroid[0] - img_center[0]
             # y is mirrored
             move_y_px = -(centroid[1] - img_center[1])
-            await x_axis.move_relative((move_x_px * px_size[0]) / 1000)
-            await y_axis.move_relative((move_y_px * px_size[1]) / 1000)
+            await move_many(
+                {
+                    x_axis: (move_x_px * px_size[0]) / 1000,
+                    y_axis: (move_y_px * px_size[1]) / 1000,
+                },
+                relative=True,
+            )
             centered_position = (x_axis.position, y_axis.position)
         return centered_position
 
-    async def focus(self) -> float:
+    async def focus(
+        self, wavelength: float | None = None, order: int | None = None
+    ) -> float:
         """Start the automatic focus routine
 
+        Given the wavelength and order, searches around the focus model's prediction,
+        if it has one, falling back to the full z range if focus isn't found there;
+        and adds the result to the model.
+
+        Args:
+            wavelength: wavelength in nm, or None to search the full z range
+            order: diffraction order, or None to search the full z range
+
         returns the best focus position
         """
         self.abort = False
         z_axis = self.axes.get(self.config.sequencer_z_axis)
-        fpp = self.config.focus_frames_per_point
-        ppp = self.config.focus_points_per_pass
-        min_move = self.config.focus_minimum_move
+        x_axis = self.axes.get(self.config.sequencer_x_axis)
+        y_axis = self.axes.get(self.config.sequencer_y_axis)
 
         focus_pos = z_axis.position if z_axis else np.nan
 
@@ -137,63 +248,49 @@ class Sequencer:
                 self.old_camera_mode = self.camera.run_mode
             await self.camera.set_mode(run_mode=Camera.TRIGGER, write_now=True)
 
-            # set up for first pass
-            limit_min, limit_max = await z_axis.get_limits()
-            travel_min = limit_min
-            travel_max = limit_max
-            travel_dist = travel_max - travel_min
-            step_dist = travel_dist / (ppp - 1)
-            pass_i = 0
-
-            while step_dist >= min_move and self.abort == False:
-                # keep focusing until each move is min_move distance
-                focus_curve: dict[float, float] = {}
-
-                for point_i in range(ppp):
-                    # check for abort
-                    if self.abort:
-                        break
-
-                    # for each point in this pass
-                    pos = travel_min + point_i * step_dist
-                    await z_axis.move_absolute(pos)
-                    # check for error
-                    if z_axis.status == Axis.ERROR:
-                        print("Error in focus routine!")
-                        return -1
-                    sum = 0
-
-                    for _ in range(fpp):
-                        # for each frame at this point
-                        await self.camera.clear_buffer()
-                        await self.camera.trigger()
-                        # wait for frame
-                        while True:
-                            try:
-                                frame = self.camera.get_newest_frame()
-                                break
-                            except IndexError:
-                                # sleep is necessary to give other tasks time to process
-                                await asyncio.sleep(0.1)
-                                continue
-                        # compute image stats and use fwhm of thresholded image as metric for focus quality
-                        _, fwhm, _, _ = self.compute_image_stats(frame)
-                        # if fwhm is NaN, sum will be NaN and thrown out
-                        sum += fwhm
-
-                    # insert average fwhm into focus curve if it exists
-                    if not np.isnan(sum):
-                        focus_curve[pos] = sum / fpp
-
-                # find minimum along focus_curve
-                focus_pos = min(focus_curve, key=focus_curve.get, default=focus_pos)  # type: ignore
-
-                # set up for next pass
-                travel_min = min(max(focus_pos - step_dist, limit_min), limit_max)
-                travel_max = min(max(focus_pos + step_dist, limit_min), limit_max)
-                travel_dist = travel_max - travel_min
-                step_dist = travel_dist / (ppp - 1)
-                pass_i += 1
+            limits = await z_axis.get_limits()
+            self.focus_run = FocusRun(self.config.focus_strategy)
+            start = time.perf_counter()
+            conditions = None
+            prediction = None
+            has_conditions = wavelength is not None and order is not None
+            if self.focus_model is not None and has_conditions:
+                conditions = (
+                    wavelength,
+                    order,
+                    x_axis.position if x_axis else 0.0,
+                    y_axis.position if y_axis else 0.0,
+                )
+                prediction = self.focus_model.predict(*conditions)
+            if prediction:
+                self.focus_run.predicted = prediction[0]
+                half_width = max(self.config.focus_model_bracket, 3 * prediction[1])
+                bracket = (
+                    min(max(prediction[0] - half_width, limits[0]), limits[1]),
+                    min(max(prediction[0] + half_width, limits[0]), limits[1]),
+                )
+                found = await self.find_focus(z_axis, bracket, focus_pos)
+                if (
+                    found is not None
+                    and not self.abort
+                    and not self.focus_run.fallback
+                ):
+                    # no spot, or focus is at or past an edge of the bracket
+                    margin = 0.1 * half_width
+                    if (
+                        np.isnan(self.focus_run.fwhm)
+                        or (found < bracket[0] + margin and bracket[0] > limits[0])
+                        or (found > bracket[1] - margin and bracket[1] < limits[1])
+                    ):
+                        print("Focus not near prediction, searching full range")
+                        self.focus_run.fallback = True
+                        found = await self.find_focus(z_axis, limits, focus_pos)
+            else:
+                found = await self.find_focus(z_axis, limits, focus_pos)
+            if found is None:
+                print("Error in focus routine!")
+                return -1
+            focus_pos = found
 
             # move to focus position
             await z_axis.move_absolute(focus_pos)
@@ -201,10 +298,456 @@ class Sequencer:
             if self.sequence_state != SequenceState.RUN:
                 await self.camera.set_mode(run_mode=self.old_camera_mode, write_now=True)
 
+            self.focus_run.position = focus_pos
+            self.focus_run.duration = time.perf_counter() - start
+            self.focus_runs.append(self.focus_run)
+            print(self.focus_run)
+            if not self.abort:
+                self.timing_log.add(
+                    "focus",
+                    self.focus_run.strategy,
+                    self.focus_run.duration,
+                    0.0 if prediction is None else 1.0,
+                )
+            if (
+                self.focus_model is not None
+                and conditions
+                and not self.abort
+                and not self.focus_run.uncertain
+            ):
+                self.focus_model.add(*conditions, focus_pos, self.focus_run.fwhm)
+
         # return best position
         self.config.focus_position = focus_pos
         return focus_pos
 
+    async def find_focus(
+        self, z_axis: Axis, limits: tuple[float, float], focus_pos: float
+    ) -> float | None:
+        """Find focus within limits, by the configured strategy
+
+        Args:
+            z_axis: focus axis
+            limits: (min, max) z travel to search
+            focus_pos: position to return if no spot is found
+
+        Returns best focus position, or None on axis error
+        """
+        if self.config.focus_strategy == "model":
+            return await self.focus_by_model(z_axis, limits, focus_pos)
+        elif self.config.focus_strategy == "sweep":
+            return await self.focus_by_sweep(z_axis, limits, focus_pos)
+        else:
+            return await self.focus_by_grid(z_axis, limits, focus_pos)
+
+    async def measure_focus(self, z_axis: Axis, pos: float) -> float | None:
+        """Move the z axis and measure focus quality there
+
+        Args:
+            z_axis: focus axis
+            pos: z position
+
+        Returns average FWHM, NaN if there's no spot, or None on axis error
+        """
+        await z_axis.move_absolute(pos)
+        self.focus_run.n_moves += 1
+        # check for error
+        if z_axis.status == Axis.ERROR:
+            return None
+
+        frames: list[Frame] = []
+        for _ in range(self.config.focus_frames_per_point):
+            # for each frame at this point
+            frames.append(await self.take_image(self.camera))  # type: ignore
+        self.focus_run.n_frames += len(frames)
+        # compute image stats of all frames together and use the
+        # average fwhm of the thresholded images as metric for focus quality;
+        # if any fwhm is NaN, the average will be NaN
+        _, fwhms, _, _ = await self.compute_stack_stats(
+            frames, coadd=self.config.focus_coadd_frames
+        )
+        return float(np.mean(fwhms))
+
+    async def focus_by_grid(
+        self, z_axis: Axis, limits: tuple[float, float], focus_pos: float
+    ) -> float | None:
+        """Find focus by scanning a grid of points, then a finer grid around the best
+
+        Args:
+            z_axis: focus axis
+            limits: (min, max) z travel to search
+            focus_pos: position to return if no spot is found
+
+        Returns best focus position, or None on axis error
+        """
+        ppp = self.config.focus_points_per_pass
+        min_move = self.config.focus_minimum_move
+
+        # set up for first pass
+        limit_min, limit_max = limits
+        travel_min = limit_min
+        travel_max = limit_max
+        travel_dist = travel_max - travel_min
+        step_dist = travel_dist / (ppp - 1)
+
+        while step_dist >= min_move and self.abort == False:
+            # keep focusing until each move is min_move distance
+            focus_curve: dict[float, float] = {}
+
+            for point_i in range(ppp):
+                # check for abort
+                if self.abort:
+                    break
+
+                # for each point in this pass
+                pos = travel_min + point_i * step_dist
+                fwhm = await self.measure_focus(z_axis, pos)
+                if fwhm is None:
+                    return None
+
+                # insert average fwhm into focus curve if it exists
+                if not np.isnan(fwhm):
+                    focus_curve[pos] = fwhm
+
+            # find minimum along focus_curve
+            focus_pos = min(focus_curve, key=focus_curve.get, default=focus_pos)  # type: ignore
+            self.focus_run.fwhm = focus_curve.get(focus_pos, np.nan)
+
+            # set up for next pass
+            travel_min = min(max(focus_pos - step_dist, limit_min), limit_max)
+            travel_max = min(max(focus_pos + step_dist, limit_min), limit_max)
+            travel_dist = travel_max - travel_min
+            step_dist = travel_dist / (ppp - 1)
+
+        return focus_pos
+
+    async def focus_by_model(
+        self, z_axis: Axis, limits: tuple[float, float], focus_pos: float
+    ) -> float | None:
+        """Find focus by Brent's method, then fit a focus curve to the measurements
+
+        Near focus, FWHM vs z is a hyperbola, so FWHM^2 is a parabola in z. Brent's
+        method fits a parabola through its last three points, falling back to a
+        golden-section step whenever the fit isn't trustworthy, so with this metric
+        it converges in a few steps once it's near focus. Stops when the bracket is
+        within minimum_move, then fits all the points near focus at once,
+        which averages out measurement noise.
+
+        Args:
+            z_axis: focus axis
+            limits: (min, max) z travel to search
+            focus_pos: position to return if no spot is found
+
+        Returns best focus position, or None on axis error
+        """
+        x_tol = self.config.focus_minimum_move
+        focus_curve: dict[float, float] = {}
+
+        async def cost(pos: float) -> float | None:
+            """FWHM^2 at pos; no spot is worse than any spot"""
+            fwhm = await self.measure_focus(z_axis, pos)
+            if fwhm is None:
+                return None
+            if np.isnan(fwhm):
+                return np.inf
+            focus_curve[pos] = fwhm
+            return fwhm**2
+
+        # bounded Brent minimization, after scipy.optimize.fminbound
+        golden_mean = (3 - np.sqrt(5)) / 2
+        sqrt_eps = np.sqrt(2.2e-16)
+        a, b = limits
+        x = w = v = a + golden_mean * (b - a)
+        fx = await cost(x)
+        if fx is None:
+            return None
+        fw = fv = fx
+        d = e = 0.0
+        xm = (a + b) / 2
+        tol1 = sqrt_eps * abs(x) + x_tol / 3
+        tol2 = 2 * tol1
+
+        while abs(x - xm) > tol2 - (b - a) / 2 and not self.abort:
+            golden = True
+            if abs(e) > tol1:
+                # try a parabola through x, w, v
+                r = (x - w) * (fx - fv)
+                q = (x - v) * (fx - fw)
+                p = (x - v) * q - (x - w) * r
+                q = 2 * (q - r)
+                if q > 0:
+                    p = -p
+                q = abs(q)
+                r, e = e, d
+                # accept if in the bracket and smaller than the step before last
+                if abs(p) < abs(q * r / 2) and q * (a - x) < p < q * (b - x):
+                    golden = False
+                    d = p / q
+                    u = x + d
+                    # don't measure too close to the bracket ends
+                    if u - a < tol2 or b - u < tol2:
+                        d = tol1 if xm >= x else -tol1
+            if golden:
+                e = (a if x >= xm else b) - x
+                d = golden_mean * e
+            # don't measure closer than tol1 to x
+            u = x + (d if abs(d) >= tol1 else np.copysign(tol1, d))
+            fu = await cost(u)
+            if fu is None:
+                return None
+
+            # narrow the bracket, and keep the three best points
+            if fu <= fx:
+                if u >= x:
+                    a = x
+                else:
+                    b = x
+                v, fv, w, fw, x, fx = w, fw, x, fx, u, fu
+            else:
+                if u < x:
+                    a = u
+                else:
+                    b = u
+                if fu <= fw or w == x:
+                    v, fv, w, fw = w, fw, u, fu
+                elif fu <= fv or v == x or v == w:
+                    v, fv = u, fu
+            xm = (a + b) / 2
+            tol1 = sqrt_eps * abs(x) + x_tol / 3
+            tol2 = 2 * tol1
+
+        if not focus_curve:
+            return focus_pos
+        focus_pos = x
+        self.focus_run.fwhm = focus_curve.get(x, np.nan)
+
+        fit = fit_focus_curve(
+            np.array(list(focus_curve.keys())), np.array(list(focus_curve.values()))
+        )
+        if fit:
+            focus_pos = fit[0]
+        return focus_pos
+
+    async def focus_by_sweep(
+        self, z_axis: Axis, limits: tuple[float, float], focus_pos: float
+    ) -> float | None:
+        """Find focus from frames streamed while the z axis sweeps through focus
+
+        A fast sweep over the whole range finds focus roughly, then a slower sweep
+        back over the region around it, with about as many frames as one pass of
+        the grid, gives the points to fit the focus curve to. A range narrow enough
+        to be covered by the slower sweep, like a predicted one, takes only that;
+        if the curve can't be fitted, or the best frame is at an end of the sweep,
+        the full z range is searched instead.
+
+        Args:
+            z_axis: focus axis
+            limits: (min, max) z travel to search
+            focus_pos: position to return if no spot is found
+
+        Returns best focus position, or None on axis error
+        """
+        speed = self.config.focus_sweep_speed
+        min_move = self.config.focus_minimum_move
+        n_frames = self.config.focus_points_per_pass * self.config.focus_frames_per_point
+        # rate frames are delivered at, which can be less than the camera's setting
+        settings = (
+            self.camera.fps,  # type: ignore
+            self.camera.exposure_time,  # type: ignore
+            tuple(self.camera.resolution),  # type: ignore
+        )
+        rate = self.frame_rates.get(settings)
+        if rate is None:
+            rate = await self.measure_frame_rate()
+            self.frame_rates[settings] = rate
+
+        # start from the nearer end
+        low, high = limits
+        start, end = low, high
+        if abs(z_axis.position - low) > abs(z_axis.position - high):
+            start, end = end, start
+        z = fwhm = np.empty(0)
+        one_sweep = (high - low) * rate / n_frames <= speed
+        if not one_sweep:
+            sweep = await self.sweep_focus(z_axis, start, end, speed, rate)
+            if sweep is None:
+                return None
+            z, fwhm, rate = sweep
+            self.frame_rates[settings] = rate
+            if len(z) == 0 or self.abort:
+                return focus_pos
+
+            # sweep back around the best frame, or the fit if there are enough points
+            center = float(z[np.argmin(fwhm)])
+            half_width = max(2 * speed / rate, 10 * min_move)
+            fit = fit_focus_curve(z, fwhm)
+            if fit:
+                center = fit[0]
+                half_width = max(half_width, 2 * fit[1])
+            start = min(max(center - half_width, low), high)
+            end = min(max(center + half_width, low), high)
+            if abs(z_axis.position - start) > abs(z_axis.position - end):
+                start, end = end, start
+
+        slow_speed = abs(end - start) * rate / n_frames
+        sweep = await self.sweep_focus(z_axis, start, end, slow_speed, rate)
+        if sweep is None:
+            return None
+        self.frame_rates[settings] = sweep[2]
+        z = np.concatenate([z, sweep[0]])
+        fwhm = np.concatenate([fwhm, sweep[1]])
+        if len(z) == 0:
+            return focus_pos
+
+        focus_pos = float(z[np.argmin(fwhm)])
+        fit = fit_focus_curve(z, fwhm)
+        if fit:
+            focus_pos = fit[0]
+        best = np.argmin(sweep[1]) if len(sweep[1]) else 0
+        self.focus_run.uncertain = not fit or best in (0, len(sweep[1]) - 1)
+        if self.focus_run.uncertain and one_sweep and not self.abort:
+            full = await z_axis.get_limits()
+            if full[0] < low or full[1] > high:
+                print("Focus not found in sweep, searching full range")
+                self.focus_run.fallback = True
+                return await self.focus_by_sweep(z_axis, full, focus_pos)
+        self.focus_run.fwhm = float(fwhm[np.argmin(np.abs(z - focus_pos))])
+        return focus_pos
+
+    async def sweep_focus(
+        self, z_axis: Axis, start: float, end: float, speed: float, rate: float
+    ) -> tuple[np.ndarray, np.ndarray, float] | None:
+        """Measure FWHM of frames streamed while the z axis sweeps at constant speed
+
+        The z position is logged as fast as the axis answers, and each frame's z is
+        interpolated from the log at the middle of its exposure. Exposure times come
+        from the camera's millisecond timestamps, tied to the computer's clock by a
+        triggered frame before the sweep, so they don't depend on USB transfer time.
+        The camera is left in TRIGGER mode.
+
+        Args:
+            z_axis: focus axis
+            start: z position to start from
+            end: z position to sweep to
+            speed: sweep speed in mm/s
+            rate: expected frame rate in frames per second
+
+        Frames are read until one exposed after the move ends, so frames still on
+        their way from the camera when the move ends aren't lost.
+
+        Returns z and FWHM of frames with a spot, and frame rate in frames per second,
+        measured if there are enough frames; or None on axis error
+        """
+        await z_axis.move_absolute(start)
+        self.focus_run.n_moves += 1
+        if z_axis.status == Axis.ERROR:
+            return None
+
+        # the camera's timestamp of a triggered frame is the end of its exposure
+        ref = await self.take_image(self.camera)  # type: ignore
+        ref_time = self.camera.last_trigger_time.unix + ref.expTime / 1000  # type: ignore
+        await self.camera.set_mode(run_mode=Camera.NORMAL, write_now=True)  # type: ignore
+
+        if self.config.image_use_roi_stats:
+            roi_size = self.config.roi_size
+            threshold = self.config.image_roi_threshold
+        else:
+            roi_size = None
+            threshold = self.config.image_full_threshold
+        def exposure_end(frame: Frame) -> float:
+            # the timestamp wraps every 65.536 s, so a sweep must be shorter than that
+            return ref_time + ((frame.timestamp - ref.timestamp) % 0x10000) / 1000
+
+        frames: list[Frame] = []
+        stats = []
+        log_time: list[float] = []
+        log_z: list[float] = []
+        move_end = None
+        seen = self.camera.frame_count  # type: ignore
+        move = asyncio.create_task(z_axis.sweep(end, speed))
+        while True:
+            if move_end is None:
+                done = move.done()
+                before = time.time()
+                z = await z_axis.update_position()
+                log_time.append((before + time.time()) / 2)
+                log_z.append(z)
+                if done:
+                    move_end = before
+                    # in case the camera stops, wait for a few frames at most
+                    exposure = self.camera.exposure_time / 1000  # type: ignore
+                    deadline = move_end + exposure + 3 / rate
+            # start statistics of each frame as it arrives, while its data is current
+            new = self.camera.frame_count - seen  # type: ignore
+            if new > 0:
+                seen += new
+                for frame in reversed(self.camera.get_frames(new)):  # type: ignore
+                    frames.append(frame)
+                    stats.append(
+                        self.analysis.stats.get(
+                            frame, threshold, roi_size, self.config.image_fwhm_method
+                        )
+                    )
+            if move_end is not None:
+                # until a frame exposed wholly after the move
+                if frames and (
+                    exposure_end(frames[-1]) - frames[-1].expTime / 1000 > move_end
+                ):
+                    break
+                if time.time() > deadline:
+                    break
+            elif self.abort:
+                await z_axis.stop()
+            await asyncio.sleep(0.001)
+        await move
+        self.focus_run.n_moves += 1
+        self.focus_run.n_frames += len(frames) + 1
+        await self.camera.set_mode(run_mode=Camera.TRIGGER, write_now=True)  # type: ignore
+        if z_axis.status == Axis.ERROR:
+            return None
+
+        results = await asyncio.gather(*stats)
+        fwhm = np.array([r[1] for r in results])
+        exposed = np.array([exposure_end(f) - f.expTime / 2000 for f in frames])
+        z = np.interp(exposed, log_time, log_z)
+        if len(frames) >= 5:
+            rate = (len(frames) - 1) / np.ptp(exposed)
+        found = ~np.isnan(fwhm)
+        return z[found], fwhm[found], float(rate)
+
+    async def measure_frame_rate(self, n_frames: int = 6) -> float:
+        """Measure the rate NORMAL mode frames are delivered at
+
+        Frames can come slower than the camera's frame rate setting, e.g. when USB
+        can't keep up, so focus sweeps are timed by the measured rate. The camera is
+        left in TRIGGER mode.
+
+        Args:
+            n_frames: number of frames to measure over
+
+        Returns frames per second, or the camera's setting if too few frames came
+        """
+        nominal = 1 / max(1 / self.camera.fps, self.camera.exposure_time / 1000)  # type: ignore
+        await self.camera.set_mode(run_mode=Camera.NORMAL, write_now=True)  # type: ignore
+        frames: list[Frame] = []
+        # skip frames from before the mode change
+        seen = self.camera.frame_count  # type: ignore
+        deadline = time.time() + 1 + 2 * n_frames / nominal
+        while len(frames) < n_frames and time.time() < deadline:
+            await asyncio.sleep(0.01)
+            new = self.camera.frame_count - seen  # type: ignore
+            if new > 0:
+                seen += new
+                frames.extend(reversed(self.camera.get_frames(new)))  # type: ignore
+        await self.camera.set_mode(run_mode=Camera.TRIGGER, write_now=True)  # type: ignore
+        if len(frames) < 3:
+            return nominal
+        # timestamps are in ms, and wrap every 65.536 s
+        span = (frames[-1].timestamp - frames[0].timestamp) % 0x10000 / 1000
+        if span <= 0:
+            return nominal
+        return (len(frames) - 1) / span
+
     async def search(self):
         """Find spot by searching in a spiral pattern"""
         x_axis = self.axes.get(self.config.sequencer_x_axis)
@@ -290,6 +833,8 @@ class Sequencer:
             filename: path to filename
         """
         self.sequence_state = SequenceState.NOT_READY
+        self.sequence_file = filename
+        self.journal = None
         with open(filename) as f:
             # reset the sequence
             self.sequence = list()
@@ -306,9 +851,232 @@ class Sequencer:
                 for i, col in enumerate(line.split(",")):
                     d[headers[i]] = [float(x) for x in col.split()]
                 self.sequence.append(d)
+            self.plan = list(range(len(self.sequence)))
+            if self.config.sequencer_reorder and self.sequence:
+                self.plan_sequence()
             if self.is_sequence_runnable() is True:
                 self.sequence_state = SequenceState.READY
 
+    def motion_models(self) -> dict[str, MotionModel]:
+        """Motion models of the monochromator and axes, by sequence column name
+
+        From the [sequencer.planner] kinematics, and the Galil drive settings.
+        """
+        planner = self.config.sequencer_planner
+        overhead = planner["monochromator_overhead"]
+        counts = self.config.galil_drive_counts_per_degree
+        models = {
+            "wavelength": MotionModel(planner["slew_rate"], overhead=overhead),
+            "slit1": MotionModel(planner["slit_rate"], overhead=overhead),
+            "slit2": MotionModel(planner["slit_rate"], overhead=overhead),
+        }
+        for name in self.config.zaber_axis_names:
+            models[name] = MotionModel(
+                planner["zaber_speed"],
+                planner["zaber_accel"],
+                planner["zaber_settle_time"],
+            )
+        for name in self.config.galil_axis_names:
+            models[name] = MotionModel(
+                self.config.galil_move_speed / counts,
+                self.config.galil_acceleration / counts,
+                planner["galil_settle_time"],
+            )
+        return models
+
+    def current_positions(self) -> dict[str, list[float]]:
+        """Where the monochromator and axes are now, as a sequence row"""
+        positions: dict[str, list[float]] = {
+            "wavelength": [self.monochromator.current_wavelength],
+            "slit1": [self.monochromator.current_slit1],
+            "slit2": [self.monochromator.current_slit2],
+        }
+        for name, axis in self.axes.items():
+            positions[name] = [axis.position]
+        return positions
+
+    def plan_sequence(self):
+        """Order the sequence rows to minimize the time moving between them,
+        starting from where the monochromator and axes are now"""
+        start = self.current_positions()
+        times = transition_times([start] + self.sequence, self.motion_models())
+        path = plan_order(times)
+        before = path_time(times, list(range(len(times))))
+        after = path_time(times, path)
+        self.plan = [r - 1 for r in path[1:]]
+        print(
+            f"Sequence planned: predicted move time {before:.1f} s"
+            f" in file order, {after:.1f} s reordered"
+        )
+
+    def estimate_sequence(self) -> SequenceEstimate:
+        """Estimate how long the sequence takes to run, in its planned order
+
+        Plays the rows against the durations of past steps in the timing log,
+        falling back to the motion models and camera settings where there are too
+        few. As in run_sequence, the monochromator and axes move to each row
+        together, then the row is centered, focused and captured; files are
+        written in the background.
+
+        Returns estimate
+        """
+        begin = time.perf_counter()
+        log = self.timing_log
+        models = self.motion_models()
+        estimate = SequenceEstimate(len(self.plan))
+        rows = [self.current_positions()] + [self.sequence[r] for r in self.plan]
+        n = len(rows) - 1
+        if n == 0:
+            return estimate
+
+        def has(name: str) -> bool:
+            return all(name in row for row in rows)
+
+        def distances(name: str) -> np.ndarray:
+            return np.abs(np.diff([row[name][0] for row in rows]))
+
+        def move_time(name: str, d: np.ndarray) -> np.ndarray:
+            coef = log.fit("move", name)
+            if coef is not None:
+                return np.where(d > 0, coef[0] + coef[1] * d, 0.0)
+            if name not in estimate.defaults:
+                estimate.defaults.append(name)
+            return models[name].time(d) if name in models else np.zeros_like(d)
+
+        # frame: exposure and readout
+        if self.camera:
+            exposure = self.camera.exposure_time
+        else:
+            exposure = self.config.camera_exposure_time
+        coef = log.fit("frame")
+        frame = log.mean("frame", size=exposure)
+        if coef is not None:
+            frame = coef[0] + coef[1] * exposure
+        elif frame is None:
+            estimate.defaults.append("frame")
+            frame = exposure / 1000 + 1 / self.config.camera_fps
+
+        # moves to each row, limited by the monochromator or the slowest axis
+        mono = np.zeros(n)
+        if all(has(c) for c in MONOCHROMATOR):
+            coef = log.fit("monochromator", terms=3)
+            if coef is not None:
+                slits = distances("slit1") + distances("slit2")
+                mono = coef[0] + coef[1] * distances("wavelength") + coef[2] * slits
+            else:
+                estimate.defaults.append("monochromator")
+                mono = sum(models[c].time(distances(c)) for c in MONOCHROMATOR)
+        devices = ["monochromator"]
+        times = [mono]
+        for name in self.axes:
+            if has(name):
+                devices.append(name)
+                times.append(move_time(name, distances(name)))
+        transition = np.max(times, axis=0)
+        axes_move = np.max(times[1:], axis=0) if len(times) > 1 else np.zeros(n)
+        limiting = np.argmax(times, axis=0)[transition > 0]
+        n_limited = np.bincount(limiting, minlength=len(devices))
+        estimate.limiting = {d: int(c) for d, c in zip(devices, n_limited) if c}
+
+        # centering: a frame, then a short move
+        center = log.mean("center")
+        if center is None:
+            estimate.defaults.append("center")
+            center = frame
+            if self.config.sequencer_x_axis in self.axes:
+                center += move_time(self.config.sequencer_x_axis, np.array([0.01]))[0]
+
+        # focus: the focus model predicts once it has 3 results, one more each row
+        strategy = self.config.focus_strategy
+        full = log.mean("focus", strategy, size=0.0)
+        if full is None:
+            estimate.defaults.append("focus")
+            full = self.grid_focus_time(frame, move_time)
+        near = log.mean("focus", strategy, size=1.0)
+        if near is None:
+            near = full
+        if self.focus_model is not None and has("wavelength") and has("order"):
+            predicted = len(self.focus_model) + np.arange(n) >= 3
+        else:
+            predicted = np.zeros(n, dtype=bool)
+        focus = np.where(predicted, near, full)
+
+        # delta focus images: a z move from focus or the last image, and a frame
+        dfocus = [row.get("dfocusz", []) for row in rows[1:]]
+        counts = np.array([len(p) for p in dfocus])
+        first = np.cumsum(counts) - counts
+        row_index = np.repeat(np.arange(n), counts)
+        offsets = np.fromiter(itertools.chain.from_iterable(dfocus), float)
+        z_distance = np.abs(np.diff(offsets, prepend=0.0))
+        z_distance[first[counts > 0]] = np.abs(offsets[first[counts > 0]])
+        if self.config.sequencer_z_axis in self.axes:
+            z_move = move_time(self.config.sequencer_z_axis, z_distance)
+        else:
+            z_move = np.zeros(len(z_distance))
+        piece = z_move + frame
+        capture_d = np.bincount(row_index, piece, minlength=n)
+
+        # rows run one after another
+        row_time = transition + center + focus + frame + capture_d
+        capture_start = np.cumsum(row_time) - frame - capture_d
+        end = float(capture_start[-1] + frame + capture_d[-1])
+        # files are submitted after each frame, and written one at a time
+        before = np.concatenate([[0.0], np.cumsum(piece)])
+        within = before[1:] - np.repeat(before[first], counts)
+        submitted = np.sort(
+            np.concatenate(
+                [capture_start + frame, capture_start[row_index] + frame + within]
+            )
+        )
+        write = log.mean("write")
+        if write is None:
+            estimate.defaults.append("write")
+            write = 0.05
+        estimate.total = max(end, writer_finish(submitted, write))
+
+        estimate.substates = {
+            SequenceSubstate.WAVELENGTH: float(np.sum(mono)),
+            SequenceSubstate.MOVE: float(np.sum(axes_move)),
+            SequenceSubstate.CENTER: float(n * center),
+            SequenceSubstate.FOCUS: float(np.sum(focus)),
+            SequenceSubstate.CAPTURE_F: float(n * frame),
+            SequenceSubstate.CAPTURE_D: float(np.sum(capture_d)),
+        }
+        mono_limited = mono >= axes_move
+        estimate.critical = dict(estimate.substates)
+        estimate.critical[SequenceSubstate.WAVELENGTH] = float(
+            np.sum(mono[mono_limited])
+        )
+        estimate.critical[SequenceSubstate.MOVE] = float(
+            np.sum(axes_move[~mono_limited])
+        )
+        estimate.critical["Write Files"] = estimate.total - end
+        estimate.compute_time = time.perf_counter() - begin
+        return estimate
+
+    def grid_focus_time(
+        self, frame: float, move_time: Callable[[str, np.ndarray], np.ndarray]
+    ) -> float:
+        """Time for the grid focus strategy to search the full z range
+
+        Args:
+            frame: time to take a frame
+            move_time: function of (axis name, distances) giving move times
+        """
+        z_name = self.config.sequencer_z_axis
+        ppp = self.config.focus_points_per_pass
+        limits = self.config.motion_limits.get(z_name, {"min": 0.0, "max": 0.0})
+        step = (limits["max"] - limits["min"]) / (ppp - 1)
+        total = 0.0
+        # each pass searches 2 steps of the last; stop if that doesn't narrow it
+        while step >= self.config.focus_minimum_move and ppp > 3:
+            move = 0.0
+            if z_name in self.axes:
+                move = move_time(z_name, np.array([step]))[0]
+            total += ppp * (move + self.config.focus_frames_per_point * frame)
+            step = 2 * step / (ppp - 1)
+        return total
+
     def is_sequence_runnable(self):
         """Check if the sequence can be run"""
         if len(self.sequence) == 0:
@@ -326,12 +1094,20 @@ class Sequencer:
         else:
             return True
 
-    async def run_sequence(self, output_dir: str):
+    async def run_sequence(self, output_dir: str, dry_run: bool = False):
         """Run sequence and store data in output directory
 
+        Each row is a pipeline of steps, see add_row_steps, so the monochromator
+        and axes move together, and files are written while the next row starts.
+
         Args:
             output_dir: path to output directory
+            dry_run: if True, only print how long the sequence would take, see
+                estimate_sequence
         """
+        if dry_run:
+            print(self.estimate_sequence())
+            return
 
         # check for necessary devices and sequence
         # already checked by read_input_file, so shouldn't happen
@@ -340,103 +1116,344 @@ class Sequencer:
             return
 
         self.sequence_state = SequenceState.RUN
+        self.sequence_error = ""
+        self.n_failed_writes = self.data_writer.n_failed
+        n_written = self.data_writer.n_written
         # set camera to trigger mode
         self.old_camera_mode = self.camera.run_mode
         await self.camera.set_mode(run_mode=Camera.TRIGGER, write_now=True)
 
+        # image sequence numbers follow file order, whatever order rows run in
+        first_numbers = []
         j = 1  # image sequence number
-        for self.sequence_iteration, row in enumerate(self.sequence):
-            ## 0) update parameters and status text
-            if not await self.sequence_housekeeping(SequenceSubstate.START):
-                return
-            order = int(row["order"][0])
-            wavel = row["wavelength"][0]
-            self.config.sequence_number = j
-            self.config.sequence_order = order
-
-            ## 1) set monochromator wavelength and slit
-            if not await self.sequence_housekeeping(SequenceSubstate.WAVELENGTH):
-                return
-            self.monochromator.target_wavelength = wavel
-            self.monochromator.target_slit1 = row["slit1"][0]
-            self.monochromator.target_slit2 = row["slit2"][0]
-            self.monochromator.q.put(self.monochromator.go_to_target_wavelength)
-            self.monochromator.q.put(self.monochromator.go_to_slit1)
-            self.monochromator.q.put(self.monochromator.go_to_slit2)
-            await self.monochromator.wait_for_wavelength_and_slits()
-
-            ## 2) move to position
-            for col in row:
-                if not await self.sequence_housekeeping(SequenceSubstate.MOVE):
-                    return
-                # match header with motion axis, then move to position
-                a = self.axes.get(col)
-                if a:
-                    await a.move_absolute(row[col][0])
-
-            ## 3) take full-frame image for centroid, compute centroid, center image
-            if not await self.sequence_housekeeping(SequenceSubstate.CENTER):
-                return
-            frame = await self.take_image(self.camera)
-            self.config.image_use_roi_stats = False
-            centroid, _, _, _ = self.compute_image_stats(frame)
-            image_size = (frame.img_array.shape[1], frame.img_array.shape[0])
-            await self.center(image_size, centroid)
-
-            ## 4) find best focus, using ROI
-            self.config.image_use_roi_stats = True
-            if not await self.sequence_housekeeping(SequenceSubstate.FOCUS):
-                return
-            await self.focus()
-
-            ## 5) take at-focus image, save, and increment sequence
-            if not await self.sequence_housekeeping(SequenceSubstate.CAPTURE_F):
-                return
-            self.config.camera_frame = await self.take_image(self.camera)
-            t = Time.now()
-            datestr = f"{t.ymdhms[0]:04}{t.ymdhms[1]:02}{t.ymdhms[2]:02}"
-            # example name "gclef_ait_20240131_ait_005_007_08500_f.fits"
-            # means date is 2024-01-31, order = 7, wavelen = 8500nm
-            #       5th observation in sequence, "f" for in-focus
-            letter = "f"
-            basename = (
-                f"gclef_ait_{datestr}_{j:03}_{order:03}_{round(wavel):05}_{letter}.fits"
+        for row in self.sequence:
+            first_numbers.append(j)
+            # in-focus image, then the delta focus images
+            j += 1 + len(row["dfocusz"])
+        if self.journal is None:
+            self.journal = SequenceJournal(
+                output_dir, self.sequence, self.plan, first_numbers, self.sequence_file
             )
-            filename = os.path.join(output_dir, basename)
-            self.data_writer.write_fits_file(filename, self.config)
-            j += 1
-            self.config.sequence_number = j
-
-            ## 6) intra- and extra- focus positions
-            z_axis = self.axes.get(self.config.sequencer_z_axis)
-            if z_axis:
-                # for each z position in the delta focus list
-                for p in row["dfocusz"]:
-                    if not await self.sequence_housekeeping(SequenceSubstate.CAPTURE_D):
-                        return
-                    ### 6.1) move to position
-                    await z_axis.move_absolute(p + self.config.focus_position)
-                    ### 6.2) take image
-                    frame = await self.take_image(self.camera)
-                    self.config.camera_frame = frame
-                    ### 6.3) compute image statistics
-                    centroid, _, _, _ = self.compute_image_stats(frame)
-                    ### 6.4) save and increment sequence
-                    # "i" for intra-focus (dfocusz > 0); "e" for extra-focus
-                    letter = "f" if p == 0 else "i" if p < 0 else "e"
-                    basename = f"gclef_ait_{datestr}_{j:03}_{order:03}_{round(wavel):05}_{letter}.fits"
-                    filename = os.path.join(output_dir, basename)
-                    self.data_writer.write_fits_file(filename, self.config)
-                    j += 1
-                    self.config.sequence_number = j
+            self.journal.save()
+        pipeline = Pipeline()
+        for i, r in enumerate(self.plan):
+            j = self.journal.first_numbers[r]
+            self.add_row_steps(pipeline, i, r, j, output_dir)
+        try:
+            completed = await pipeline.run()
+        except Exception as e:
+            self.sequence_error = f"Error in sequence: {e}"
+            await self.end_aborted_sequence()
+            raise
+        if not completed:
+            await self.end_aborted_sequence()
+            return
+        print(pipeline.summary())
 
         if not await self.sequence_housekeeping(SequenceSubstate.FINISHED):
+            await self.end_aborted_sequence()
+            return
+
+        # wait for files to be written
+        await self.data_writer.flush()
+        print(self.data_writer.latency_summary())
+        if self.data_writer.n_failed > self.n_failed_writes:
+            self.abort_on_write_errors()
+            await self.end_aborted_sequence()
             return
+        # write times of this run's files, the most recent of the latencies
+        latencies = list(self.data_writer.latencies)
+        n_files = self.data_writer.n_written - n_written
+        n_files = min(n_files, len(latencies), self.timing_log.keep)
+        for _, write_time in latencies[len(latencies) - n_files :]:
+            self.timing_log.add("write", "", write_time)
 
         # restore previous camera mode
         await self.camera.set_mode(run_mode=self.old_camera_mode, write_now=True)
+        self.journal = None
         self.sequence_state = SequenceState.FINISHED
 
+    async def resume_sequence(self, output_dir: str):
+        """Resume an interrupted sequence from the journal in its output directory
+
+        Rows whose files are all written are skipped, and the rest are run in
+        their planned order, keeping their image numbers; rows which were focused
+        go back to their focus position instead of focusing again.
+
+        Args:
+            output_dir: path to output directory of the interrupted run
+        """
+        journal = SequenceJournal.load(output_dir)
+        if journal is None:
+            self.sequence_state = SequenceState.NOT_READY
+            return
+        self.sequence = journal.sequence
+        self.sequence_file = journal.sequence_file
+        self.plan = journal.remaining()
+        self.journal = journal
+        print(
+            f"Resuming sequence: {len(journal.plan) - len(self.plan)} of"
+            f" {len(journal.plan)} rows complete in {output_dir}"
+        )
+        if not self.plan:
+            self.journal = None
+            self.sequence_state = SequenceState.FINISHED
+            return
+        if not self.is_sequence_runnable():
+            self.journal = None
+            self.sequence_state = SequenceState.NOT_READY
+            return
+        await self.run_sequence(output_dir)
+
+    def add_row_steps(
+        self, pipeline: Pipeline, i: int, r: int, j: int, output_dir: str
+    ) -> None:
+        """Add the steps of a sequence row to the pipeline
+
+        The monochromator and all the axes in the row move at the same time. Centering,
+        focusing and capturing need the light and all the axes to stay still, so
+        they wait for the moves, and the next row's moves wait for them; the images
+        are written in the background.
+
+        Args:
+            pipeline: pipeline of the sequence
+            i: place of row in the order rows are run in
+            r: index of row in the sequence
+            j: sequence number of the row's first image
+            output_dir: path to output directory
+        """
+        row = self.sequence[r]
+        still = ("camera", "monochromator", *self.axes)
+        pipeline.add(
+            f"wavelength[{i}]",
+            lambda: self.set_wavelength(i, row),
+            uses=("monochromator",),
+        )
+        # match headers with motion axes
+        positions = {col: row[col][0] for col in row if col in self.axes}
+        pipeline.add(
+            f"move[{i}]",
+            lambda: self.move_axes(i, positions),
+            uses=tuple(positions),
+        )
+        pipeline.add(
+            f"center[{i}]",
+            lambda: self.center_row(i),
+            after=(f"wavelength[{i}]", f"move[{i}]"),
+            uses=still,
+        )
+        pipeline.add(
+            f"focus[{i}]",
+            lambda: self.focus_row(i, r, row),
+            after=(f"center[{i}]",),
+            uses=still,
+        )
+        pipeline.add(
+            f"capture[{i}]",
+            lambda: self.capture_row(i, r, row, j, output_dir),
+            after=(f"focus[{i}]",),
+            uses=still,
+        )
+
+    async def row_housekeeping(self, i: int, substate: SequenceSubstate) -> bool:
+        """Housekeeping at the start of a step of row i, see sequence_housekeeping"""
+        self.sequence_iteration = i
+        return await self.sequence_housekeeping(substate)
+
+    async def set_wavelength(self, i: int, row: dict[str, list[float]]) -> bool:
+        """Set monochromator wavelength and slits of row i
+
+        Returns False on abort
+        """
+        if not await self.row_housekeeping(i, SequenceSubstate.START):
+            return False
+        if not await self.row_housekeeping(i, SequenceSubstate.WAVELENGTH):
+            return False
+        start = time.perf_counter()
+        mono = self.monochromator
+        wavelength_change = abs(row["wavelength"][0] - mono.current_wavelength)
+        slit_change = abs(row["slit1"][0] - mono.current_slit1) + abs(
+            row["slit2"][0] - mono.current_slit2
+        )
+        self.monochromator.target_wavelength = row["wavelength"][0]
+        self.monochromator.target_slit1 = row["slit1"][0]
+        self.monochromator.target_slit2 = row["slit2"][0]
+        self.monochromator.q.put(self.monochromator.go_to_target_wavelength)
+        self.monochromator.q.put(self.monochromator.go_to_slit1)
+        self.monochromator.q.put(self.monochromator.go_to_slit2)
+        await self.monochromator.wait_for_wavelength_and_slits()
+        self.timing_log.add(
+            "monochromator",
+            "",
+            time.perf_counter() - start,
+            wavelength_change,
+            slit_change,
+        )
+        return True
+
+    async def move_axes(self, i: int, positions: dict[str, float]) -> bool:
+        """Move axes to their positions in row i, all at once
+
+        Returns False on abort
+        """
+        if not await self.row_housekeeping(i, SequenceSubstate.MOVE):
+            return False
+        distances = {n: abs(p - self.axes[n].position) for n, p in positions.items()}
+        results = await move_many({self.axes[n]: p for n, p in positions.items()})
+        for name, axis in zip(positions, results):
+            result = results[axis]
+            if result.error:
+                print(f"Error moving {axis.name} to {result.target}")
+            else:
+                self.timing_log.add("move", name, result.duration, distances[name])
+        return True
+
+    async def center_row(self, i: int) -> bool:
+        """Take full-frame image, compute centroid, and center image
+
+        Returns False on abort
+        """
+        if not await self.row_housekeeping(i, SequenceSubstate.CENTER):
+            return False
+        start = time.perf_counter()
+        frame = await self.take_image(self.camera)  # type: ignore
+        self.config.image_use_roi_stats = False
+        centroid, _, _, _ = await self.compute_image_stats(frame)
+        image_size = (frame.img_array.shape[1], frame.img_array.shape[0])
+        await self.center(image_size, centroid)
+        self.timing_log.add("center", "", time.perf_counter() - start)
+        return True
+
+    async def focus_row(self, i: int, r: int, row: dict[str, list[float]]) -> bool:
+        """Find best focus of row i, using ROI
+
+        A row focused before the sequence was interrupted goes back to its focus
+        position from the journal instead.
+
+        Args:
+            i: place of row in the order rows are run in
+            r: index of row in the sequence
+            row: sequence row
+
+        Returns False on abort
+        """
+        self.config.image_use_roi_stats = True
+        if not await self.row_housekeeping(i, SequenceSubstate.FOCUS):
+            return False
+        z_axis = self.axes.get(self.config.sequencer_z_axis)
+        cached = self.journal.rows[r].focus if self.journal else None
+        if cached is not None and z_axis:
+            await z_axis.move_absolute(cached)
+            self.config.focus_position = cached
+            return True
+        position = await self.focus(row["wavelength"][0], int(row["order"][0]))
+        if self.journal and position != -1 and not self.abort:
+            self.journal.set_focus(r, position)
+        return True
+
+    async def capture_row(
+        self, i: int, r: int, row: dict[str, list[float]], j: int, output_dir: str
+    ) -> bool:
+        """Take and save the in-focus and delta focus images of row i, and record
+        the row's files in the journal once they're written
+
+        Args:
+            i: place of row in the order rows are run in
+            r: index of row in the sequence
+            row: sequence row
+            j: sequence number of the first image
+            output_dir: path to output directory
+
+        Returns False on abort
+        """
+        order = int(row["order"][0])
+        wavel = row["wavelength"][0]
+        self.config.sequence_number = j
+        self.config.sequence_order = order
+
+        ## take at-focus image, save, and increment sequence
+        if not await self.row_housekeeping(i, SequenceSubstate.CAPTURE_F):
+            return False
+        self.config.camera_frame = await self.timed_image(self.camera)  # type: ignore
+        # the next row's moves and images overlap with writing this row's,
+        # so the writer gets its own copy of each frame
+        record = self.data_writer.capture(self.config, copy=True)
+        t = Time.now()
+        datestr = f"{t.ymdhms[0]:04}{t.ymdhms[1]:02}{t.ymdhms[2]:02}"
+        # example name "gclef_ait_20240131_ait_005_007_08500_f.fits"
+        # means date is 2024-01-31, order = 7, wavelen = 8500nm
+        #       5th observation in sequence, "f" for in-focus
+        letter = "f"
+        basename = (
+            f"gclef_ait_{datestr}_{j:03}_{order:03}_{round(wavel):05}_{letter}.fits"
+        )
+        filename = os.path.join(output_dir, basename)
+        row_filename = None
+        if self.config.sequencer_output == "row":
+            # or one file for the row, e.g. "gclef_ait_20240131_005_007_08500.fits",
+            # with extensions named by letter
+            row_filename = filename.removesuffix(f"_{letter}.fits") + ".fits"
+            written = [
+                await self.data_writer.submit(row_filename, record, extname=letter)
+            ]
+            files = [row_filename]
+        else:
+            written = [await self.data_writer.submit(filename, record)]
+            files = [filename]
+        j += 1
+        self.config.sequence_number = j
+
+        ## intra- and extra- focus positions
+        z_axis = self.axes.get(self.config.sequencer_z_axis)
+        if z_axis:
+            # for each z position in the delta focus list
+            for p in row["dfocusz"]:
+                if not await self.row_housekeeping(i, SequenceSubstate.CAPTURE_D):
+                    return False
+                ### move to position
+                start = time.perf_counter()
+                distance = abs(p + self.config.focus_position - z_axis.position)
+                await z_axis.move_absolute(p + self.config.focus_position)
+                self.timing_log.add(
+                    "move", z_axis.name, time.perf_counter() - start, distance
+                )
+                ### take image
+                frame = await self.timed_image(self.camera)  # type: ignore
+                self.config.camera_frame = frame
+                record = self.data_writer.capture(self.config, copy=True)
+                ### compute image statistics, of the copy so the writer can use them
+                centroid, _, _, _ = await self.compute_image_stats(
+                    record.frame  # type: ignore
+                )
+                ### save and increment sequence
+                # "i" for intra-focus (dfocusz > 0); "e" for extra-focus
+                letter = "f" if p == 0 else "i" if p < 0 else "e"
+                basename = f"gclef_ait_{datestr}_{j:03}_{order:03}_{round(wavel):05}_{letter}.fits"
+                filename = os.path.join(output_dir, basename)
+                if row_filename:
+                    written.append(
+                        await self.data_writer.submit(
+                            row_filename, record, extname=letter
+                        )
+                    )
+                else:
+                    written.append(await self.data_writer.submit(filename, record))
+                    files.append(filename)
+                j += 1
+                self.config.sequence_number = j
+        if row_filename:
+            written.append(await self.data_writer.finish_file(row_filename))
+        if self.journal:
+            # the row is only complete once the writer has written all its files
+            journal = self.journal
+
+            def row_written(future: asyncio.Future):
+                if not future.cancelled() and all(future.result()):
+                    journal.finish_row(r, files)
+
+            asyncio.gather(*written).add_done_callback(row_written)
+        return True
+
     def abort_sequence(self):
         """Abort running sequence"""
         self.abort = True
@@ -444,23 +1461,43 @@ class Sequencer:
     async def sequence_housekeeping(self, substate: SequenceSubstate):
         """Housekeeping to update the GUI
 
+        Once the sequence is aborted, returns False to every step, including steps
+        already running on other devices; run_sequence cleans up once they stop,
+        see end_aborted_sequence.
+
         Args:
             substate: sequence substate
 
         Returns True unless abort
         """
         self.sequence_substate = substate
+        failed = self.data_writer.n_failed > self.n_failed_writes
+        if failed and self.sequence_state != SequenceState.ABORT:
+            # stop rather than lose more data
+            self.abort_on_write_errors()
         if self.abort:
-            self.sequence_state = SequenceState.ABORT
-            self.sequence.clear()
-            if self.camera:
-                await self.camera.set_mode(
-                    run_mode=self.old_camera_mode, write_now=True
-                )
             self.abort = False  # reset abort signal
-            return False
-        else:
-            return True
+            self.sequence_state = SequenceState.ABORT
+        return self.sequence_state != SequenceState.ABORT
+
+    def abort_on_write_errors(self):
+        """Abort the sequence because files failed to write"""
+        n = self.data_writer.n_failed - self.n_failed_writes
+        self.sequence_error = f"{n} files not written. {self.data_writer.last_error}"
+        print(self.sequence_error)
+        self.sequence_state = SequenceState.ABORT
+
+    async def end_aborted_sequence(self):
+        """Clean up after an aborted sequence, keeping images already taken"""
+        self.sequence_state = SequenceState.ABORT
+        await self.data_writer.finish_files()
+        await self.data_writer.flush()
+        self.sequence.clear()
+        self.plan.clear()
+        # the journal stays in the output directory, to resume from
+        self.journal = None
+        if self.camera:
+            await self.camera.set_mode(run_mode=self.old_camera_mode, write_now=True)
 
     async def take_image(self, camera: Camera):
         """Take image for use in sequencer.
@@ -471,20 +1508,34 @@ class Sequencer:
         Returns frame
         """
         await camera.clear_buffer()
-        await camera.trigger()
-        # wait for frame
         while True:
+            await camera.trigger()
             try:
-                frame = camera.get_newest_frame()
-                break
-            except IndexError:
-                # sleep is necessary to give other tasks time to process
-                await asyncio.sleep(0.1)
-                continue
+                # wait for the triggered frame, allowing for exposure and download
+                return await camera.wait_for_frame(
+                    after=camera.last_trigger_time,
+                    timeout=camera.exposure_time / 1000 + 2.0,
+                )
+            except TimeoutError:
+                print("No frame from camera, triggering again")
+
+    async def timed_image(self, camera: Camera):
+        """Take image, and log how long it took
+
+        Args:
+            camera: Camera, not None
+
+        Returns frame
+        """
+        start = time.perf_counter()
+        frame = await self.take_image(camera)
+        self.timing_log.add(
+            "frame", "", time.perf_counter() - start, camera.exposure_time
+        )
         return frame
 
-    def compute_image_stats(self, frame: Frame):
-        """Compute image statistics for use in sequencer.
+    async def compute_image_stats(self, frame: Frame):
+        """Compute image statistics for use in sequencer, on the analysis pool.
 
         Args:
             frame: captured image frame
@@ -493,17 +1544,15 @@ class Sequencer:
         """
         # use ROI if selected
         if self.config.image_use_roi_stats:
-            image_array = roi_copy(frame.img_array, self.config.roi_size)
+            roi_size = self.config.roi_size
             threshold = self.config.image_roi_threshold
         else:
-            image_array = frame.img_array
+            roi_size = None
             threshold = self.config.image_full_threshold
 
-        centroid, fwhm, max_value, n_saturated = image_math(
-            image_array,
-            frame.bits,
-            threshold,
-            self.config.image_fwhm_method,
+        # shared with the camera panel and data writer, so each frame is done once
+        centroid, fwhm, max_value, n_saturated = await self.analysis.stats.get(
+            frame, threshold, roi_size, self.config.image_fwhm_method
         )
         # translate to full-frame pixel coordinates
         if self.config.image_use_roi_stats:
@@ -516,3 +1565,60 @@ class Sequencer:
         self.config.image_n_saturated = n_saturated
 
         return centroid, fwhm, max_value, n_saturated
+
+    async def compute_stack_stats(self, frames: list[Frame], coadd: bool = False):
+        """Compute image statistics of several frames at once for use in sequencer,
+        on the analysis pool.
+
+        Args:
+            frames: captured image frames, all the same size and bits
+            coadd: compute statistics of the average of the frames instead
+
+        Returns centroids, fwhms, max_values, n_saturated as arrays, one entry per
+        frame (or one entry if coadd)
+        """
+        # use ROI if selected
+        if self.config.image_use_roi_stats:
+            box = get_roi_box((frames[0].rows, frames[0].cols), self.config.roi_size)
+            image_stack = np.stack(
+                [f.img_array[box[1] : box[3], box[0] : box[2]] for f in frames]
+            )
+            threshold = self.config.image_roi_threshold
+        else:
+            image_stack = np.stack([f.img_array for f in frames])
+            threshold = self.config.image_full_threshold
+
+        centroids, fwhms, max_values, n_saturated = await self.analysis.submit(
+            image_math_stack,
+            image_stack,
+            frames[0].bits,
+            threshold,
+            self.config.image_fwhm_method,
+            coadd,
+        )
+        # keep statistics of each frame for reuse
+        if not coadd:
+            roi_size = self.config.roi_size if self.config.image_use_roi_stats else None
+            for i, frame in enumerate(frames):
+                self.analysis.stats.put(
+                    frame,
+                    threshold,
+                    roi_size,
+                    self.config.image_fwhm_method,
+                    (
+                        (float(centroids[i][0]), float(centroids[i][1])),
+                        float(fwhms[i]),
+                        int(max_values[i]),
+                        int(n_saturated[i]),
+                    ),
+                )
+        # translate to full-frame pixel coordinates
+        if self.config.image_use_roi_stats:
+            centroids = centroids + (box[0], box[1])
+        # store values of the last frame for GUI to see
+        self.config.image_centroid = (float(centroids[-1][0]), float(centroids[-1][1]))
+        self.config.image_fwhm = float(fwhms[-1])
+        self.config.image_max_value = int(max_values[-1])
+        self.config.image_n_saturated = int(n_saturated[-1])
+
+        return centroids, fwhms, max_values, n_saturated
@@ -1,170 +1,584 @@
-import copy
+import asyncio
 import random
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 
 import numpy as np
 from astropy.io import fits
 from astropy.time import Time
-from PIL import Image
-
-from ..devices.DkMonochromator import DkMonochromator
 
 from ..devices.Axis import Axis
+from ..devices.DkMonochromator import DkMonochromator
 from ..devices.MightexBufCmos import Camera, Frame
-from ..functions.image import find_centroid, find_full_width_half_max, threshold_copy
+from ..functions.analysis import AnalysisPool
+from ..functions.image import get_roi_box, image_math, roi_copy
+from ..functions.index import ObservationIndex
 from ..gui.config import Configuration
 
 
+@dataclass(frozen=True, slots=True)
+class CaptureRecord:
+    """Everything needed to write one FITS file, captured at save time
+
+    Holds a reference to the frame, not a copy of its pixels, so it's cheap to make.
+    """
+
+    frame: Frame | None  # camera frame, or None to use image
+    image: np.ndarray | None  # displayed image, used when there's no camera frame
+    detector: str
+    pixel_size: tuple[float, float]
+    version: str
+    obstype: str
+    target: str
+    wavelength: float
+    slit1: float
+    slit2: float
+    sequence_number: int
+    sequence_order: int
+    focus_position: float
+    z_position: float  # position of sequencer z axis
+    axes: tuple[tuple[str, float, str, str], ...]  # (keyword, position, units, name)
+    threshold: float  # image statistics settings
+    roi_size: tuple[int, int] | None  # None for full frame
+    fwhm_method: str
+    captured: float = field(default_factory=time.perf_counter)
+
+    @property
+    def data(self) -> np.ndarray:
+        """Image pixels"""
+        if self.frame is not None:
+            return self.frame.img_array
+        return self.image  # type: ignore
+
+    @property
+    def bits(self) -> int:
+        """Image bit depth"""
+        return self.frame.bits if self.frame is not None else 8
+
+
+@dataclass(slots=True)
+class ExtensionFile:
+    """A multi-extension FITS file being written, one image extension at a time"""
+
+    hdul: fits.HDUList  # opened for appending
+    primary: fits.Header  # headers common to all images
+    # (extname, extver, obs_id, date-obs, dfocusz) of each image extension
+    index: list[tuple[str, int, str, str, float]] = field(default_factory=list)
+
+
 class DataWriter:
+    # lossless tile compression algorithms
+    COMPRESSION = {"none": None, "rice": "RICE_1", "gzip": "GZIP_2"}
+
     def __init__(
         self,
         camera: Camera | None,
         axes: dict[str, Axis],
         monochromator: DkMonochromator,
+        analysis: AnalysisPool | None = None,
+        max_queue: int = 4,
+        compression: str = "none",
+        tile_size: tuple[int, int] = (1280, 16),
+        index_path: str = "",
     ) -> None:
+        """Writes FITS files, in the background or immediately
+
+        Args:
+            camera: camera device, for detector name
+            axes: dict of all motion axes
+            monochromator: monochromator device
+            analysis: worker pool whose cached image statistics are used for headers
+            max_queue: number of files which may wait to be written before submit waits
+            compression: "none", or lossless tile compression "rice" or "gzip"
+            tile_size: (x_size, y_size) of compression tiles, in pixels
+            index_path: filename of observation index database, or "" for no index
+        """
         self.camera = camera
         self.axes = axes
         self.monochromator = monochromator
+        self.analysis = analysis
+        self.compression = DataWriter.COMPRESSION.get(compression)
+        self.tile_size = tile_size
+        self.index = ObservationIndex(index_path) if index_path else None
+
+        # background writing, one file at a time on the writer thread
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="writer")
+        # (filename, record, extension name, future), or (filename, None, None,
+        # future) to finish a multi-extension file; the future is True once written
+        self.queue: asyncio.Queue[
+            tuple[str, CaptureRecord | None, str | None, asyncio.Future[bool]]
+        ] = asyncio.Queue(max(max_queue, 1))
+        # multi-extension files, by filename: submitted to, and open on the writer
+        self.open_files: set[str] = set()
+        self.extension_files: dict[str, ExtensionFile] = {}
+        self.worker: asyncio.Task | None = None
+        # (latency from capture until written, time to write) per file, in seconds
+        self.latencies: deque[tuple[float, float]] = deque(maxlen=1000)
+        self.n_written = 0  # images written, including extensions
+        self.n_failed = 0
+        self.last_error = ""  # message of the last failed write
+
+    async def submit(
+        self, filename: str, record: CaptureRecord, extname: str | None = None
+    ) -> asyncio.Future[bool]:
+        """Write a captured image and telemetry to a FITS file in the background
+
+        Waits while the queue is full, so that capturing can't outrun writing.
+
+        Args:
+            filename: name of fits file to be written
+            record: capture, from capture()
+            extname: if given, append the image to multi-extension file filename,
+                     as an extension with this name; finish with finish_file()
+
+        Returns future, True once the file or extension is written, or False if
+        writing it failed
+        """
+        loop = asyncio.get_running_loop()
+        if self.worker is None:
+            self.worker = loop.create_task(self.run_queue())
+        if extname:
+            self.open_files.add(filename)
+        written = loop.create_future()
+        await self.queue.put((filename, record, extname, written))
+        return written
+
+    async def finish_file(self, filename: str) -> asyncio.Future[bool]:
+        """Finish a multi-extension file after its last image, in the background
+
+        Args:
+            filename: name of fits file given to submit()
+
+        Returns future, True once the file is closed, or False if closing it failed
+        """
+        written = asyncio.get_running_loop().create_future()
+        if filename in self.open_files:
+            self.open_files.discard(filename)
+            await self.queue.put((filename, None, None, written))
+        else:
+            # nothing to finish
+            written.set_result(True)
+        return written
+
+    async def finish_files(self):
+        """Finish all multi-extension files, e.g. on abort"""
+        for filename in list(self.open_files):
+            await self.finish_file(filename)
+
+    async def flush(self):
+        """Wait until all submitted files are written"""
+        await self.queue.join()
+
+    async def run_queue(self):
+        """Write queued files one at a time on the writer thread"""
+        loop = asyncio.get_running_loop()
+        while True:
+            filename, record, extname, written = await self.queue.get()
+            try:
+                if record is None:
+                    await loop.run_in_executor(
+                        self.executor, self.finish_extension_file, filename
+                    )
+                else:
+                    stats = None
+                    if self.analysis and record.frame is not None:
+                        # usually already computed by the sequencer or camera panel
+                        stats = await self.analysis.stats.get(
+                            record.frame,
+                            record.threshold,
+                            record.roi_size,
+                            record.fwhm_method,
+                        )
+                    await loop.run_in_executor(
+                        self.executor,
+                        self.write_record,
+                        filename,
+                        record,
+                        stats,
+                        extname,
+                    )
+                written.set_result(True)
+            except Exception as e:
+                self.n_failed += 1
+                self.last_error = f"Error writing {filename}: {e}"
+                print(self.last_error)
+                written.set_result(False)
+            finally:
+                self.queue.task_done()
 
     def write_fits_file(self, filename: str, config: Configuration):
-        """Write a FITS file using most recent image and telemetry
+        """Write a FITS file using most recent image and telemetry, immediately
 
         Args:
             filename: name of fits file to be written
             config: configuration at time of save
         """
+        self.write_record(filename, self.capture(config))
 
-        # make a copy of config so it doesn't change while writing
-        self.config = copy.deepcopy(config)
+    def copy_frame(self, frame: Frame) -> Frame:
+        """Copy a frame's pixels out of the camera's frame buffer
 
-        hdu = fits.PrimaryHDU()
-        hdu.header.update(self.make_general_headers())
-        hdu.header.update(self.make_science_headers())
+        The frame is checked after it's copied, so the copy can't have been
+        overwritten partway through without it being noticed.
+
+        Returns copy; raises BufferError if the frame was overwritten
+        """
+        copy = frame.copy()
+        if self.camera:
+            with self.camera.buffer_lock:
+                held = self.camera.frame_buffer.holds(frame)
+            if not held:
+                raise BufferError("frame was overwritten before it was written")
+        return copy
+
+    def capture(self, config: Configuration, copy: bool = False) -> CaptureRecord:
+        """Take a snapshot of the image, settings and telemetry for a FITS file
+
+        Only reads values; headers and image statistics are left for the writer.
+
+        Args:
+            config: configuration at time of save
+            copy: copy the frame's pixels, for a record which may not be written
+                  before the frame buffer wraps around, e.g. one waiting on a dialog
+        """
+        z_axis = self.axes.get(config.sequencer_z_axis)
+        frame = config.camera_frame
+        if copy and frame is not None:
+            frame = self.copy_frame(frame)
+        return CaptureRecord(
+            frame=frame,
+            # only used without a camera, and small
+            image=np.array(config.full_img) if config.camera_frame is None else None,
+            detector=(
+                f"Mightex {self.camera.modelno}" if self.camera else "not_found"
+            ),
+            pixel_size=config.camera_pixel_size,
+            version=config.version,
+            obstype=config.image_obstype,
+            target=config.image_target,
+            wavelength=self.monochromator.current_wavelength,
+            slit1=self.monochromator.current_slit1,
+            slit2=self.monochromator.current_slit2,
+            sequence_number=config.sequence_number,
+            sequence_order=config.sequence_order,
+            focus_position=config.focus_position,
+            z_position=z_axis.position if z_axis else np.nan,
+            axes=tuple(
+                (a.keyword, a.position, a.units[0], a.name) for a in self.axes.values()
+            ),
+            threshold=(
+                config.image_roi_threshold
+                if config.image_use_roi_stats
+                else config.image_full_threshold
+            ),
+            roi_size=config.roi_size if config.image_use_roi_stats else None,
+            fwhm_method=config.image_fwhm_method,
+        )
+
+    def write_record(
+        self,
+        filename: str,
+        record: CaptureRecord,
+        stats: tuple[tuple[float, float], float, int, int] | None = None,
+        extname: str | None = None,
+    ):
+        """Make headers and write the FITS file
+
+        Safe to run on the writer thread.
 
-        # use frame if possible, otherwise use full_image
-        if self.config.camera_frame:
-            hdu.header.update(self.make_camera_frame_headers(self.config.camera_frame))
-            hdu.data = self.config.camera_frame.img_array
+        Args:
+            filename: name of fits file to be written
+            record: capture, from capture()
+            stats: image statistics as from image_math, or None to compute them here
+            extname: if given, append the image to multi-extension file filename,
+                     as an extension with this name
+        """
+        start = time.perf_counter()
+        frame = record.frame
+        if frame is not None:
+            if frame.serial >= 0:
+                # still in the camera's frame buffer, not already a copy
+                frame = self.copy_frame(frame)
+            data = frame.img_array
+        else:
+            data = record.data
+        if data.dtype == np.uint16:
+            # 12-bit values fit in int16, which needs no scaling, so readers
+            # can memory-map the data directly, in single and multi-extension files
+            data = data.astype(np.int16)
+        science_headers = self.make_science_headers(record)
+        if extname:
+            ext_file = self.extension_files.get(filename)
+            if ext_file is None:
+                ext_file = self.start_extension_file(filename, record, science_headers)
+            # number extensions of the same name, e.g. several intra-focus images
+            extver = 1 + sum(1 for i in ext_file.index if i[0] == extname)
+            hdu: fits.PrimaryHDU | fits.ImageHDU = fits.ImageHDU(
+                name=extname, ver=extver
+            )
+            # the rest of the science headers are in the primary header
+            for key in ["obs_id", "dfocusz"]:
+                if key in science_headers:
+                    hdu.header[key] = science_headers[key]
+        else:
+            hdu = fits.PrimaryHDU()
+            hdu.header.update(self.make_general_headers(record))
+            hdu.header.update(science_headers)
+        if frame is not None:
+            hdu.header.update(self.make_camera_frame_headers(frame, record))
         else:
-            hdu.header.update(self.make_dummy_frame_headers(self.config.full_img))
-            hdu.data = np.array(self.config.full_img)
-        hdu.header.update(self.make_axis_headers())
+            hdu.header.update(self.make_dummy_frame_headers())
+        hdu.header.update(self.make_image_headers(data, record, stats))
+        hdu.data = data
+        hdu.header.update(self.make_axis_headers(record))
+        if self.compression:
+            hdu = self.compress(hdu)
+        hdu.add_checksum()
+        if extname:
+            ext_file.hdul.append(hdu)
+            ext_file.hdul.flush(output_verify="fix")
+            ext_file.index.append(
+                (
+                    extname,
+                    extver,
+                    str(hdu.header["obs_id"]),
+                    str(hdu.header.get("date-obs", "")),
+                    record.z_position - record.focus_position,
+                )
+            )
+        elif self.compression:
+            # compressed images can only be extensions, so primary header is empty
+            primary = fits.PrimaryHDU()
+            primary.add_checksum()
+            fits.HDUList([primary, hdu]).writeto(
+                filename, overwrite=True, output_verify="fix"
+            )
+        else:
+            hdu.writeto(filename, overwrite=True, output_verify="fix")
+        if self.index:
+            try:
+                self.index.add(
+                    filename, hdu.header, ext_file.primary if extname else None
+                )
+            except sqlite3.Error as e:
+                # the file is written, so it can be indexed later with a rebuild
+                print(f"Error indexing {filename}: {e}")
+        end = time.perf_counter()
+        self.latencies.append((end - record.captured, end - start))
+        self.n_written += 1
+
+    def compress(self, hdu: fits.PrimaryHDU | fits.ImageHDU) -> fits.CompImageHDU:
+        """Make a tile-compressed copy of an image HDU, with the same headers
+
+        A compressed primary image keeps its header, as fpack does.
+        """
+        # numpy order is (y, x); tiles may be larger than the image
+        tile_shape = (self.tile_size[1], self.tile_size[0])
+        compressed = fits.CompImageHDU(
+            data=hdu.data,
+            header=hdu.header,
+            name=hdu.name if isinstance(hdu, fits.ImageHDU) else None,
+            compression_type=self.compression,
+            tile_shape=tile_shape,
+        )
+        if isinstance(hdu, fits.ImageHDU):
+            compressed.header["extver"] = hdu.ver
+        return compressed
+
+    def start_extension_file(
+        self,
+        filename: str,
+        record: CaptureRecord,
+        science_headers: dict[str, tuple[float | int | str, str]],
+    ) -> ExtensionFile:
+        """Write the primary header of a multi-extension file and keep it open
+
+        The primary header has no data, only the headers common to all images.
+
+        Args:
+            filename: name of fits file to be written
+            record: capture of the first image
+            science_headers: science headers of the first image
+        """
+        hdu = fits.PrimaryHDU()
+        hdu.header.update(self.make_general_headers(record))
+        hdu.header.update(
+            {
+                k: v
+                for k, v in science_headers.items()
+                if k not in ["obs_id", "dfocusz"]
+            }
+        )
+        hdu.header["extend"] = (True, "file contains extensions")
         hdu.add_checksum()
         hdu.writeto(filename, overwrite=True, output_verify="fix")
+        ext_file = ExtensionFile(fits.open(filename, mode="append"), hdu.header)
+        self.extension_files[filename] = ext_file
+        return ext_file
+
+    def finish_extension_file(self, filename: str):
+        """Append a table of the image extensions, and close the file
+
+        Safe to run on the writer thread.
+
+        Args:
+            filename: name of fits file given to submit()
+        """
+        ext_file = self.extension_files.pop(filename, None)
+        if ext_file is None:
+            return
+        extnames, extvers, obs_ids, dates, dfocusz = zip(*ext_file.index)
+        table = fits.BinTableHDU.from_columns(
+            [
+                fits.Column("extname", "8A", array=extnames),
+                fits.Column("extver", "J", array=extvers),
+                fits.Column("obs_id", "32A", array=obs_ids),
+                fits.Column("date-obs", "32A", array=dates),
+                fits.Column("dfocusz", "D", unit="mm", array=dfocusz),
+            ],
+            name="index",
+        )
+        table.add_checksum()
+        ext_file.hdul.append(table)
+        ext_file.hdul.close(output_verify="fix")
+
+    def latency_summary(self) -> str:
+        """Summary of recent file write latencies"""
+        if not self.latencies:
+            return "no files written"
+        latency, write = np.array(self.latencies).T
+        return (
+            f"{len(self.latencies)} files written, latency mean {latency.mean():.3f}s"
+            f" max {latency.max():.3f}s, write time mean {write.mean():.3f}s"
+        )
+
+    def close(self):
+        """Write any files still waiting, and stop the writer"""
+        if self.worker:
+            self.worker.cancel()
+        self.executor.shutdown(wait=True)
+        while not self.queue.empty():
+            filename, record, extname, _ = self.queue.get_nowait()
+            if record is not None:
+                self.write_record(filename, record, extname=extname)
+        for filename in list(self.extension_files):
+            self.finish_extension_file(filename)
+        if self.index:
+            self.index.close()
 
     def make_camera_frame_headers(
-        self, frame: Frame
+        self, frame: Frame, record: CaptureRecord
     ) -> dict[str, tuple[float | int | str, str]]:
         """Make headers related to the camera image acquisition"""
         headers: dict[str, tuple[float | int | str, str]] = {}
-        if self.camera:
-            headers["detector"] = (f"Mightex {self.camera.modelno}", "detector name")
-        else:
-            headers["detector"] = ("not_found", "detector name")
+        headers["detector"] = (record.detector, "detector name")
         headers["date-obs"] = (frame.time.fits, "observation date and time")  # type: ignore
         headers["xposure"] = (frame.expTime / 1000, "[s] exposure time")
         headers["gain"] = (frame.gGain, "[dB] detector gain")
-        pxsizex, pxsizey = self.config.camera_pixel_size
+        pxsizex, pxsizey = record.pixel_size
         headers["pxsizex"] = (pxsizex, "[um] pixel size in x dimension")
         headers["pxsizey"] = (pxsizey, "[um] pixel size in y dimension")
-        headers.update(self.make_image_headers(frame.img_array, frame.bits))
         return headers
 
-    def make_dummy_frame_headers(
-        self, img: Image.Image
-    ) -> dict[str, tuple[float | int | str, str]]:
+    def make_dummy_frame_headers(self) -> dict[str, tuple[float | int | str, str]]:
         """Make fake camera headers"""
         headers: dict[str, tuple[float | int | str, str]] = {}
         headers["detector"] = ("simulated", "detector name")
-        headers.update(self.make_image_headers(np.array(img), 8))
         return headers
 
     def make_image_headers(
-        self, img_array: np.ndarray, bits: int
+        self,
+        img_array: np.ndarray,
+        record: CaptureRecord,
+        stats: tuple[tuple[float, float], float, int, int] | None = None,
     ) -> dict[str, tuple[float | int | str, str]]:
-        """Make headers from image"""
-
-        threshold = (
-            self.config.image_roi_threshold
-            if self.config.image_use_roi_stats
-            else self.config.image_full_threshold
-        )
+        """Make headers from image
 
+        Args:
+            img_array: numpy array of image pixels
+            record: capture, for image statistics settings
+            stats: image statistics as from image_math, or None to compute them here
+        """
         headers: dict[str, tuple[float | int | str, str]] = {}
         headers["datamin"] = (float(0), "[counts] minimum possible pixel value")
         headers["datamax"] = (
-            float((1 << bits) - 1),
+            float((1 << record.bits) - 1),
             "[counts] maximum possible pixel value",
         )
         headers["threshld"] = (
-            threshold,
+            record.threshold,
             "[%] ignore pixels below this % of datamax",
         )
-        # find centroid and FWHM
-        image_copy = threshold_copy(img_array, bits, threshold)
-        centroid = find_centroid(image_copy)
-        fwhm = find_full_width_half_max(
-            image_copy, centroid, self.config.image_fwhm_method
-        )
+        # find centroid and FWHM, in the ROI if selected
+        if stats is None:
+            image = img_array
+            if record.roi_size:
+                image = roi_copy(img_array, record.roi_size)
+            stats = image_math(image, record.bits, record.threshold, record.fwhm_method)
+        centroid, fwhm, max_value, n_saturated = stats
         # skip if NaN
         if not np.isnan(centroid).any():
+            if record.roi_size:
+                # translate to full-frame pixel coordinates
+                size = (img_array.shape[1], img_array.shape[0])
+                box = get_roi_box(size, record.roi_size)
+                centroid = (centroid[0] + box[0], centroid[1] + box[1])
             headers["cenx"] = (centroid[0], "[px] centroid along x axis")
             headers["ceny"] = (centroid[1], "[px] centroid along y axis")
         if not np.isnan(fwhm):
             headers["fwhm"] = (fwhm, "[px] full width half maximum")
+        headers["pixmax"] = (int(max_value), "[counts] maximum pixel value")
+        headers["nsat"] = (int(n_saturated), "number of saturated pixels")
         return headers
 
-    def make_axis_headers(self) -> dict[str, tuple[float | int | str, str]]:
+    def make_axis_headers(
+        self, record: CaptureRecord
+    ) -> dict[str, tuple[float | int | str, str]]:
         """Make headers related to the motion axes"""
         headers: dict[str, tuple[float | int | str, str]] = {}
-        for axis in self.axes.values():
-            headers[axis.keyword] = (
-                axis.position,
-                f"[{axis.units[0]}] {axis.name} position",
-            )
+        for keyword, position, units, name in record.axes:
+            headers[keyword] = (position, f"[{units}] {name} position")
         return headers
 
-    def make_science_headers(self) -> dict[str, tuple[float | int | str, str]]:
+    def make_science_headers(
+        self, record: CaptureRecord
+    ) -> dict[str, tuple[float | int | str, str]]:
         """Make headers related to this specific experiment"""
         headers: dict[str, tuple[float | int | str, str]] = {}
-        headers["obstype"] = (self.config.image_obstype, "Type of observation taken")
-        headers["object"] = (self.config.image_target, "target of the observation")
-        headers["wavelen"] = (
-            self.monochromator.current_wavelength,
-            "[nm] wavelength being measured",
-        )
-        headers["order"] = (self.config.sequence_order, "diffraction order")
-        headers["slit1"] = (
-            self.monochromator.current_slit1,
-            "[um] monochromator slit 1 (entry) size",
-        )
-        headers["slit2"] = (
-            self.monochromator.current_slit2,
-            "[um] monochromator slit 2 (exit) size",
-        )
-        id = f"{self.config.sequence_number:03}"
-        id += f"-{self.config.sequence_order:03}"
-        id += f"-{round(self.monochromator.current_wavelength):05}"
+        headers["obstype"] = (record.obstype, "Type of observation taken")
+        headers["object"] = (record.target, "target of the observation")
+        headers["wavelen"] = (record.wavelength, "[nm] wavelength being measured")
+        headers["order"] = (record.sequence_order, "diffraction order")
+        headers["slit1"] = (record.slit1, "[um] monochromator slit 1 (entry) size")
+        headers["slit2"] = (record.slit2, "[um] monochromator slit 2 (exit) size")
+        id = f"{record.sequence_number:03}"
+        id += f"-{record.sequence_order:03}"
+        id += f"-{round(record.wavelength):05}"
         id += f"-{random.randrange(16**4):04x}"  # random hash for uniqueness
         headers["obs_id"] = (id, "unique observation ID")
-        if not np.isnan(self.config.focus_position):
+        if not np.isnan(record.focus_position):
             headers["focusz"] = (
-                self.config.focus_position,
+                record.focus_position,
                 "[mm] z-axis (focal axis) in-focus position",
             )
             headers["dfocusz"] = (
-                self.axes[self.config.sequencer_z_axis].position
-                - self.config.focus_position,
+                record.z_position - record.focus_position,
                 "[mm] z-axis position minus in-focus position",
             )
         return headers
 
-    def make_general_headers(self) -> dict[str, tuple[str, str]]:
+    def make_general_headers(
+        self, record: CaptureRecord
+    ) -> dict[str, tuple[str, str]]:
         """Make general, standard headers"""
         headers: dict[str, tuple[str, str]] = {}
         headers["date"] = (Time.now().fits, "time this file was created, in UTC")  # type: ignore
         headers["origin"] = ("CfA", "institution which created this file")
         headers["creator"] = (
-            f"gclef-wavefinder v{self.config.version}",
+            f"gclef-wavefinder v{record.version}",
             "software which created this file",
         )
         headers["instrume"] = ("G-CLEF_AIT", "instrument name")
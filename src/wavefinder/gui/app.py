@@ -8,9 +8,12 @@ from importlib.metadata import PackageNotFoundError, version
 
 from ..devices.Axis import Axis
 from ..devices.DkMonochromator import DkMonochromator
-from ..devices.GalilAdapter import GalilAdapter
 from ..devices.MightexBufCmos import Camera
+from ..devices.SimulatedAdapter import SimulatedAdapter
+from ..devices.SimulatedCamera import PsfModel, SimulatedCamera
+from ..devices.SimulatedMonochromator import SimulatedMonochromator
 from ..devices.ZaberAdapter import ZaberAdapter
+from ..functions.analysis import AnalysisPool
 from ..functions.sequencer import Sequencer
 from ..functions.writer import DataWriter
 from .camera_panel import CameraPanel
@@ -66,44 +69,97 @@ class App(ScrollableWindow):
     def create_devices(self):
         """Create device handles"""
 
-        # camera
-        try:
-            self.camera = Camera(
-                run_mode=self.config.camera_run_mode,
-                bits=self.config.camera_bits,
-                freq_mode=self.config.camera_freq_mode,
-                resolution=self.config.camera_resolution,
-                bin_mode=self.config.camera_bin_mode,
-                nBuffer=self.config.camera_nBuffer,
-                exposure_time=self.config.camera_exposure_time,
-                fps=self.config.camera_fps,
-                gain=self.config.camera_gain,
-            )
-        except ValueError as e:
-            print(e)
-            self.camera = None
-
         # monochromator
-        self.dk = DkMonochromator(self.config.monochrom_port)
+        if self.config.monochrom_simulate:
+            self.dk: DkMonochromator = SimulatedMonochromator(
+                "simulated port", **self.config.monochrom_simulation
+            )
+        else:
+            self.dk = DkMonochromator(self.config.monochrom_port)
 
         # motion axes
         self.axes: dict[str, Axis] = {}
-        self.zaber_adapter = ZaberAdapter(
-            self.config.zaber_ports, self.config.zaber_axis_names
-        )
+        sim = self.config.motion_simulation
+        if self.config.zaber_simulate:
+            self.zaber_adapter: ZaberAdapter | SimulatedAdapter = SimulatedAdapter(
+                "Zaber",
+                self.config.zaber_axis_names,
+                units=("mm", "millimeters"),
+                speed=sim["zaber_speed"],
+                accel=sim["zaber_accel"],
+                decel=sim["zaber_accel"],
+                settle_time=sim["zaber_settle_time"],
+            )
+        else:
+            self.zaber_adapter = ZaberAdapter(
+                self.config.zaber_ports, self.config.zaber_axis_names
+            )
         self.axes.update(self.zaber_adapter.axes)
-        self.galil_adapter = GalilAdapter(
-            self.config.galil_address,
-            self.config.galil_axis_names,
-            self.config.galil_acceleration,
-            self.config.galil_deceleration,
-            self.config.galil_move_speed,
-            self.config.galil_home_speed,
-            self.config.galil_encoder_counts_per_degree,
-            self.config.galil_drive_counts_per_degree,
-        )
+        if self.config.galil_simulate:
+            # kinematics from the controller settings, in drive counts
+            counts = self.config.galil_drive_counts_per_degree
+            self.galil_adapter = SimulatedAdapter(
+                "Galil",
+                self.config.galil_axis_names,
+                units=("deg", "arc degrees"),
+                speed=self.config.galil_move_speed / counts,
+                accel=self.config.galil_acceleration / counts,
+                decel=self.config.galil_deceleration / counts,
+                homing_speed=self.config.galil_home_speed / counts,
+                settle_time=sim["galil_settle_time"],
+                limits=(-30.0, 30.0),
+                position_error=sim["galil_position_error"],
+            )
+        else:
+            # gclib is installed separately, with Galil's software,
+            # so it's only needed when using the controller
+            from ..devices.GalilAdapter import GalilAdapter
+
+            self.galil_adapter = GalilAdapter(
+                self.config.galil_address,
+                self.config.galil_axis_names,
+                self.config.galil_acceleration,
+                self.config.galil_deceleration,
+                self.config.galil_move_speed,
+                self.config.galil_home_speed,
+                self.config.galil_encoder_counts_per_degree,
+                self.config.galil_drive_counts_per_degree,
+            )
         self.axes.update(self.galil_adapter.axes)
 
+        # camera
+        camera_args = dict(
+            run_mode=self.config.camera_run_mode,
+            bits=self.config.camera_bits,
+            freq_mode=self.config.camera_freq_mode,
+            resolution=self.config.camera_resolution,
+            bin_mode=self.config.camera_bin_mode,
+            nBuffer=self.config.camera_nBuffer,
+            exposure_time=self.config.camera_exposure_time,
+            fps=self.config.camera_fps,
+            gain=self.config.camera_gain,
+            acquisition_thread=self.config.camera_acquisition_thread,
+        )
+        try:
+            if self.config.camera_simulate:
+                psf = PsfModel(
+                    self.axes,
+                    self.dk,
+                    axis_names=(
+                        self.config.sequencer_x_axis,
+                        self.config.sequencer_y_axis,
+                        self.config.sequencer_z_axis,
+                    ),
+                    pixel_size=self.config.camera_pixel_size,
+                    **self.config.camera_simulation,
+                )
+                self.camera = SimulatedCamera(psf, **camera_args)
+            else:
+                self.camera = Camera(**camera_args)
+        except ValueError as e:
+            print(e)
+            self.camera = None
+
         # set motion limits
         for axis_name, limits in self.config.motion_limits.items():
             axis = self.axes.get(axis_name, None)
@@ -122,14 +178,27 @@ class App(ScrollableWindow):
 
     def make_functions(self):
         """Make function units"""
-        self.writer = DataWriter(self.camera, self.axes, self.dk)
+        self.analysis = AnalysisPool(
+            self.config.image_analysis_mode, self.config.image_analysis_workers
+        )
+        self.writer = DataWriter(
+            self.camera,
+            self.axes,
+            self.dk,
+            self.analysis,
+            compression=self.config.image_compression,
+            tile_size=self.config.image_compression_tile,
+            index_path=self.config.image_index,
+        )
         self.sequencer = Sequencer(
-            self.config, self.camera, self.axes, self.dk, self.writer
+            self.config, self.camera, self.axes, self.dk, self.writer, self.analysis
         )
 
     def make_panels(self):
         """Make UI panels"""
-        self.camera_panel = CameraPanel(self.frame, self.config, self.camera)
+        self.camera_panel = CameraPanel(
+            self.frame, self.config, self.camera, self.analysis
+        )
         # internal frames of camera panel manage their own grid
 
         self.monochrom_panel = MonochromPanel(self.frame, self.config, self.dk)
@@ -193,6 +262,8 @@ class App(ScrollableWindow):
         """Close application"""
         for u in self.cyclics:
             u.close()
+        self.analysis.close()
+        self.writer.close()
         for task in self.tasks:
             task.cancel()
         self.loop.stop()
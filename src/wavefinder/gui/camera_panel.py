@@ -14,6 +14,7 @@ from PIL import (
 )
 
 from ..devices.MightexBufCmos import Camera, Frame
+from ..functions.analysis import AnalysisPool
 from ..functions.image import get_roi_box, image_math, roi_copy
 from .config import Configuration
 from .utils import Cyclic, make_task, valid_float, valid_int
@@ -22,8 +23,15 @@ from .utils import Cyclic, make_task, valid_float, valid_int
 class CameraPanel(Cyclic):
     """Camera UI Panel is made of 3 LabelFrames"""
 
-    def __init__(self, parent: ttk.Frame, config: Configuration, camera: Camera | None):
+    def __init__(
+        self,
+        parent: ttk.Frame,
+        config: Configuration,
+        camera: Camera | None,
+        analysis: AnalysisPool,
+    ):
         self.config = config
+        self.analysis = analysis
 
         # Task variables
         self.tasks: set[asyncio.Task] = set()
@@ -588,36 +596,66 @@ class CameraPanel(Cyclic):
 
         # do image math unless it's being computed in another function
         if not self.config.image_math_in_function:
-            # if the camera is present, use its frame;
-            # otherwise, use "full_img" which is likely a simulated image
-            if self.config.camera_frame:
-                image = self.config.camera_frame.img_array
-                bits = self.config.camera_frame.bits
-            else:
-                image = np.array(self.config.full_img)
-                bits = 8
-
             # use ROI if selected
             if self.config.image_use_roi_stats:
-                image = roi_copy(image, self.config.roi_size)
+                roi_size = self.config.roi_size
                 threshold = self.config.image_roi_threshold
             else:
+                roi_size = None
                 threshold = self.config.image_full_threshold
 
-            centroid, fwhm, max_value, n_saturated = image_math(
-                image, bits, threshold, self.config.image_fwhm_method
-            )
+            # compute on the analysis pool; if it's busy, only the newest frame waits
+            box = self.get_roi_box() if self.config.image_use_roi_stats else None
+            # if the camera is present, use its frame, whose statistics are cached;
+            # otherwise, use "full_img" which is likely a simulated image
+            if self.config.camera_frame:
+                future = self.analysis.stats.get(
+                    self.config.camera_frame,
+                    threshold,
+                    roi_size,
+                    self.config.image_fwhm_method,
+                    drop_old=True,
+                )
+            else:
+                image = np.array(self.config.full_img)
+                if roi_size:
+                    image = roi_copy(image, roi_size)
+                future = self.analysis.submit(
+                    image_math,
+                    image,
+                    8,
+                    threshold,
+                    self.config.image_fwhm_method,
+                    drop_old=True,
+                )
+            future.add_done_callback(lambda f: self.store_image_stats(f, box))
 
-            # translate to full-frame pixel coordinates
-            if self.config.image_use_roi_stats:
-                box = self.get_roi_box()
-                centroid = (centroid[0] + box[0], centroid[1] + box[1])
-
-            # store values
-            self.config.image_centroid = centroid
-            self.config.image_fwhm = fwhm
-            self.config.image_max_value = max_value
-            self.config.image_n_saturated = n_saturated
+    def store_image_stats(
+        self, future: asyncio.Future, box: tuple[int, int, int, int] | None
+    ):
+        """Store image statistics when they're computed
+
+        Args:
+            future: future holding result of image_math
+            box: ROI box if statistics are of the ROI, otherwise None
+        """
+        # skip frames dropped by the analysis pool or taken over by another function
+        if future.cancelled() or self.config.image_math_in_function:
+            return
+        if future.exception():
+            print(f"Error computing image statistics: {future.exception()}")
+            return
+        centroid, fwhm, max_value, n_saturated = future.result()
+
+        # translate to full-frame pixel coordinates
+        if box:
+            centroid = (centroid[0] + box[0], centroid[1] + box[1])
+
+        # store values
+        self.config.image_centroid = centroid
+        self.config.image_fwhm = fwhm
+        self.config.image_max_value = max_value
+        self.config.image_n_saturated = n_saturated
 
     def update_full_frame_preview(self):
         """Update the full frame preview"""
@@ -35,6 +35,19 @@ class Configuration:
         self.camera_exposure_time = 5.0
         self.camera_fps = 5.0
         self.camera_gain = 15
+        self.camera_acquisition_thread = True
+        self.camera_simulate = False
+        self.camera_simulation: dict = {
+            "spot": (0.0, 0.0),
+            "focus_z": 9.0,
+            "wavelength": 500.0,
+            "focus_slope": 0.0,
+            "sigma": 1.5,
+            "defocus": 10.0,
+            "peak": 0.8,
+            "background": 0.02,
+            "noise": 0.01,
+        }
         self.camera_pixel_size = (3.75, 3.75)
         self.camera_frame: Frame | None = None
 
@@ -47,6 +60,11 @@ class Configuration:
         self.image_use_roi_stats = False
         self.image_math_in_function = False
         self.image_fwhm_method = "variance"
+        self.image_analysis_mode = "thread"
+        self.image_analysis_workers = 1
+        self.image_compression = "none"
+        self.image_compression_tile = (1280, 16)
+        self.image_index = ""
         self.image_centroid = (np.nan, np.nan)
         self.image_fwhm = 0.0
         self.image_max_value = 0
@@ -62,6 +80,12 @@ class Configuration:
 
         # monochromator defaults and state
         self.monochrom_port = "COM1"
+        self.monochrom_simulate = False
+        self.monochrom_simulation = {
+            "slew_rate": 100.0,
+            "slit_rate": 500.0,
+            "overhead": 0.2,
+        }
 
         # motion defaults
         self.zaber_ports = [
@@ -81,6 +105,15 @@ class Configuration:
             "/dev/ttyUSB3",
         ]
         self.galil_address = "192.168.1.19"
+        self.zaber_simulate = False
+        self.galil_simulate = False
+        self.motion_simulation = {
+            "zaber_speed": 10.0,
+            "zaber_accel": 100.0,
+            "zaber_settle_time": 0.05,
+            "galil_settle_time": 0.5,
+            "galil_position_error": 0.005,
+        }
         self.zaber_axis_names = {
             "detector x": {"sn": 33938, "keyword": "detxpos"},
             "detector y": {"sn": 33937, "keyword": "detypos"},
@@ -112,9 +145,27 @@ class Configuration:
         self.sequencer_x_axis = "detector x"
         self.sequencer_y_axis = "detector y"
         self.sequencer_z_axis = "detector z"
+        self.sequencer_output = "files"
+        self.sequencer_reorder = False
+        self.sequencer_timing_log = ""
+        # kinematics of the real devices, to plan and estimate sequences
+        self.sequencer_planner = {
+            "slew_rate": 100.0,
+            "slit_rate": 500.0,
+            "monochromator_overhead": 0.2,
+            "zaber_speed": 10.0,
+            "zaber_accel": 100.0,
+            "zaber_settle_time": 0.05,
+            "galil_settle_time": 0.5,
+        }
         self.focus_points_per_pass = 10
         self.focus_frames_per_point = 3
         self.focus_minimum_move = 0.001
+        self.focus_coadd_frames = False
+        self.focus_strategy = "grid"
+        self.focus_sweep_speed = 2.0
+        self.focus_model_file = ""
+        self.focus_model_bracket = 0.2
         self.focus_position = np.nan
         self.sequence_number = 0
         self.sequence_order = 0
@@ -183,6 +234,23 @@ class Configuration:
                 if "gain" in c["camera"]:
                     if c["camera"]["gain"] in range(6, 42):
                         self.camera_gain = int(c["camera"]["gain"])
+                if "acquisition_thread" in c["camera"]:
+                    if isinstance(c["camera"]["acquisition_thread"], bool):
+                        self.camera_acquisition_thread = c["camera"]["acquisition_thread"]
+                if "simulate" in c["camera"]:
+                    if isinstance(c["camera"]["simulate"], bool):
+                        self.camera_simulate = c["camera"]["simulate"]
+                if "simulation" in c["camera"]:
+                    sim = c["camera"]["simulation"]
+                    if "spot" in sim:
+                        if "x" in sim["spot"] and "y" in sim["spot"]:
+                            self.camera_simulation["spot"] = (
+                                float(sim["spot"]["x"]),
+                                float(sim["spot"]["y"]),
+                            )
+                    for key in self.camera_simulation:
+                        if key in sim and isinstance(sim[key], (int, float)):
+                            self.camera_simulation[key] = float(sim[key])
             if "image" in c:
                 if "full_threshold" in c["image"]:
                     if isinstance(c["image"]["full_threshold"], float):
@@ -203,10 +271,38 @@ class Configuration:
                 if "fwhm_method" in c["image"]:
                     if isinstance(c["image"]["fwhm_method"], str):
                         self.image_fwhm_method = c["image"]["fwhm_method"]
+                if "analysis_mode" in c["image"]:
+                    if c["image"]["analysis_mode"] in ["thread", "process"]:
+                        self.image_analysis_mode = c["image"]["analysis_mode"]
+                if "analysis_workers" in c["image"]:
+                    if c["image"]["analysis_workers"] > 0:
+                        self.image_analysis_workers = int(c["image"]["analysis_workers"])
+                if "compression" in c["image"]:
+                    if c["image"]["compression"] in ["none", "rice", "gzip"]:
+                        self.image_compression = str(c["image"]["compression"])
+                if "compression_tile" in c["image"]:
+                    if "x" in c["image"]["compression_tile"]:
+                        x = c["image"]["compression_tile"]["x"]
+                        if "y" in c["image"]["compression_tile"]:
+                            y = c["image"]["compression_tile"]["y"]
+                            if x > 0 and y > 0:
+                                self.image_compression_tile = (int(x), int(y))
+                if "index" in c["image"]:
+                    if isinstance(c["image"]["index"], str):
+                        self.image_index = str(c["image"]["index"])
             if "monochromator" in c:
                 if "port" in c["monochromator"]:
                     if isinstance(c["monochromator"]["port"], str):
                         self.monochrom_port = c["monochromator"]["port"]
+                if "simulate" in c["monochromator"]:
+                    if isinstance(c["monochromator"]["simulate"], bool):
+                        self.monochrom_simulate = c["monochromator"]["simulate"]
+                if "simulation" in c["monochromator"]:
+                    sim = c["monochromator"]["simulation"]
+                    for key in self.monochrom_simulation:
+                        if key in sim and isinstance(sim[key], (int, float)):
+                            if sim[key] > 0:
+                                self.monochrom_simulation[key] = float(sim[key])
             if "motion" in c:
                 if "zaber" in c["motion"]:
                     if "ports" in c["motion"]["zaber"]:
@@ -215,6 +311,9 @@ class Configuration:
                     if "axis_names" in c["motion"]["zaber"]:
                         if isinstance(c["motion"]["zaber"]["axis_names"], dict):
                             self.zaber_axis_names = c["motion"]["zaber"]["axis_names"]
+                    if "simulate" in c["motion"]["zaber"]:
+                        if isinstance(c["motion"]["zaber"]["simulate"], bool):
+                            self.zaber_simulate = c["motion"]["zaber"]["simulate"]
                 if "galil" in c["motion"]:
                     if "address" in c["motion"]["galil"]:
                         if isinstance(c["motion"]["galil"]["address"], str):
@@ -248,6 +347,15 @@ class Configuration:
                     if "axis_names" in c["motion"]["galil"]:
                         if isinstance(c["motion"]["galil"]["axis_names"], dict):
                             self.galil_axis_names = c["motion"]["galil"]["axis_names"]
+                    if "simulate" in c["motion"]["galil"]:
+                        if isinstance(c["motion"]["galil"]["simulate"], bool):
+                            self.galil_simulate = c["motion"]["galil"]["simulate"]
+                if "simulation" in c["motion"]:
+                    sim = c["motion"]["simulation"]
+                    for key in self.motion_simulation:
+                        if key in sim and isinstance(sim[key], (int, float)):
+                            if sim[key] >= 0:
+                                self.motion_simulation[key] = float(sim[key])
                 if "limits" in c["motion"]:
                     if isinstance(c["motion"]["limits"], dict):
                         self.motion_limits = c["motion"]["limits"]
@@ -261,6 +369,23 @@ class Configuration:
                 if "z_axis" in c["sequencer"]:
                     if isinstance(c["sequencer"]["z_axis"], str):
                         self.sequencer_z_axis = str(c["sequencer"]["z_axis"])
+                if "output" in c["sequencer"]:
+                    if c["sequencer"]["output"] in ["files", "row"]:
+                        self.sequencer_output = str(c["sequencer"]["output"])
+                if "reorder" in c["sequencer"]:
+                    if isinstance(c["sequencer"]["reorder"], bool):
+                        self.sequencer_reorder = c["sequencer"]["reorder"]
+                if "timing_log" in c["sequencer"]:
+                    if isinstance(c["sequencer"]["timing_log"], str):
+                        self.sequencer_timing_log = str(c["sequencer"]["timing_log"])
+                if "planner" in c["sequencer"]:
+                    planner = c["sequencer"]["planner"]
+                    for key in self.sequencer_planner:
+                        if key in planner and isinstance(planner[key], (int, float)):
+                            # rates must be positive; times can be zero
+                            is_time = key.endswith(("overhead", "settle_time"))
+                            if planner[key] > 0 or (is_time and planner[key] == 0):
+                                self.sequencer_planner[key] = float(planner[key])
                 if "focus" in c["sequencer"]:
                     if "points_per_pass" in c["sequencer"]["focus"]:
                         if c["sequencer"]["focus"]["points_per_pass"] > 0:
@@ -271,6 +396,20 @@ class Configuration:
                     if "minimum_move" in c["sequencer"]["focus"]:
                         if c["sequencer"]["focus"]["minimum_move"] > 0:
                             self.focus_minimum_move = float(c["sequencer"]["focus"]["minimum_move"])
+                    if "coadd_frames" in c["sequencer"]["focus"]:
+                        if isinstance(c["sequencer"]["focus"]["coadd_frames"], bool):
+                            self.focus_coadd_frames = bool(c["sequencer"]["focus"]["coadd_frames"])
+                    if "strategy" in c["sequencer"]["focus"]:
+                        if c["sequencer"]["focus"]["strategy"] in ["grid", "model", "sweep"]:
+                            self.focus_strategy = str(c["sequencer"]["focus"]["strategy"])
+                    if "sweep_speed" in c["sequencer"]["focus"]:
+                        if c["sequencer"]["focus"]["sweep_speed"] > 0:
+                            self.focus_sweep_speed = float(c["sequencer"]["focus"]["sweep_speed"])
+                    if "model_file" in c["sequencer"]["focus"]:
+                        self.focus_model_file = str(c["sequencer"]["focus"]["model_file"])
+                    if "model_bracket" in c["sequencer"]["focus"]:
+                        if c["sequencer"]["focus"]["model_bracket"] > 0:
+                            self.focus_model_bracket = float(c["sequencer"]["focus"]["model_bracket"])
         except Exception as e:
             print(f"Error parsing config file {config_filename}, using defaults\n{e}")
             self.set_defaults()
@@ -80,6 +80,7 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
         sequence_frame = ttk.LabelFrame(self, text="Automated Sequence")
         self.sequence_state_txt = tk.StringVar()
         self.sequence_msg_txt = tk.StringVar()
+        self.sequence_estimate_txt = tk.StringVar()
         self.sequence_button_txt = tk.StringVar()
         self.abort_button_txt = tk.StringVar(value="Abort")
 
@@ -87,6 +88,8 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
         sst.grid(column=0, row=0, padx=10, sticky=tk.EW)
         smt = ttk.Label(sequence_frame, textvariable=self.sequence_msg_txt)
         smt.grid(column=0, row=1, columnspan=3, padx=10)
+        ste = ttk.Label(sequence_frame, textvariable=self.sequence_estimate_txt)
+        ste.grid(column=0, row=2, columnspan=2, padx=10)
 
         self.sequence_button = ttk.Button(
             sequence_frame,
@@ -102,6 +105,13 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             width=13,
         )
         abort_button.grid(column=2, row=0, padx=10, pady=5, sticky=tk.E)
+        self.resume_button = ttk.Button(
+            sequence_frame,
+            text="Resume",
+            command=self.resume_sequence,
+            width=13,
+        )
+        self.resume_button.grid(column=2, row=2, padx=10, pady=5, sticky=tk.E)
 
         sequence_frame.grid(column=0, row=1, columnspan=2, pady=10, sticky=tk.EW)
 
@@ -230,6 +240,9 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
 
     def save_img(self):
         """Save image dialog"""
+        # capture now, so the image saved is the one shown when Save was pressed;
+        # copied, since the dialog may be open until the frame buffer wraps around
+        record = self.data_writer.capture(self.config, copy=True)
         # use current date as default filename
         t = Time.now()
         datestr = f"{t.ymdhms[0]:04}{t.ymdhms[1]:02}{t.ymdhms[2]:02}"
@@ -240,7 +253,7 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             defaultextension=".fits",
         )
         if filename:
-            self.data_writer.write_fits_file(filename, self.config)
+            make_task(self.data_writer.submit(filename, record), self.tasks)
 
     def handle_sequence_button(self):
         """Handle the sequence button"""
@@ -286,6 +299,10 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
         if filename:
             self.sequence_filename = filename
             self.sequencer.read_input_file(filename)
+            # how long the sequence would take, from past runs
+            estimate = self.sequencer.estimate_sequence()
+            print(estimate)
+            self.sequence_estimate_txt.set(estimate.short())
 
     def run_sequence(self):
         """Run automated sequence
@@ -317,6 +334,22 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             t, _ = make_task(self.sequencer.run_sequence(directory), self.tasks)
             t.add_done_callback(self.after_sequence)
 
+    def resume_sequence(self):
+        """Resume an interrupted sequence
+
+        Select the output directory of the interrupted run, which has its journal,
+        then run the rest of the sequence into it.
+        """
+        directory = filedialog.askdirectory(
+            title="Select Directory of Sequence to Resume", mustexist=True
+        )
+        if directory:
+            self.sequence_filename = directory
+            self.sequence_estimate_txt.set("")
+            self.config.image_math_in_function = True
+            t, _ = make_task(self.sequencer.resume_sequence(directory), self.tasks)
+            t.add_done_callback(self.after_sequence)
+
     def after_sequence(self, future: asyncio.Future):
         """Callback for after sequence completes"""
         self.config.image_math_in_function = False
@@ -393,12 +426,15 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             case SequenceState.INPUT:
                 self.sequence_button_txt.set("Select Sequence")
                 self.sequence_button.configure(state=tk.NORMAL)
+                self.resume_button.configure(state=tk.NORMAL)
                 self.abort_button_txt.set("Demo")
                 self.sequence_state_txt.set(f"{self.sequencer.sequence_state}")
                 self.sequence_msg_txt.set("")
+                self.sequence_estimate_txt.set("")
             case SequenceState.NOT_READY:
                 self.sequence_button_txt.set("Select Sequence")
                 self.sequence_button.configure(state=tk.NORMAL)
+                self.resume_button.configure(state=tk.NORMAL)
                 self.abort_button_txt.set("Cancel")
                 self.sequence_state_txt.set(f"{self.sequencer.sequence_state}")
                 basename = os.path.basename(self.sequence_filename)
@@ -406,6 +442,7 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             case SequenceState.READY:
                 self.sequence_button_txt.set("Run Sequence")
                 self.sequence_button.configure(state=tk.NORMAL)
+                self.resume_button.configure(state=tk.NORMAL)
                 self.abort_button_txt.set("Cancel")
                 self.sequence_state_txt.set(f"{self.sequencer.sequence_state}")
                 basename = os.path.basename(self.sequence_filename)
@@ -416,6 +453,7 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             case SequenceState.RUN:
                 self.sequence_button_txt.set("Running...")
                 self.sequence_button.configure(state=tk.DISABLED)
+                self.resume_button.configure(state=tk.DISABLED)
                 self.abort_button_txt.set("Abort")
                 self.sequence_state_txt.set(
                     f"{self.sequencer.sequence_state}: "
@@ -423,11 +461,12 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
                 )
                 self.sequence_msg_txt.set(
                     f"processing {self.sequencer.sequence_iteration+1} "
-                    + f"of {len(self.sequencer.sequence)}"
+                    + f"of {len(self.sequencer.plan)}"
                 )
             case SequenceState.FINISHED:
                 self.sequence_button_txt.set("Select Sequence")
                 self.sequence_button.configure(state=tk.NORMAL)
+                self.resume_button.configure(state=tk.NORMAL)
                 self.abort_button_txt.set("Reset")
                 self.sequence_state_txt.set(f"{self.sequencer.sequence_state}")
                 self.sequence_msg_txt.set(
@@ -437,6 +476,7 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
             case SequenceState.ABORT:
                 self.sequence_button_txt.set("Select Sequence")
                 self.sequence_button.configure(state=tk.NORMAL)
+                self.resume_button.configure(state=tk.NORMAL)
                 self.abort_button_txt.set("Reset")
                 self.sequence_state_txt.set(f"{self.sequencer.sequence_state}")
                 self.sequence_state_txt.set(
@@ -446,6 +486,11 @@ class FunctionPanel(Cyclic, ttk.LabelFrame):
                 self.sequence_msg_txt.set(
                     f"Aborted at {self.sequencer.sequence_iteration+1} "
                     + f"of {len(self.sequencer.sequence)}"
+                    + (
+                        f"\n{self.sequencer.sequence_error}"
+                        if self.sequencer.sequence_error
+                        else ""
+                    )
                 )
 
     async def update(self):
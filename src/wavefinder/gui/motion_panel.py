@@ -2,7 +2,7 @@ import asyncio
 import tkinter as tk
 from tkinter import ttk
 
-from ..devices.Axis import Axis
+from ..devices.Axis import Axis, move_many
 from ..gui.utils import Cyclic
 from .utils import make_task, valid_float
 
@@ -102,10 +102,24 @@ class MotionPanel(Cyclic, ttk.LabelFrame):
 
     def move_stages(self):
         """Move all stages"""
+        moves: dict[Axis, float] = {}
         for a in self.axes.values():
             p = float(self.pos_in[a.name].get())
             if p != float(self.pos[a.name].get()):
-                make_task(a.move_absolute(p), self.tasks)
+                moves[a] = p
+        if moves:
+            make_task(self.move_all(moves), self.tasks)
+
+    async def move_all(self, moves: dict[Axis, float]):
+        """Move stages at the same time, and report errors
+
+        Args:
+            moves: position to move each axis to
+        """
+        results = await move_many(moves)
+        for axis, result in results.items():
+            if result.error:
+                print(f"Error moving {axis.name} to {result.target}")
 
     def home_stages(self):
         """Home all stages"""
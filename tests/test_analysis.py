@@ -0,0 +1,166 @@
+import asyncio
+import gc
+import struct
+import threading
+
+import numpy as np
+from astropy.time import Time
+
+from wavefinder.devices.MightexBufCmos import Frame
+from wavefinder.functions.analysis import AnalysisPool
+from wavefinder.functions.image import image_math, roi_copy
+
+
+def make_frame(seed: int = 0) -> Frame:
+    """12 bit frame of a gaussian spot"""
+    rows, cols = 64, 48
+    yy, xx = np.mgrid[:cols, :rows]
+    spot = 3000 * np.exp(-((xx - 30 - seed) ** 2 + (yy - 20) ** 2) / 18)
+    pixels = (spot + 50).astype(np.uint16)
+    pairs = np.stack([pixels >> 4, pixels & 0xF], axis=-1).astype(np.uint8)
+    properties = struct.pack("<14HI", rows, cols, *[0] * 12, 1000)
+    return Frame(bytearray(pairs.tobytes() + properties + bytes(480)), Time.now())
+
+
+def test_statistics_are_computed_once_per_frame_and_settings():
+    async def run():
+        pool = AnalysisPool(workers=2)
+        cache = pool.stats
+        frame = make_frame()
+        first = await cache.get(frame, 5.0, None, "variance")
+        again = await cache.get(frame, 5.0, None, "variance")
+        assert (cache.hits, cache.misses) == (1, 1)
+        # other settings are computed separately
+        roi = await cache.get(frame, 5.0, (20, 20), "variance")
+        await cache.get(frame, 10.0, None, "variance")
+        await cache.get(frame, 5.0, None, "encircled_energy")
+        assert (cache.hits, cache.misses) == (1, 4)
+        pool.close()
+        return frame, first, again, roi
+
+    frame, first, again, roi = asyncio.run(run())
+    assert first == again
+    assert first == image_math(frame.img_array, 12, 5.0, "variance")
+    assert roi == image_math(roi_copy(frame.img_array, (20, 20)), 12, 5.0, "variance")
+
+
+def test_frames_are_unpacked_on_the_worker():
+    async def run():
+        pool = AnalysisPool(workers=1)
+        release = threading.Event()
+        # hold the only worker, so the frame can't be unpacked yet
+        busy = pool.submit(lambda _: release.wait(), np.zeros(1))
+        frame = make_frame()
+        future = pool.stats.get(frame, 5.0, (20, 20), "variance")
+        unpacked_on_loop = frame._img_array is not None
+        release.set()
+        await busy
+        result = await future
+        pool.close()
+        return frame, unpacked_on_loop, result
+
+    frame, unpacked_on_loop, result = asyncio.run(run())
+    assert not unpacked_on_loop
+    expected = image_math(roi_copy(frame.img_array, (20, 20)), 12, 5.0, "variance")
+    assert result == expected
+
+
+def test_worker_processes_unpack_the_raw_frame():
+    async def run():
+        pool = AnalysisPool(AnalysisPool.PROCESS)
+        frame = make_frame()
+        full = await pool.stats.get(frame, 5.0, None, "variance")
+        roi = await pool.stats.get(frame, 5.0, (20, 20), "encircled_energy")
+        pool.close()
+        return frame, full, roi
+
+    frame, full, roi = asyncio.run(run())
+    assert full == image_math(frame.img_array, 12, 5.0, "variance")
+    assert roi == image_math(
+        roi_copy(frame.img_array, (20, 20)), 12, 5.0, "encircled_energy"
+    )
+
+
+def test_concurrent_requests_share_a_computation():
+    async def run():
+        pool = AnalysisPool(workers=2)
+        cache = pool.stats
+        frame = make_frame()
+        results = await asyncio.gather(
+            *[cache.get(frame, 5.0, None, "variance") for _ in range(3)]
+        )
+        pool.close()
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert results[0] == results[1] == results[2]
+
+
+def test_entries_go_away_with_their_frames():
+    async def run():
+        pool = AnalysisPool()
+        cache = pool.stats
+        frame = make_frame()
+        await cache.get(frame, 5.0, None, "variance")
+        assert len(cache.entries) == 1
+        del frame
+        gc.collect()
+        pool.close()
+        return cache
+
+    assert len(asyncio.run(run()).entries) == 0
+
+
+def test_dropped_computation_is_done_again():
+    async def run():
+        pool = AnalysisPool(workers=1)
+        cache = pool.stats
+        frames = [make_frame(i) for i in range(3)]
+        # the first is running, so the second waits and is replaced by the third
+        futures = [cache.get(f, 5.0, None, "variance", drop_old=True) for f in frames]
+        await asyncio.gather(*futures, return_exceptions=True)
+        assert futures[1].cancelled()
+        assert pool.n_dropped == 1
+        # forgotten, so asking again computes it
+        misses = cache.misses
+        result = await cache.get(frames[1], 5.0, None, "variance")
+        assert cache.misses == misses + 1
+        pool.close()
+        return frames[1], result
+
+    frame, result = asyncio.run(run())
+    assert result == image_math(frame.img_array, 12, 5.0, "variance")
+
+
+def test_droppable_computation_is_not_shared_until_done():
+    async def run():
+        pool = AnalysisPool(workers=1)
+        cache = pool.stats
+        frame = make_frame()
+        droppable = cache.get(frame, 5.0, None, "variance", drop_old=True)
+        # could still be dropped, so this one computes its own
+        kept = cache.get(frame, 5.0, None, "variance")
+        assert cache.misses == 2
+        await asyncio.gather(droppable, kept)
+        # done, so now it can be shared
+        await cache.get(frame, 5.0, None, "variance", drop_old=True)
+        assert cache.hits == 1
+        pool.close()
+
+    asyncio.run(run())
+
+
+def test_put_stores_statistics_computed_elsewhere():
+    async def run():
+        pool = AnalysisPool()
+        cache = pool.stats
+        frame = make_frame()
+        result = ((1.0, 2.0), 3.0, 4, 5)
+        cache.put(frame, 5.0, None, "variance", result)
+        got = await cache.get(frame, 5.0, None, "variance")
+        assert (cache.hits, cache.misses) == (1, 0)
+        pool.close()
+        return got
+
+    assert asyncio.run(run()) == ((1.0, 2.0), 3.0, 4, 5)
@@ -0,0 +1,327 @@
+import asyncio
+import struct
+
+import numpy as np
+import pytest
+import usb.core
+from astropy.time import Time
+
+from wavefinder.devices.MightexBufCmos import Camera, Frame, FrameBuffer
+from wavefinder.devices.SimulatedCamera import (
+    PsfModel,
+    SimulatedCamera,
+    SimulatedDevice,
+)
+
+ROWS, COLS = 16, 12
+
+
+def make_properties(exp_units: int = 100000) -> bytes:
+    """512 byte frame trailer, with each property set to a known value"""
+    properties = struct.pack(
+        "<14HI", ROWS, COLS, 0, 0, 8, 1, 15, 3, 1234, 1, 7, 0, 25, 2, exp_units
+    )
+    return properties + bytes(512 - len(properties))
+
+
+def make_frame(bits: int, seed: int = 0) -> tuple[bytearray, np.ndarray]:
+    """Raw frame data as read from the camera, and its expected pixel values"""
+    rng = np.random.default_rng(seed)
+    if bits == 8:
+        pixels = rng.integers(0, 256, (COLS, ROWS), dtype=np.uint8)
+        data = pixels.tobytes()
+    else:
+        pixels = rng.integers(0, 4096, (COLS, ROWS), dtype=np.uint16)
+        # MSB byte, then the 4 LSBs in the next byte
+        pairs = np.stack([pixels >> 4, pixels & 0xF], axis=-1).astype(np.uint8)
+        data = pairs.tobytes()
+    return bytearray(data + make_properties()), pixels
+
+
+def test_properties_are_read_from_the_trailer():
+    data, _ = make_frame(8)
+    frame = Frame(data, Time.now())
+    assert (frame.rows, frame.cols, frame.bin, frame.xStart, frame.yStart) == (
+        ROWS,
+        COLS,
+        0,
+        0,
+        8,
+    )
+    assert (frame.rGain, frame.gGain, frame.bGain) == (1, 15, 3)
+    assert frame.timestamp == 1234
+    assert frame.triggered == 1
+    assert frame.nTriggers == 7
+    assert frame.frameTime == 25
+    assert frame.freq == 2
+    # one little-endian uint32 in units of 0.05 ms, more than 16 bits
+    assert frame.expTime == pytest.approx(5000.0)
+
+
+def test_8_bit_frame_is_a_view_of_the_data():
+    data, pixels = make_frame(8)
+    frame = Frame(data, Time.now())
+    assert frame.bits == 8
+    assert np.array_equal(frame.img_array, pixels)
+    assert np.shares_memory(frame.img_array, np.frombuffer(data, dtype=np.uint8))
+    assert frame.display_array is frame.img_array
+
+
+def test_12_bit_frame_is_unpacked_on_first_use():
+    data, pixels = make_frame(12)
+    frame = Frame(data, Time.now())
+    assert frame.bits == 12
+    assert frame._img_array is None
+    # the display image is the MSBs, without unpacking
+    assert np.array_equal(frame.display_array, pixels >> 4)
+    assert np.shares_memory(frame.display_array, np.frombuffer(data, dtype=np.uint8))
+    assert frame._img_array is None
+    assert frame.img_array.dtype == np.uint16
+    assert np.array_equal(frame.img_array, pixels)
+    # unpacked only once
+    assert frame.img_array is frame.img_array
+
+
+def test_12_bit_frame_is_unpacked_into_a_given_buffer():
+    data, pixels = make_frame(12)
+    buffer = np.zeros((COLS, ROWS), dtype=np.uint16)
+    frame = Frame(data, Time.now(), img_buffer=buffer)
+    assert frame.img_array is buffer
+    assert np.array_equal(buffer, pixels)
+    # a buffer of the wrong size isn't used
+    frame = Frame(data, Time.now(), img_buffer=np.zeros((2, 2), dtype=np.uint16))
+    assert np.array_equal(frame.img_array, pixels)
+
+
+def test_bad_frame_length_is_rejected():
+    data, _ = make_frame(8)
+    with pytest.raises(BufferError):
+        Frame(data[1:], Time.now())
+
+
+def push_frames(buffer: FrameBuffer, n: int, bits: int = 12) -> list[np.ndarray]:
+    """Push n different frames, returning their pixels"""
+    pixels = []
+    for i in range(n):
+        data, p = make_frame(bits, seed=i)
+        buffer.allocate(len(data), (ROWS, COLS), bits)
+        buffer.push(data, Time.now())
+        pixels.append(p)
+    return pixels
+
+
+def test_frame_buffer_keeps_the_newest_frames():
+    buffer = FrameBuffer(capacity=3)
+    pixels = push_frames(buffer, 2)
+    assert len(buffer) == 2
+    newest = buffer.newest(5)
+    assert len(newest) == 2
+    assert np.array_equal(newest[0].img_array, pixels[1])
+    assert np.array_equal(newest[1].img_array, pixels[0])
+
+
+def test_frame_buffer_wraps_around():
+    buffer = FrameBuffer(capacity=3)
+    pixels = push_frames(buffer, 7)
+    assert len(buffer) == 3
+    frames = buffer.newest(3)
+    # newest to oldest, each in its own slot of the preallocated arrays
+    for frame, p in zip(frames, pixels[:-4:-1]):
+        assert np.array_equal(frame.img_array, p)
+        assert np.shares_memory(frame.raw, buffer.data)
+        assert np.shares_memory(frame.img_array, buffer.images)
+    assert buffer.newest()[0] is frames[0]
+
+
+def test_frame_buffer_of_8_bit_frames():
+    buffer = FrameBuffer(capacity=2)
+    pixels = push_frames(buffer, 3, bits=8)
+    assert np.array_equal(buffer.newest()[0].img_array, pixels[-1])
+    assert buffer.images.size == 0
+
+
+def test_frame_buffer_reallocates_only_on_a_new_frame_size():
+    buffer = FrameBuffer(capacity=3)
+    push_frames(buffer, 2)
+    data = buffer.data
+    buffer.allocate(buffer.frame_size, (ROWS, COLS), 12)
+    assert buffer.data is data
+    assert len(buffer) == 2
+    # a new bit depth drops the stored frames
+    push_frames(buffer, 1, bits=8)
+    assert buffer.data is not data
+    assert len(buffer) == 1
+
+
+def test_bad_frame_is_not_kept():
+    buffer = FrameBuffer(capacity=2)
+    push_frames(buffer, 2)
+    data, _ = make_frame(12)
+    with pytest.raises(BufferError):
+        buffer.push(data[: len(data) - 2], Time.now())
+    # the oldest frame's slot was overwritten, so it's gone
+    assert len(buffer) == 1
+
+
+def test_frame_buffer_knows_which_frames_it_holds():
+    buffer = FrameBuffer(capacity=3)
+    push_frames(buffer, 3)
+    oldest, *rest = buffer.newest(3)[::-1]
+    assert buffer.holds(oldest)
+    push_frames(buffer, 1)
+    # the oldest frame's slot was reused
+    assert not buffer.holds(oldest)
+    assert all(buffer.holds(frame) for frame in rest)
+
+
+def test_frames_of_old_storage_are_held():
+    buffer = FrameBuffer(capacity=2)
+    push_frames(buffer, 1)
+    frame = buffer.newest()[0]
+    # new storage, so the old frame's data is never overwritten
+    push_frames(buffer, 3, bits=8)
+    assert buffer.holds(frame)
+
+
+def test_clearing_keeps_frames_handed_out():
+    buffer = FrameBuffer(capacity=3)
+    pixels = push_frames(buffer, 1)
+    frame = buffer.newest()[0]
+    buffer.clear()
+    assert len(buffer) == 0
+    # the next frame goes in the next slot, not over the one handed out
+    data, _ = make_frame(12, seed=1)
+    buffer.push(data, Time.now())
+    assert buffer.holds(frame)
+    assert np.array_equal(frame.img_array, pixels[0])
+
+
+def test_triggered_frames_are_not_overwritten_by_the_next():
+    async def take_image(camera: Camera) -> Frame:
+        """Take a frame the way the sequencer does"""
+        await camera.clear_buffer()
+        await camera.trigger()
+        return await camera.wait_for_frame(after=camera.last_trigger_time, timeout=2.0)
+
+    async def run():
+        psf = PsfModel({}, None, seed=1)
+        camera = SimulatedCamera(
+            psf, run_mode=Camera.TRIGGER, bits=12, exposure_time=5, resolution=(64, 48)
+        )
+        await camera.update()
+        try:
+            first = await take_image(camera)
+            pixels = first.img_array.copy()
+            # defocus, so the next image is different
+            psf.focus_z += 5.0
+            second = await take_image(camera)
+        finally:
+            camera.close()
+        return first, pixels, second
+
+    first, pixels, second = asyncio.run(run())
+    assert not np.array_equal(second.img_array, pixels)
+    assert not np.shares_memory(first.raw, second.raw)
+    # unpacked again from the raw data, which must be unchanged
+    first._img_array = None
+    assert np.array_equal(first.img_array, pixels)
+
+
+def test_frame_overwritten_by_a_bad_frame_is_not_held():
+    buffer = FrameBuffer(capacity=2)
+    push_frames(buffer, 2)
+    oldest = buffer.newest(2)[1]
+    data, _ = make_frame(12)
+    with pytest.raises(BufferError):
+        buffer.push(data[: len(data) - 2], Time.now())
+    # no frame was added, but the oldest frame's data was overwritten
+    assert not buffer.holds(oldest)
+    assert buffer.holds(buffer.newest()[0])
+
+
+@pytest.mark.parametrize("bits", [8, 12])
+def test_frame_copy_has_its_own_data(bits):
+    buffer = FrameBuffer(capacity=1)
+    pixels = push_frames(buffer, 1, bits=bits)
+    frame = buffer.newest()[0]
+    copy = frame.copy()
+    for name in Frame.SHARED:
+        assert getattr(copy, name) == getattr(frame, name)
+    assert np.array_equal(copy.display_array, frame.display_array)
+    # still the same after the buffer wraps around
+    push_frames(buffer, 2, bits=bits)
+    assert not buffer.holds(frame)
+    assert buffer.holds(copy)
+    assert np.array_equal(copy.img_array, pixels[0])
+    assert not np.shares_memory(copy.raw, buffer.data)
+
+
+class LateDevice(SimulatedDevice):
+    """Simulated camera whose chosen frame reads time out, as if frames were late"""
+
+    def __init__(self, psf: PsfModel, late_reads: set[int]) -> None:
+        super().__init__(psf)
+        self.late_reads = late_reads  # numbers of the frame reads which time out
+        self.n_reads = 0
+        self.n_resets = 0
+
+    def read(self, endpoint: int, size_or_buffer, timeout: int | None = None):
+        if endpoint == 0x82:
+            self.n_reads += 1
+            if self.n_reads in self.late_reads:
+                raise usb.core.USBTimeoutError("Operation timed out")
+        return super().read(endpoint, size_or_buffer, timeout)
+
+    def clear_halt(self, endpoint: int) -> None:
+        self.n_resets += 1
+        super().clear_halt(endpoint)
+
+
+class LateCamera(SimulatedCamera):
+    def __init__(self, late_reads: set[int], **kwargs) -> None:
+        self.late_reads = late_reads
+        super().__init__(PsfModel({}, None, seed=1), **kwargs)
+
+    def find_device(self) -> LateDevice:  # type: ignore
+        return LateDevice(self.psf, self.late_reads)
+
+
+def download_after_triggers(late_reads: set[int]) -> tuple[LateCamera, int]:
+    """Trigger three frames, and download them with the given reads timing out"""
+
+    async def run():
+        camera = LateCamera(
+            late_reads,
+            run_mode=Camera.TRIGGER,
+            bits=12,
+            exposure_time=1,
+            resolution=(64, 48),
+            acquisition_thread=False,
+        )
+        await camera.write_configuration()
+        for _ in range(3):
+            await camera.trigger()
+        await asyncio.sleep(0.01)
+        return camera, camera.download_frames()
+
+    return asyncio.run(run())
+
+
+def test_late_frames_are_drained():
+    camera, nFrames = download_after_triggers({2})
+    device: LateDevice = camera.dev  # type: ignore
+    # the late frame and the one after it were read and dropped
+    assert len(camera.frame_buffer) == 1
+    assert device.nSend == 0
+    assert device.n_resets == 0
+    assert nFrames == device.ready_frames() == 0
+
+
+def test_endpoint_is_reset_if_late_frames_do_not_come():
+    camera, nFrames = download_after_triggers({2, 3})
+    device: LateDevice = camera.dev  # type: ignore
+    assert len(camera.frame_buffer) == 1
+    # nothing more will be sent, and the two frames are still in the camera
+    assert device.nSend == 0
+    assert device.n_resets == 1
+    assert nFrames == device.ready_frames() == 2
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from wavefinder.functions.estimator import TimingLog, format_duration, writer_finish
+
+
+def test_writer_finish_with_no_files():
+    assert writer_finish(np.array([]), 1.0) == 0.0
+
+
+def test_writer_finish_keeps_up_with_slow_submissions():
+    # each file is written before the next arrives
+    assert writer_finish(np.array([0.0, 5.0, 10.0]), 1.0) == pytest.approx(11.0)
+
+
+def test_writer_finish_queues_fast_submissions():
+    # all at once, so they're written one after another
+    assert writer_finish(np.zeros(4), 1.5) == pytest.approx(6.0)
+    # a backlog, then a gap long enough to clear it, then one more
+    submitted = np.array([0.0, 0.0, 0.0, 10.0])
+    assert writer_finish(submitted, 2.0) == pytest.approx(12.0)
+
+
+def test_writer_finish_matches_a_simulated_queue():
+    rng = np.random.default_rng(0)
+    submitted = np.sort(rng.uniform(0, 20, 50))
+    done = 0.0
+    for t in submitted:
+        done = max(done, t) + 0.5
+    assert writer_finish(submitted, 0.5) == pytest.approx(done)
+
+
+def test_fit_recovers_a_linear_duration():
+    log = TimingLog("")
+    for d in np.linspace(1.0, 10.0, 8):
+        log.add("move", "detector z", 0.2 + 0.1 * d, d)
+    coef = log.fit("move", "detector z")
+    assert coef == pytest.approx([0.2, 0.1])
+
+
+def test_fit_with_two_sizes():
+    log = TimingLog("")
+    rng = np.random.default_rng(1)
+    for w, s in rng.uniform(1, 100, (12, 2)):
+        log.add("monochromator", "", 0.3 + 0.01 * w + 0.002 * s, w, s)
+    coef = log.fit("monochromator", "", terms=3)
+    assert coef == pytest.approx([0.3, 0.01, 0.002])
+
+
+def test_fit_needs_enough_spread_durations():
+    log = TimingLog("")
+    for _ in range(5):
+        log.add("move", "x", 1.0, 2.0)
+    # too few
+    assert log.fit("move", "x") is None
+    log.add("move", "x", 1.0, 2.0)
+    # enough, but all the same size
+    assert log.fit("move", "x") is None
+    # zero-size moves don't count
+    for _ in range(6):
+        log.add("move", "y", 0.1, 0.0)
+    assert log.fit("move", "y") is None
+
+
+def test_fit_is_never_negative():
+    log = TimingLog("")
+    # durations which shrink with size
+    for d in np.linspace(1.0, 10.0, 8):
+        log.add("move", "x", 2.0 - 0.1 * d, d)
+    coef = log.fit("move", "x")
+    assert np.all(coef >= 0)
+
+
+def test_mean_and_size():
+    log = TimingLog("")
+    assert log.mean("frame") is None
+    for t in [5.0, 5.0, 5.0, 50.0, 50.0, 50.0]:
+        log.add("frame", "", t / 1000 + 0.1, t)
+    assert log.mean("frame", size=5.0) == pytest.approx(0.105)
+    assert log.mean("frame") == pytest.approx(0.1275)
+
+
+def test_durations_are_kept_and_trimmed(tmp_path):
+    path = str(tmp_path / "timing_log.csv")
+    log = TimingLog(path, keep=4)
+    for i in range(6):
+        log.add("write", "", 0.01 * (i + 1))
+    log.add("write", "", np.nan)  # not finite, so not kept
+
+    loaded = TimingLog(path, keep=4)
+    assert len(loaded) == 4
+    # only the most recent
+    assert loaded.mean("write") == pytest.approx(0.045)
+    with open(path) as f:
+        # trimmed to a header and the durations in use
+        assert len(f.readlines()) == 5
+
+
+def test_format_duration():
+    assert format_duration(0) == "0:00:00"
+    assert format_duration(3725.4) == "1:02:05"
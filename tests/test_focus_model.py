@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from wavefinder.functions.focus_model import FocusModel
+
+
+def add_line(model: FocusModel, wavelengths) -> None:
+    """Add results on the line z = 9 + 0.01 (w - 500)"""
+    for w in wavelengths:
+        model.add(w, 3, 0.0, 0.0, 9.0 + 0.01 * (w - 500), 4.0)
+
+
+def test_no_prediction_from_too_few_results(tmp_path):
+    model = FocusModel(str(tmp_path / "focus_model.csv"))
+    assert model.predict(500.0, 3, 0.0, 0.0) is None
+    add_line(model, [400.0, 600.0])
+    assert model.predict(500.0, 3, 0.0, 0.0) is None
+
+
+def test_fit_follows_wavelength(tmp_path):
+    model = FocusModel(str(tmp_path / "focus_model.csv"))
+    add_line(model, np.linspace(400.0, 700.0, 6))
+    # two terms: constant and wavelength
+    assert len(model.coef) == 2
+    z, uncertainty = model.predict(550.0, 3, 0.0, 0.0)
+    assert z == pytest.approx(9.5)
+    assert uncertainty == pytest.approx(0.0, abs=1e-9)
+
+
+def test_uncertainty_grows_away_from_results(tmp_path):
+    model = FocusModel(str(tmp_path / "focus_model.csv"))
+    rng = np.random.default_rng(0)
+    for w in np.linspace(400.0, 700.0, 9):
+        z = 9.0 + 0.01 * (w - 500) + rng.normal(0, 0.01)
+        model.add(w, 3, 0.0, 0.0, z, 4.0)
+    _, near = model.predict(550.0, 3, 0.0, 0.0)
+    _, far = model.predict(1000.0, 3, 0.0, 0.0)
+    assert 0 < near < far
+
+
+def test_results_are_kept_between_runs(tmp_path):
+    path = str(tmp_path / "models" / "focus_model.csv")
+    model = FocusModel(path)
+    add_line(model, np.linspace(400.0, 700.0, 6))
+    model.add(np.nan, 3, 0.0, 0.0, 9.0, 4.0)  # not finite, so not kept
+
+    loaded = FocusModel(path)
+    assert len(loaded) == 6
+    assert loaded.predict(550.0, 3, 0.0, 0.0) == pytest.approx(
+        model.predict(550.0, 3, 0.0, 0.0)
+    )
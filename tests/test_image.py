@@ -0,0 +1,247 @@
+import numpy as np
+import pytest
+
+from wavefinder.functions import image
+from wavefinder.functions.image import (
+    find_centroid,
+    find_enclosing_radius,
+    find_full_width_half_max,
+    fwhm_by_variance,
+    image_math,
+    image_math_stack,
+    image_moments,
+    threshold_copy,
+)
+
+
+def make_spot(
+    shape: tuple[int, int] = (60, 80),
+    center: tuple[float, float] = (45.3, 22.6),
+    sigma: tuple[float, float] = (4.0, 2.5),
+    seed: int = 0,
+) -> np.ndarray:
+    """12-bit elliptical gaussian spot on a noisy background, with a saturated core"""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[: shape[0], : shape[1]]
+    spot = 6000 * np.exp(
+        -((xx - center[0]) ** 2) / (2 * sigma[0] ** 2)
+        - (yy - center[1]) ** 2 / (2 * sigma[1] ** 2)
+    )
+    return np.clip(spot + rng.normal(100, 20, shape), 0, 4095).astype(np.uint16)
+
+
+def meshgrid_centroid(img_array: np.ndarray) -> tuple[float, float]:
+    """Reference: weighted average of a grid of pixel coordinates"""
+    xx, yy = np.meshgrid(np.arange(img_array.shape[1]), np.arange(img_array.shape[0]))
+    return (
+        float(np.average(xx, weights=img_array)),
+        float(np.average(yy, weights=img_array)),
+    )
+
+
+def meshgrid_variance(
+    img_array: np.ndarray, centroid: tuple[float, float]
+) -> tuple[float, float, float]:
+    """Reference: weighted variance and covariance over a grid of pixel coordinates"""
+    xx, yy = np.meshgrid(np.arange(img_array.shape[1]), np.arange(img_array.shape[0]))
+    dx = xx - centroid[0]
+    dy = yy - centroid[1]
+    return (
+        float(np.average(dx**2, weights=img_array)),
+        float(np.average(dy**2, weights=img_array)),
+        float(np.average(dx * dy, weights=img_array)),
+    )
+
+
+def test_centroid_matches_meshgrid():
+    img = make_spot()
+    assert find_centroid(img) == pytest.approx(meshgrid_centroid(img), rel=1e-12)
+    assert image_moments(img).centroid() == pytest.approx(find_centroid(img))
+
+
+def test_variance_matches_meshgrid():
+    img = make_spot()
+    centroid = meshgrid_centroid(img)
+    expected = meshgrid_variance(img, centroid)
+    assert image_moments(img).variance(centroid) == pytest.approx(expected, rel=1e-9)
+    # about its own centroid by default
+    assert image_moments(img).variance() == pytest.approx(expected, rel=1e-9)
+    x_var, y_var, _ = expected
+    assert fwhm_by_variance(img, centroid) == pytest.approx(
+        1 + np.sqrt(max(x_var, y_var)) * 2.3548200450309493
+    )
+
+
+def test_moments_of_a_dark_image():
+    moments = image_moments(np.zeros((4, 5), dtype=np.uint16), 12, 5.0)
+    assert np.isnan(moments.centroid()).all()
+    assert moments.variance() == (0.0, 0.0, 0.0)
+    assert moments.max_value == 0
+    assert moments.n_saturated == 0
+
+
+@pytest.mark.parametrize("threshold", [0.0, 5.0, 50.0])
+def test_thresholded_moments_match_threshold_copy(threshold):
+    img = make_spot()
+    copied = threshold_copy(img, 12, threshold)
+    moments = image_moments(img, 12, threshold)
+    assert moments.total == float(np.sum(copied))
+    assert moments.centroid() == pytest.approx(meshgrid_centroid(copied), rel=1e-12)
+    assert moments.max_value == int(np.max(img))
+    assert moments.n_saturated == np.count_nonzero(img == 4095)
+    # the image itself isn't changed
+    assert np.array_equal(img, make_spot())
+
+
+def test_scratch_buffers_follow_the_image_size():
+    small = make_spot((20, 30), (15.0, 10.0), (2.0, 2.0))
+    large = make_spot()
+    for img in [large, small, large]:
+        copied = threshold_copy(img, 12, 5.0)
+        assert image_moments(img, 12, 5.0).centroid() == pytest.approx(
+            meshgrid_centroid(copied), rel=1e-12
+        )
+
+
+def test_scratch_buffers_are_shared_by_frames_and_stacks():
+    img = make_spot()
+    stack = np.stack([img, img])
+    image_math_stack(stack, 12, 5.0, "variance")
+    work = image._scratch.work[img.dtype]
+    for _ in range(2):
+        image_math(img, 12, 5.0, "variance")
+        image_math_stack(stack, 12, 5.0, "variance")
+        assert image._scratch.work[img.dtype] is work
+
+
+def test_image_math_matches_thresholded_copy():
+    img = make_spot()
+    copied = threshold_copy(img, 12, 5.0)
+    centroid = meshgrid_centroid(copied)
+    x_var, y_var, _ = meshgrid_variance(copied, centroid)
+    c, fwhm, max_value, n_saturated = image_math(img, 12, 5.0, "variance")
+    assert c == pytest.approx(centroid, rel=1e-12)
+    assert fwhm == pytest.approx(1 + np.sqrt(max(x_var, y_var)) * 2.3548200450309493)
+    assert max_value == 4095
+    assert n_saturated == np.count_nonzero(img == 4095)
+
+
+def grow_radius(
+    img_array: np.ndarray, center_pixel: tuple[int, int], target: float
+) -> tuple[int, float]:
+    """Reference: grow a square one pixel at a time until its sum reaches target"""
+    radius = 0
+    subarray_e = 0
+    while (
+        center_pixel[0] - radius >= 0
+        and center_pixel[1] - radius >= 0
+        and center_pixel[0] + radius + 1 < img_array.shape[0]
+        and center_pixel[1] + radius + 1 < img_array.shape[1]
+    ):
+        subarray = img_array[
+            center_pixel[0] - radius : center_pixel[0] + radius + 1,
+            center_pixel[1] - radius : center_pixel[1] + radius + 1,
+        ]
+        subarray_e = np.sum(subarray)
+        if subarray_e >= target:
+            break
+        radius += 1
+    return radius, subarray_e
+
+
+def test_enclosing_radius_matches_growing_the_square():
+    img = threshold_copy(make_spot(), 12, 5.0)
+    total = float(np.sum(img))
+    for center_pixel in [(22, 45), (3, 70), (50, 10)]:
+        for fraction in [0.0, 0.01, 0.3, 0.5, 0.9, 1.0]:
+            target = fraction * total
+            assert find_enclosing_radius(img, center_pixel, target) == grow_radius(
+                img, center_pixel, target
+            )
+
+
+def test_enclosing_radius_of_a_mask():
+    mask = make_spot() >= 2048
+    v_t = np.count_nonzero(mask)
+    assert find_enclosing_radius(mask, (22, 45), v_t) == grow_radius(
+        mask, (22, 45), v_t
+    )
+
+
+def test_enclosing_radius_when_no_square_is_big_enough():
+    img = np.ones((10, 12), dtype=np.uint16)
+    # the largest square which fits around (4, 5) has radius 4, and 81 pixels
+    assert find_enclosing_radius(img, (4, 5), 200) == (5, 81)
+    assert grow_radius(img, (4, 5), 200) == (5, 81)
+    # on the high edges, no square fits
+    assert find_enclosing_radius(img, (9, 5), 1) == (0, 0.0)
+    assert grow_radius(img, (9, 5), 1) == (0, 0)
+
+
+def loop_fwhm(
+    img_array: np.ndarray, centroid: tuple[float, float], method: str
+) -> float:
+    """Reference: encircled FWHM methods, growing the square one pixel at a time"""
+    center_pixel = (int(centroid[1] // 1), int(centroid[0] // 1))
+    remainder = (centroid[1] % 1, centroid[0] % 1)
+    total_e = np.sum(img_array)
+    if method == "encircled_pixels":
+        fwhm_pixels = img_array >= np.max(img_array) / 2
+        v_t = np.count_nonzero(fwhm_pixels)
+        radius, _ = grow_radius(fwhm_pixels, center_pixel, v_t)
+    else:
+        radius, subarray_e = grow_radius(img_array, center_pixel, total_e / 2)
+    fwhm = 1 + 2 * (radius + max(remainder))
+    if method == "weighted_encircled_energy":
+        fwhm /= subarray_e / total_e
+    return fwhm
+
+
+@pytest.mark.parametrize(
+    "method", ["encircled_pixels", "encircled_energy", "weighted_encircled_energy"]
+)
+def test_encircled_fwhm_matches_growing_the_square(method):
+    for center in [(45.3, 22.6), (4.5, 55.2)]:
+        img = threshold_copy(make_spot(center=center), 12, 5.0)
+        centroid = find_centroid(img)
+        assert find_full_width_half_max(img, centroid, method) == pytest.approx(
+            loop_fwhm(img, centroid, method)
+        )
+
+
+def make_stack(n: int = 4) -> np.ndarray:
+    """Frames of a spot which wanders and sometimes goes dark"""
+    frames = [
+        make_spot(center=(40.0 + 2 * i, 25.0 - i), seed=i) for i in range(n - 1)
+    ]
+    frames.append(np.zeros_like(frames[0]))
+    return np.stack(frames)
+
+
+@pytest.mark.parametrize(
+    "method",
+    ["variance", "encircled_pixels", "encircled_energy", "weighted_encircled_energy"],
+)
+def test_stack_statistics_match_each_frame(method):
+    stack = make_stack()
+    centroids, fwhms, max_values, n_saturated = image_math_stack(stack, 12, 5.0, method)
+    assert centroids.shape == (len(stack), 2)
+    for i, frame in enumerate(stack):
+        c, fwhm, max_value, n_sat = image_math(frame, 12, 5.0, method)
+        assert centroids[i] == pytest.approx(c, rel=1e-12, nan_ok=True)
+        assert fwhms[i] == pytest.approx(fwhm, nan_ok=True)
+        assert max_values[i] == max_value
+        assert n_saturated[i] == n_sat
+
+
+def test_coadded_statistics_are_of_the_mean_frame():
+    stack = make_stack()[:-1]
+    centroids, fwhms, max_values, n_saturated = image_math_stack(
+        stack, 12, 5.0, "variance", coadd=True
+    )
+    c, fwhm, max_value, n_sat = image_math(np.mean(stack, axis=0), 12, 5.0, "variance")
+    assert centroids.shape == (1, 2)
+    assert centroids[0] == pytest.approx(c, rel=1e-6)
+    assert fwhms[0] == pytest.approx(fwhm, rel=1e-6)
+    assert max_values[0] == max_value
+    assert n_saturated[0] == n_sat
@@ -0,0 +1,90 @@
+import json
+
+from wavefinder.functions.journal import FITS_BLOCK, SequenceJournal
+
+SEQUENCE = [
+    {"wavelength": [400.0 + 50 * r], "order": [3.0], "dfocusz": [-0.1, 0.1]}
+    for r in range(4)
+]
+PLAN = [2, 0, 3, 1]
+
+
+def make_journal(tmp_path) -> SequenceJournal:
+    journal = SequenceJournal(str(tmp_path), SEQUENCE, PLAN, [1, 4, 7, 10], "seq.csv")
+    journal.save()
+    return journal
+
+
+def write_file(tmp_path, name: str, size: int) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"\0" * size)
+    return str(path)
+
+
+def test_new_journal_has_every_row_remaining(tmp_path):
+    journal = make_journal(tmp_path)
+    assert journal.remaining() == PLAN
+
+
+def test_finished_rows_with_written_files_are_complete(tmp_path):
+    journal = make_journal(tmp_path)
+    files = [write_file(tmp_path, f"row2_{k}.fits", 2 * FITS_BLOCK) for k in "fie"]
+    journal.finish_row(2, files)
+    assert journal.is_complete(2)
+    # only file names are kept, so the directory can be moved
+    assert journal.rows[2].files == ["row2_f.fits", "row2_i.fits", "row2_e.fits"]
+    assert journal.remaining() == [0, 3, 1]
+
+
+def test_row_is_incomplete_until_finished(tmp_path):
+    journal = make_journal(tmp_path)
+    write_file(tmp_path, "row0.fits", FITS_BLOCK)
+    journal.set_focus(0, 9.0)
+    journal.rows[0].files = ["row0.fits"]
+    assert not journal.is_complete(0)
+
+
+def test_row_with_damaged_files_is_incomplete(tmp_path):
+    journal = make_journal(tmp_path)
+    short = write_file(tmp_path, "short.fits", FITS_BLOCK + 100)
+    empty = write_file(tmp_path, "empty.fits", 0)
+    good = write_file(tmp_path, "good.fits", FITS_BLOCK)
+    journal.finish_row(0, [good, short])
+    journal.finish_row(1, [empty])
+    journal.finish_row(3, [good, str(tmp_path / "missing.fits")])
+    assert not journal.is_complete(0)
+    assert not journal.is_complete(1)
+    assert not journal.is_complete(3)
+    assert journal.remaining() == PLAN
+
+
+def test_journal_is_saved_and_loaded(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.set_focus(2, 8.5)
+    journal.finish_row(2, [write_file(tmp_path, "row2.fits", FITS_BLOCK)])
+
+    loaded = SequenceJournal.load(str(tmp_path))
+    assert loaded is not None
+    assert loaded.sequence == SEQUENCE
+    assert loaded.plan == PLAN
+    assert loaded.first_numbers == [1, 4, 7, 10]
+    assert loaded.sequence_file == "seq.csv"
+    assert loaded.started == journal.started
+    assert loaded.rows[2].focus == 8.5
+    assert loaded.remaining() == [0, 3, 1]
+    # replaced whole, with no temporary file left behind
+    assert not (tmp_path / (SequenceJournal.FILENAME + ".tmp")).exists()
+
+
+def test_load_rejects_missing_or_bad_journals(tmp_path):
+    assert SequenceJournal.load(str(tmp_path)) is None
+
+    path = tmp_path / SequenceJournal.FILENAME
+    path.write_text("{not json")
+    assert SequenceJournal.load(str(tmp_path)) is None
+
+    make_journal(tmp_path)
+    data = json.loads(path.read_text())
+    data["rows"] = data["rows"][:2]
+    path.write_text(json.dumps(data))
+    assert SequenceJournal.load(str(tmp_path)) is None
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from wavefinder.functions.pipeline import Pipeline
+
+
+def make_step(log: list[str], name: str, delay: float = 0.0, result=None):
+    """Step which logs its start and end, and returns result"""
+
+    async def action():
+        log.append(f"start {name}")
+        await asyncio.sleep(delay)
+        log.append(f"end {name}")
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return action
+
+
+def test_steps_on_a_device_run_in_order():
+    log: list[str] = []
+    pipeline = Pipeline()
+    pipeline.add("a", make_step(log, "a", 0.02), uses=("camera",))
+    pipeline.add("b", make_step(log, "b"), uses=("camera",))
+    assert asyncio.run(pipeline.run())
+    assert log == ["start a", "end a", "start b", "end b"]
+
+
+def test_steps_on_different_devices_overlap():
+    log: list[str] = []
+    pipeline = Pipeline()
+    pipeline.add("a", make_step(log, "a", 0.02), uses=("camera",))
+    pipeline.add("b", make_step(log, "b", 0.02), uses=("monochromator",))
+    assert asyncio.run(pipeline.run())
+    assert log[:2] == ["start a", "start b"]
+
+
+def test_step_waits_for_steps_it_is_after():
+    log: list[str] = []
+    pipeline = Pipeline()
+    pipeline.add("a", make_step(log, "a", 0.02), uses=("monochromator",))
+    pipeline.add("b", make_step(log, "b"), after=("a",), uses=("camera",))
+    assert asyncio.run(pipeline.run())
+    assert log == ["start a", "end a", "start b", "end b"]
+
+
+def test_later_step_cannot_jump_the_queue():
+    log: list[str] = []
+    pipeline = Pipeline()
+    pipeline.add("a", make_step(log, "a", 0.02), uses=("monochromator",))
+    # b waits for a, so c, which shares b's device, must wait for b
+    pipeline.add("b", make_step(log, "b"), after=("a",), uses=("camera",))
+    pipeline.add("c", make_step(log, "c"), uses=("camera",))
+    assert asyncio.run(pipeline.run())
+    assert log.index("end b") < log.index("start c")
+
+
+def test_step_returning_false_stops_the_pipeline():
+    log: list[str] = []
+    pipeline = Pipeline()
+    pipeline.add("a", make_step(log, "a", 0.02), uses=("monochromator",))
+    pipeline.add("b", make_step(log, "b", result=False), uses=("camera",))
+    pipeline.add("c", make_step(log, "c"), uses=("camera",))
+    assert not asyncio.run(pipeline.run())
+    # running steps finish, but no more start
+    assert "end a" in log
+    assert "start c" not in log
+
+
+def test_step_exception_is_raised_after_running_steps_finish():
+    log: list[str] = []
+    pipeline = Pipeline()
+    pipeline.add("a", make_step(log, "a", 0.02), uses=("monochromator",))
+    pipeline.add("b", make_step(log, "b", result=RuntimeError("b failed")))
+    pipeline.add("c", make_step(log, "c"), after=("b",))
+    with pytest.raises(RuntimeError, match="b failed"):
+        asyncio.run(pipeline.run())
+    assert "end a" in log
+    assert "start c" not in log
+
+
+def test_add_checks_names():
+    pipeline = Pipeline()
+    pipeline.add("a", make_step([], "a"))
+    with pytest.raises(ValueError):
+        pipeline.add("a", make_step([], "a"))
+    with pytest.raises(ValueError):
+        pipeline.add("b", make_step([], "b"), after=("c",))
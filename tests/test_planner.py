@@ -0,0 +1,95 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from wavefinder.functions.planner import (
+    MotionModel,
+    path_time,
+    plan_order,
+    transition_times,
+)
+
+
+def nearest_neighbour(times: np.ndarray) -> list[int]:
+    """Path from row 0 which always goes to the nearest row left"""
+    path = [0]
+    left = set(range(1, len(times)))
+    while left:
+        path.append(min(left, key=lambda r: times[path[-1], r]))
+        left.remove(path[-1])
+    return path
+
+
+def best_time(times: np.ndarray) -> float:
+    """Shortest path from row 0 by trying every order"""
+    rest = range(1, len(times))
+    return min(path_time(times, [0, *p]) for p in itertools.permutations(rest))
+
+
+def test_motion_model_profiles():
+    model = MotionModel(speed=10.0, accel=100.0, overhead=0.5)
+    # no move, no time, not even overhead
+    assert model.time(np.array([0.0]))[0] == 0.0
+    # trapezoid: 1 s cruising plus 0.1 s to accelerate and decelerate
+    assert model.time(np.array([10.0]))[0] == pytest.approx(10 / 10 + 10 / 100 + 0.5)
+    # triangle, never reaching top speed
+    assert model.time(np.array([-0.25]))[0] == pytest.approx(2 * 0.05 + 0.5)
+
+
+def test_transition_times_add_monochromator_and_overlap_axes():
+    models = {
+        "wavelength": MotionModel(100.0),
+        "slit1": MotionModel(100.0),
+        "detector x": MotionModel(1.0),
+    }
+    rows = [
+        {"wavelength": [400.0], "slit1": [100.0], "detector x": [0.0]},
+        {"wavelength": [500.0], "slit1": [200.0], "detector x": [1.5]},
+        {"wavelength": [500.0], "slit1": [200.0], "detector x": [2.0]},
+    ]
+    times = transition_times(rows, models)
+    # wavelength and slit one after the other, 2 s, longer than x's 1.5 s
+    assert times[0, 1] == pytest.approx(2.0)
+    # x's 2 s, the same as the monochromator's
+    assert times[0, 2] == pytest.approx(2.0)
+    # only x moves
+    assert times[1, 2] == pytest.approx(0.5)
+    assert np.all(np.diag(times) == 0)
+
+
+def test_plan_order_starts_at_row_0_and_visits_every_row():
+    rng = np.random.default_rng(0)
+    points = rng.uniform(0, 10, (12, 2))
+    times = np.linalg.norm(points[None, :] - points[:, None], axis=-1)
+    path = plan_order(times)
+    assert path[0] == 0
+    assert sorted(path) == list(range(12))
+
+
+def test_plan_order_improves_on_nearest_neighbour():
+    rng = np.random.default_rng(2)
+    improved = 0
+    for _ in range(20):
+        points = rng.uniform(0, 10, (10, 2))
+        times = np.linalg.norm(points[None, :] - points[:, None], axis=-1)
+        planned = path_time(times, plan_order(times))
+        nearest = path_time(times, nearest_neighbour(times))
+        assert planned <= nearest + 1e-9
+        improved += planned < nearest - 1e-9
+    assert improved > 0
+
+
+def test_plan_order_is_no_worse_than_file_order():
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        points = rng.uniform(0, 10, (7, 2))
+        times = np.linalg.norm(points[None, :] - points[:, None], axis=-1)
+        planned = path_time(times, plan_order(times))
+        assert planned <= path_time(times, list(range(7))) + 1e-9
+        # 2-opt is within a small margin of the best order for so few rows
+        assert planned <= 1.1 * best_time(times)
+
+
+def test_plan_order_of_one_row():
+    assert plan_order(np.zeros((1, 1))) == [0]
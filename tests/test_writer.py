@@ -0,0 +1,159 @@
+import asyncio
+import struct
+
+import numpy as np
+from astropy.io import fits
+from astropy.time import Time
+
+from wavefinder.devices.MightexBufCmos import Frame, FrameBuffer
+from wavefinder.functions.analysis import AnalysisPool
+from wavefinder.functions.sequencer import SequenceState, SequenceSubstate, Sequencer
+from wavefinder.functions.writer import DataWriter
+from wavefinder.gui.config import Configuration
+
+
+class Monochromator:
+    """Stands in for DkMonochromator, which the writer only reads"""
+
+    current_wavelength = 500.0
+    current_slit1 = 100.0
+    current_slit2 = 200.0
+
+
+def frame_data(seed: int = 0) -> bytearray:
+    """12 bit frame data, as read from the camera"""
+    rows, cols = 16, 12
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 4096, (cols, rows), dtype=np.uint16)
+    pairs = np.stack([pixels >> 4, pixels & 0xF], axis=-1).astype(np.uint8)
+    properties = struct.pack("<14HI", rows, cols, *[0] * 12, 1000)
+    return bytearray(pairs.tobytes() + properties + bytes(512 - len(properties)))
+
+
+def make_config(seed: int = 0) -> Configuration:
+    """Default configuration with a 12 bit camera frame"""
+    config = Configuration("")
+    config.camera_frame = Frame(frame_data(seed), Time.now())
+    return config
+
+
+async def save(writer: DataWriter, filename: str, config: Configuration):
+    """Submit the config's frame to be written"""
+    await writer.submit(filename, writer.capture(config))
+
+
+def test_flush_waits_for_every_file(tmp_path):
+    async def run():
+        writer = DataWriter(None, {}, Monochromator(), max_queue=2)  # type: ignore
+        configs = [make_config(i) for i in range(5)]
+        for i, config in enumerate(configs):
+            await save(writer, str(tmp_path / f"{i}.fits"), config)
+        await writer.flush()
+        writer.close()
+        return configs
+
+    configs = asyncio.run(run())
+    for i, config in enumerate(configs):
+        with fits.open(tmp_path / f"{i}.fits") as hdul:
+            assert np.array_equal(hdul[0].data, config.camera_frame.img_array)
+            assert hdul[0].header["wavelen"] == 500.0
+
+
+def test_single_and_multi_extension_files_store_the_same_pixels(tmp_path):
+    async def run():
+        writer = DataWriter(None, {}, Monochromator())  # type: ignore
+        config = make_config()
+        await save(writer, str(tmp_path / "single.fits"), config)
+        multi = str(tmp_path / "multi.fits")
+        await writer.submit(multi, writer.capture(config), extname="focus")
+        await writer.finish_file(multi)
+        await writer.flush()
+        writer.close()
+        return config
+
+    config = asyncio.run(run())
+    with fits.open(tmp_path / "single.fits") as single:
+        with fits.open(tmp_path / "multi.fits") as multi:
+            for hdu in [single[0], multi["focus"]]:
+                # 12 bit pixels as int16, with no scaling
+                assert hdu.header["bitpix"] == 16
+                assert "bzero" not in hdu.header
+                assert hdu.data.dtype == np.dtype(">i2")
+                assert np.array_equal(hdu.data, config.camera_frame.img_array)
+
+
+def test_close_writes_files_still_queued(tmp_path):
+    async def run():
+        writer = DataWriter(None, {}, Monochromator(), max_queue=4)  # type: ignore
+        for i in range(3):
+            await save(writer, str(tmp_path / f"{i}.fits"), make_config(i))
+        # the writer task hasn't had a chance to run
+        writer.close()
+
+    asyncio.run(run())
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.fits", "1.fits", "2.fits"]
+
+
+def test_failed_write_is_counted(tmp_path):
+    async def run():
+        writer = DataWriter(None, {}, Monochromator())  # type: ignore
+        await save(writer, str(tmp_path / "missing" / "0.fits"), make_config())
+        await save(writer, str(tmp_path / "1.fits"), make_config())
+        await writer.flush()
+        writer.close()
+        return writer
+
+    writer = asyncio.run(run())
+    # the failure doesn't stop later files
+    assert writer.n_failed == 1
+    assert "0.fits" in writer.last_error
+    assert (tmp_path / "1.fits").exists()
+
+
+def test_sequence_aborts_when_a_file_fails(tmp_path):
+    async def run():
+        config = make_config()
+        config.focus_model_file = ""
+        config.sequencer_timing_log = ""
+        writer = DataWriter(None, {}, Monochromator())  # type: ignore
+        pool = AnalysisPool()
+        sequencer = Sequencer(
+            config, None, {}, Monochromator(), writer, pool  # type: ignore
+        )
+        sequencer.sequence_state = SequenceState.RUN
+        assert await sequencer.sequence_housekeeping(SequenceSubstate.CAPTURE_F)
+        await save(writer, str(tmp_path / "missing" / "0.fits"), config)
+        await writer.flush()
+        continued = await sequencer.sequence_housekeeping(SequenceSubstate.CAPTURE_F)
+        writer.close()
+        pool.close()
+        return sequencer, continued
+
+    sequencer, continued = asyncio.run(run())
+    assert not continued
+    assert sequencer.sequence_state == SequenceState.ABORT
+    assert "1 files not written" in sequencer.sequence_error
+    assert "0.fits" in sequencer.sequence_error
+
+
+def test_copied_capture_is_kept_when_the_frame_buffer_wraps(tmp_path):
+    async def run():
+        writer = DataWriter(None, {}, Monochromator())  # type: ignore
+        buffer = FrameBuffer(capacity=1)
+        data = frame_data(0)
+        buffer.allocate(len(data), (16, 12), 12)
+        config = make_config()
+        config.camera_frame = buffer.push(data, Time.now())
+        expected = config.camera_frame.img_array.copy()
+        record = writer.capture(config, copy=True)
+        # the next frame is taken before the first is written
+        buffer.push(frame_data(1), Time.now())
+        assert not buffer.holds(config.camera_frame)
+        await writer.submit(str(tmp_path / "0.fits"), record)
+        await writer.flush()
+        writer.close()
+        return expected
+
+    expected = asyncio.run(run())
+    with fits.open(tmp_path / "0.fits") as hdul:
+        assert np.array_equal(hdul[0].data, expected)
@@ -0,0 +1,91 @@
+"""Benchmark FITS write throughput and compression ratio of DataWriter
+for each compression setting, on simulated 12-bit spot frames.
+
+Run from the repository root, after installing wavefinder:
+    py tools/benchmark_compression.py
+"""
+
+import os
+import tempfile
+import time
+
+import numpy as np
+from astropy.io import fits
+
+from wavefinder.devices.SimulatedCamera import PsfModel
+from wavefinder.functions.writer import CaptureRecord, DataWriter
+
+SHAPE = (960, 1280)
+N_FRAMES = 20
+
+
+def make_frames(n: int) -> list[np.ndarray]:
+    """12-bit spot frames at a range of focus positions, in and out of focus"""
+    psf = PsfModel({}, None, seed=0)
+    x, y = psf.spot
+    return [
+        psf.render(SHAPE, (x, y, z, psf.wavelength), 12)
+        for z in np.linspace(psf.focus_z - 1, psf.focus_z + 1, n)
+    ]
+
+
+def make_record(image: np.ndarray) -> CaptureRecord:
+    """Capture record of an image, with typical settings and telemetry"""
+    return CaptureRecord(
+        frame=None,
+        image=image,
+        detector="simulated",
+        pixel_size=(3.75, 3.75),
+        version="benchmark",
+        obstype="Test",
+        target="spot",
+        wavelength=500.0,
+        slit1=100.0,
+        slit2=100.0,
+        sequence_number=1,
+        sequence_order=1,
+        focus_position=np.nan,
+        z_position=np.nan,
+        axes=(("detxpos", 0.0, "mm", "detector x"),),
+        threshold=15.0,
+        roi_size=None,
+        fwhm_method="variance",
+    )
+
+
+if __name__ == "__main__":
+    frames = make_frames(N_FRAMES)
+    raw_bytes = frames[0].nbytes
+    # statistics are usually cached, so leave them out of the write time
+    stats = ((SHAPE[1] / 2, SHAPE[0] / 2), 10.0, 4095, 0)
+    settings = [("none", (1280, 16))] + [
+        (c, t)
+        for c in ["rice", "gzip"]
+        for t in [(1280, 1), (1280, 16), (1280, 960), (64, 64)]
+    ]
+    print(
+        f"{'compression':>11} {'tile':>10} {'write [ms]':>11} {'[MB/s]':>7}"
+        f" {'ratio':>6} {'read [ms]':>10}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression, tile in settings:
+            writer = DataWriter(
+                None, {}, None, compression=compression, tile_size=tile  # type: ignore
+            )
+            filenames = [os.path.join(tmp, f"frame_{i}.fits") for i in range(N_FRAMES)]
+            start = time.perf_counter()
+            for filename, image in zip(filenames, frames):
+                writer.write_record(filename, make_record(image), stats)
+            t_write = (time.perf_counter() - start) / N_FRAMES
+            size = np.mean([os.path.getsize(f) for f in filenames])
+            start = time.perf_counter()
+            for filename, image in zip(filenames, frames):
+                with fits.open(filename) as hdul:
+                    assert np.array_equal(hdul[-1].data, image)
+            t_read = (time.perf_counter() - start) / N_FRAMES
+            writer.close()
+            print(
+                f"{compression:>11} {f'{tile[0]}x{tile[1]}':>10} {t_write * 1000:>11.1f}"
+                f" {raw_bytes / t_write / 1e6:>7.1f} {raw_bytes / size:>6.2f}"
+                f" {t_read * 1000:>10.1f}"
+            )
@@ -0,0 +1,75 @@
+"""Benchmark the radius search used by the encircled energy FWHM methods
+against growing the square one pixel at a time, for spots of increasing size.
+
+Run from the repository root, after installing wavefinder:
+    py tools/benchmark_fwhm.py
+"""
+
+import time
+
+import numpy as np
+
+from wavefinder.functions.image import (
+    find_centroid,
+    find_enclosing_radius,
+    threshold_copy,
+)
+
+
+def grow_radius(img_array: np.ndarray, center_pixel: tuple[int, int], target: float):
+    """Reference: grow a square one pixel at a time until its sum reaches target"""
+    radius = 0
+    subarray_e = 0
+    while (
+        center_pixel[0] - radius >= 0
+        and center_pixel[1] - radius >= 0
+        and center_pixel[0] + radius + 1 < img_array.shape[0]
+        and center_pixel[1] + radius + 1 < img_array.shape[1]
+    ):
+        subarray = img_array[
+            center_pixel[0] - radius : center_pixel[0] + radius + 1,
+            center_pixel[1] - radius : center_pixel[1] + radius + 1,
+        ]
+        subarray_e = np.sum(subarray)
+        if subarray_e >= target:
+            break
+        radius += 1
+    return radius, subarray_e
+
+
+def make_spot(sigma: float, shape: tuple[int, int] = (960, 1280)) -> np.ndarray:
+    """12-bit gaussian spot with background noise, centered in the frame"""
+    rng = np.random.default_rng(0)
+    yy, xx = np.mgrid[: shape[0], : shape[1]]
+    spot = 4095 * np.exp(
+        -((xx - shape[1] / 2) ** 2 + (yy - shape[0] / 2) ** 2) / (2 * sigma**2)
+    )
+    return np.clip(spot + rng.normal(100, 20, shape), 0, 4095).astype(np.uint16)
+
+
+def time_it(f, repeat: int = 5) -> float:
+    """Best time of repeated calls, in milliseconds"""
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == "__main__":
+    print(f"{'sigma':>6} {'radius':>7} {'loop [ms]':>10} {'search [ms]':>12} {'speedup':>8}")
+    for sigma in [1, 3, 10, 30, 60, 120, 200]:
+        img = threshold_copy(make_spot(sigma), 12, 5.0)
+        centroid = find_centroid(img)
+        center_pixel = (int(centroid[1] // 1), int(centroid[0] // 1))
+        target = np.sum(img) / 2
+
+        result = find_enclosing_radius(img, center_pixel, target)
+        assert result == grow_radius(img, center_pixel, target)
+        radius = result[0]
+        t_loop = time_it(lambda: grow_radius(img, center_pixel, target))
+        t_search = time_it(lambda: find_enclosing_radius(img, center_pixel, target))
+        print(
+            f"{sigma:>6} {radius:>7} {t_loop:>10.3f} {t_search:>12.3f} {t_loop / t_search:>7.1f}x"
+        )
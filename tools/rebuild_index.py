@@ -0,0 +1,45 @@
+"""Add existing FITS files to the observation index, or query it.
+
+Run from the repository root, after installing wavefinder:
+    py tools/rebuild_index.py --index D:/wavefinder/index.sqlite images/
+    py tools/rebuild_index.py --index D:/wavefinder/index.sqlite --wavelength 532
+"""
+
+import argparse
+
+from wavefinder.functions.index import ObservationIndex
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "directories", nargs="*", help="directories of FITS files to add to the index"
+    )
+    parser.add_argument(
+        "--index",
+        required=True,
+        help="index database, as in config.toml [image] index",
+    )
+    parser.add_argument("--wavelength", type=float, help="find by wavelength, in nm")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="in nm")
+    parser.add_argument("--order", type=int, help="find by diffraction order")
+    parser.add_argument("--date", help="find by UTC date, e.g. 2024-01-31")
+    parser.add_argument("--letter", help="find by f (in-focus), i, or e")
+    args = parser.parse_args()
+
+    index = ObservationIndex(args.index)
+    for d in args.directories:
+        n_files, n_added = index.rebuild(d)
+        print(f"{d}: read {n_files} files, added {n_added} observations")
+    if not args.directories or any(
+        a is not None for a in [args.wavelength, args.order, args.date, args.letter]
+    ):
+        for row in index.query(
+            args.wavelength, args.order, args.date, args.letter, args.tolerance
+        ):
+            print(
+                f"{row['date_obs']} {row['obs_id']} {row['wavelength']:.2f}nm"
+                f" order {row['diffraction_order']} {row['letter'] or '-'}"
+                f" fwhm {row['fwhm']} {row['filename']}"
+                + (f"[{row['extname']},{row['extver']}]" if row["extname"] else "")
+            )
+    index.close()